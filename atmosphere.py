@@ -0,0 +1,197 @@
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from math import exp
+from meteo_a import MeteoA
+import numpy as np
+
+AIR_MOLAR_MASS = 0.02896968 # kg/mol
+GAS_CONSTANT = 8.314462618 # J / (mol * K)
+GRAVITY = 9.80665 # m / s^2
+COMPILED_CACHE_SIZE = 64
+
+# Compiled columns of Meteo A messages, keyed by their content hash. Profiles are created from several threads, e.g.
+# in the service
+_compiled_cache = OrderedDict()
+_compiled_lock = threading.Lock()
+
+def compile_columns(meteo_a: MeteoA):
+    """
+    Returns:
+    dict: The measurements as sorted columns with the slopes of each segment, as lists and as numpy arrays
+
+    Raises:
+    ValueError: If there are less than two measurements or two at the same height
+    """
+    measurements = meteo_a.measurements
+    heights = [m.height for m in measurements]
+    if len(heights) < 2:
+        raise ValueError("A Meteo A needs measurements at two heights at least")
+    for lower, upper in zip(heights, heights[1:]):
+        if upper <= lower:
+            raise ValueError("The heights of a Meteo A must be distinct and sorted, found {} after {}".format(upper, lower))
+    temperatures = [m.temperature for m in measurements]
+    wind_directions = [m.wind_direction for m in measurements]
+    wind_velocities = [m.wind_velocity for m in measurements]
+
+    # Slopes of each segment between two measurements, the outermost segments are used for extrapolation
+    def slopes(values):
+        return [(values[i + 1] - values[i]) / (heights[i + 1] - heights[i]) for i in range(len(values) - 1)]
+
+    columns = {
+        "heights": heights,
+        "temperatures": temperatures,
+        "wind_directions": wind_directions,
+        "wind_velocities": wind_velocities,
+        "temperature_slopes": slopes(temperatures),
+        "wind_direction_slopes": slopes(wind_directions),
+        "wind_velocity_slopes": slopes(wind_velocities),
+    }
+    columns.update({
+        "height_array": np.array(heights, dtype=float),
+        "temperature_array": np.array(temperatures, dtype=float),
+        "wind_direction_array": np.array(wind_directions, dtype=float),
+        "wind_velocity_array": np.array(wind_velocities, dtype=float),
+        "temperature_slope_array": np.array(columns["temperature_slopes"], dtype=float),
+        "wind_direction_slope_array": np.array(columns["wind_direction_slopes"], dtype=float),
+        "wind_velocity_slope_array": np.array(columns["wind_velocity_slopes"], dtype=float),
+    })
+    return columns
+
+class AtmosphericConditions:
+
+    def __init__(self, density, pressure, temperature, speed_of_sound, wind_direction, wind_velocity):
+        self.density = density
+        self.pressure = pressure
+        self.temperature = temperature
+        self.speed_of_sound = speed_of_sound
+        self.wind_direction = wind_direction
+        self.wind_velocity = wind_velocity
+
+class AtmosphereProfile:
+    """
+    Atmosphere compiled once from the ground data and an optional Meteo A. The measurements are kept as sorted
+    columns with precomputed slopes, so that a lookup is a binary search (or a hit on the segment of the previous
+    lookup) followed by a few multiplications.
+    """
+
+    def __init__(self, temp0: float, pressure0: float, height0: float, meteo_a: MeteoA = None):
+        self.temp0 = temp0
+        self.pressure0 = pressure0
+        self.height0 = height0
+        self.pressure_exponent = GRAVITY * AIR_MOLAR_MASS / GAS_CONSTANT
+        self.heights = None
+
+        if meteo_a is not None and meteo_a.measurements is not None:
+            self.compile_meteo_a(meteo_a)
+
+    def compile_meteo_a(self, meteo_a: MeteoA):
+        """
+        Takes over the columns of the Meteo A. They only depend on its content, so they are compiled once per content
+        hash and shared between profiles.
+        """
+        key = getattr(meteo_a, "content_hash", None)
+        with _compiled_lock:
+            columns = _compiled_cache.get(key) if key is not None else None
+            if columns is not None:
+                _compiled_cache.move_to_end(key)
+        if columns is None:
+            columns = compile_columns(meteo_a)
+            if key is not None:
+                with _compiled_lock:
+                    _compiled_cache[key] = columns
+                    if len(_compiled_cache) > COMPILED_CACHE_SIZE:
+                        _compiled_cache.popitem(last=False)
+
+        self.__dict__.update(columns)
+        self.last_segment = 0
+
+    def is_meteo_a_given(self):
+        return self.heights is not None
+
+    def find_segment(self, height: float):
+        """
+        Finds the index of the lower measurement of the segment containing the height. Heights outside of the
+        measured range map to the outermost segments.
+        """
+        segment = self.last_segment
+        if self.heights[segment] <= height < self.heights[segment + 1]:
+            return segment
+
+        segment = min(max(bisect_right(self.heights, height) - 1, 0), len(self.heights) - 2)
+        self.last_segment = segment
+        return segment
+
+    def interpolate_meteo_a(self, height: float):
+        """
+        Interpolates the Meteo A linearly at the given height.
+
+        Returns:
+        float: The temperature in °C
+        float: The wind direction in hundreds of Azimute, as given in the Meteo A
+        float: The wind velocity in m/s
+        """
+        segment = self.find_segment(height)
+        offset = height - self.heights[segment]
+        return (
+            self.temperatures[segment] + self.temperature_slopes[segment] * offset,
+            self.wind_directions[segment] + self.wind_direction_slopes[segment] * offset,
+            self.wind_velocities[segment] + self.wind_velocity_slopes[segment] * offset
+        )
+
+    def at(self, height: float):
+        """
+        Derives all atmospheric quantities at a given height with a single lookup.
+
+        Parameters:
+        height (float): The height in m
+
+        Returns:
+        AtmosphericConditions: Density in kg/m^3, pressure in hPa, temperature in K, speed of sound in m/s and
+                               the wind direction in Azimute and velocity in m/s
+        """
+        height_difference = height - self.height0
+
+        if self.heights is not None:
+            temperature_celsius, wind_direction, wind_velocity = self.interpolate_meteo_a(height)
+            temperature = temperature_celsius + 273.15
+            wind_direction *= 100
+        else:
+            temperature_celsius = self.temp0 - 0.0065 * height_difference
+            temperature = 216.65 if height > 11000 else temperature_celsius + 273.15
+            wind_direction, wind_velocity = 0, 0
+
+        pressure = self.pressure0 * exp(- self.pressure_exponent * height_difference / (temperature_celsius + 273.15))
+        density = (100 * pressure) / (287.05 * temperature)
+
+        return AtmosphericConditions(density, pressure, temperature, 331 + 0.6 * (temperature - 273.15), wind_direction, wind_velocity)
+
+    def at_batch(self, heights: np.ndarray):
+        """
+        Vectorized variant of at for an array of heights.
+
+        Parameters:
+        heights (np.ndarray): The heights in m
+
+        Returns:
+        AtmosphericConditions: Arrays of the atmospheric quantities, one entry per height
+        """
+        height_difference = heights - self.height0
+
+        if self.heights is not None:
+            segment = np.clip(np.searchsorted(self.height_array, heights, side="right") - 1, 0, len(self.heights) - 2)
+            offset = heights - self.height_array[segment]
+            temperature_celsius = self.temperature_array[segment] + self.temperature_slope_array[segment] * offset
+            temperature = temperature_celsius + 273.15
+            wind_direction = (self.wind_direction_array[segment] + self.wind_direction_slope_array[segment] * offset) * 100
+            wind_velocity = self.wind_velocity_array[segment] + self.wind_velocity_slope_array[segment] * offset
+        else:
+            temperature_celsius = self.temp0 - 0.0065 * height_difference
+            temperature = np.where(heights > 11000, 216.65, temperature_celsius + 273.15)
+            wind_direction = np.zeros_like(heights, dtype=float)
+            wind_velocity = np.zeros_like(heights, dtype=float)
+
+        pressure = self.pressure0 * np.exp(- self.pressure_exponent * height_difference / (temperature_celsius + 273.15))
+        density = (100 * pressure) / (287.05 * temperature)
+
+        return AtmosphericConditions(density, pressure, temperature, 331 + 0.6 * (temperature - 273.15), wind_direction, wind_velocity)
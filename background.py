@@ -0,0 +1,125 @@
+import queue
+import threading
+from contextlib import nullcontext
+from simulator import Simulator
+from trajectory import Trajectory
+import numpy as np
+
+class CalculationJob:
+    """
+    A single shot to calculate in the background.
+    """
+
+    def __init__(self, simulator: Simulator, v0: float, phi0: float, delta_t: float, label: str = "", instrumentation=None):
+        """
+        Parameters:
+        simulator (Simulator): The simulator of the shot
+        v0, phi0, delta_t (float): See Simulator.calculate
+        label (str): Name of the shot, e.g. for the legend
+        instrumentation (Instrumentation): Attached to the simulator while calculating if given
+        """
+        self.simulator = simulator
+        self.v0 = v0
+        self.phi0 = phi0
+        self.delta_t = delta_t
+        self.label = label
+        self.instrumentation = instrumentation
+        self.generation = 0
+        self.trajectory = None # Set once the job is done
+
+class CalculationWorker:
+    """
+    Calculates jobs one after the other in a background thread. Progress is reported through a queue of events which
+    the GUI drains from its main loop, e.g. with after(), so no Tk call is made from the worker thread.
+
+    Events are tuples starting with the kind and the job:
+    ("progress", job, points, t)  New points (shape (n, 3), columns x, y, z) since the previous event and the current time
+    ("done", job)                 The job finished, job.trajectory holds the full trajectory, see Simulator.iter_dense
+    ("cancelled", job)            The job was cancelled before it finished
+    ("error", job, message)       The calculation failed
+    """
+
+    def __init__(self, trajectory_cache=None, report_every: int = 25):
+        """
+        Parameters:
+        trajectory_cache (TrajectoryCache): Cache of finished trajectories, cached jobs are done immediately
+        report_every (int): Number of states between two progress events
+        """
+        self.trajectory_cache = trajectory_cache
+        self.report_every = report_every
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.generation = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, job: CalculationJob):
+        job.generation = self.generation
+        self.jobs.put(job)
+
+    def cancel(self):
+        """
+        Cancels the running job and all queued ones.
+        """
+        self.generation += 1
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            self.events.put(("cancelled", job))
+
+    def poll(self):
+        """
+        Returns:
+        list: All events reported since the previous call, never blocks
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                self.calculate(job)
+            except Exception as error:
+                self.events.put(("error", job, str(error)))
+
+    def calculate(self, job: CalculationJob):
+        key = None
+        if self.trajectory_cache is not None:
+            key = self.trajectory_cache.key(job.simulator, job.v0, job.phi0, job.delta_t)
+            if key is not None:
+                # The dense trajectory differs from the one of Simulator.calculate, which other users of the cache expect
+                key += ("dense",)
+            cached = self.trajectory_cache.get(key) if key is not None else None
+            if cached is not None:
+                job.trajectory = cached
+                self.events.put(("progress", job, cached.points.copy(), cached.time_of_flight))
+                self.events.put(("done", job))
+                return
+
+        trajectory = Trajectory()
+        reported = 0
+        attached = job.instrumentation.attach(job.simulator) if job.instrumentation is not None else nullcontext()
+        with attached:
+            # Dense output, the long steps of the rk45 integrator would otherwise be drawn as a polyline
+            for t, point, velocity in job.simulator.iter_dense(job.v0, job.phi0, job.delta_t):
+                trajectory.append(t, point, velocity)
+                if trajectory.length - reported >= self.report_every:
+                    if job.generation != self.generation:
+                        self.events.put(("cancelled", job))
+                        return
+                    self.events.put(("progress", job, trajectory.points[reported:].copy(), t))
+                    reported = trajectory.length
+
+        trajectory.trim()
+        self.events.put(("progress", job, np.array(trajectory.points[reported:]), trajectory.time_of_flight))
+        job.trajectory = trajectory
+        if key is not None:
+            self.trajectory_cache.put(key, trajectory)
+        self.events.put(("done", job))
@@ -0,0 +1,330 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from math import sin, cos, pi, sqrt
+from environment import Environment
+from geometry import Vector, Point, Velocity, Acceleration
+from meteo_a import MeteoA
+from drag import DEFAULT_PROJECTILE
+from projectile import Projectile
+from simulator import Simulator
+import numpy as np
+
+METEO_A_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docs", "meteo_a.csv")
+SUITE_DELTA_TS = [0.2, 0.1, 0.05, 0.01]
+SUITE_ELEVATIONS = np.arange(5, 86, 5)
+# Programs run in a fresh interpreter by bench_startup. Each prints the seconds since its start and the loaded
+# plotting modules as JSON; the first window needs a display and is skipped without one
+STARTUP_PROGRAMS = {
+    "interpreter": "",
+    "core": "import geometry, meteo_a, environment, projectile, simulator",
+    "gui_import": "import gui",
+    "first_window": "import gui\napp = gui.App()\napp.update()",
+}
+STARTUP_REPORT = """
+import json, sys, time
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "plotting": sorted(name for name in ("matplotlib", "PIL") if name in sys.modules)}))
+"""
+# Timings of the suite are compared by their median, relative changes below this are considered noise
+REGRESSION_THRESHOLD = 0.1
+
+# Step sizes (euler, rk4) or tolerances (rk45) which are scanned, from coarse to fine
+INTEGRATOR_SETTINGS = {
+    "euler": [0.2, 0.1, 0.05, 0.02, 0.01, 0.005, 0.002, 0.001],
+    "rk4": [2, 1, 0.5, 0.2, 0.1, 0.05],
+    "rk45": [1e-1, 1e-2, 1e-3, 1e-4, 1e-5, 1e-6, 1e-7, 1e-8],
+}
+
+def create_simulator(integrator="euler", tolerance=1e-3, meteo_a=None, direction=0):
+    environment = Environment(21.5, 944, 691, meteo_a)
+    projectile = Projectile.from_type(DEFAULT_PROJECTILE, direction)
+    return Simulator(environment, projectile, integrator, tolerance)
+
+def run_integrator(integrator, setting, v0, phi0):
+    """
+    Integrates one trajectory.
+
+    Returns:
+    float: Impact range in m
+    float: Time of flight in s
+    int: Number of steps
+    float: Duration of the calculation in s
+    """
+    if integrator == "rk45":
+        simulator = create_simulator(integrator, tolerance=setting)
+        delta_t = 0.1
+    else:
+        simulator = create_simulator(integrator)
+        delta_t = setting
+
+    start = time.perf_counter()
+    steps = -1 # The muzzle state is not a step
+    for t, point, _ in simulator.iter_steps(v0, phi0, delta_t):
+        steps += 1
+    duration = time.perf_counter() - start
+
+    return point.x, t, steps, duration
+
+def bench_integrators(v0=816, phi0=45, target_errors=(10, 1, 0.1)):
+    """
+    Compares the number of steps each integrator needs to reach a given impact range error. The reference is
+    a fine rk4 solution.
+    """
+    reference_range, reference_time, _, _ = run_integrator("rk4", 0.01, v0, phi0)
+    print("Reference: range {:.3f} m, time of flight {:.4f} s".format(reference_range, reference_time))
+    print("{:<6} {:>10} {:>7} {:>14} {:>12} {:>10}".format("method", "setting", "steps", "range error/m", "tof error/s", "time/ms"))
+
+    results = {}
+    for integrator, settings in INTEGRATOR_SETTINGS.items():
+        results[integrator] = []
+        for setting in settings:
+            impact_range, time_of_flight, steps, duration = run_integrator(integrator, setting, v0, phi0)
+            range_error = abs(impact_range - reference_range)
+            results[integrator].append((steps, range_error))
+            print("{:<6} {:>10g} {:>7} {:>14.4f} {:>12.5f} {:>10.2f}".format(
+                integrator, setting, steps, range_error, abs(time_of_flight - reference_time), duration * 1000))
+
+    print()
+    print("Fewest steps for a range error below the target:")
+    print("{:<6}".format("method") + "".join("{:>12}".format(str(target) + " m") for target in target_errors))
+    for integrator, runs in results.items():
+        cells = []
+        for target in target_errors:
+            steps = [steps for steps, error in runs if error <= target]
+            cells.append("{:>12}".format(min(steps) if steps else "-"))
+        print("{:<6}".format(integrator) + "".join(cells))
+
+def legacy_euler_step(simulator, point, velocity, delta_t):
+    """
+    The Euler step written with the out-of-place Vector operators, as the simulator did before the geometry kernel
+    offered in-place and fused operations. Serves as the baseline of bench_geometry.
+    """
+    projectile = simulator.projectile
+    conditions = simulator.environment.get_conditions(point)
+
+    angle_relative = (conditions.wind_direction - projectile.direction) * (2 * pi / 6400)
+    wind_relative = Velocity(conditions.wind_velocity * cos(angle_relative), 0, conditions.wind_velocity * sin(angle_relative))
+    velocity_absolute = velocity - wind_relative
+    speed = sqrt(velocity_absolute.x ** 2 + velocity_absolute.y ** 2)
+
+    lateral_drag_coefficient = projectile.derive_lateral_cw(speed, conditions.speed_of_sound)
+    lateral_acceleration_magnitude = projectile.derive_drag_force_magnitude(conditions.density, speed, lateral_drag_coefficient, projectile.lateral_cross_sectional_area) / projectile.mass
+    lateral_drag_direction = velocity * -1 / speed
+    axial_acceleration_magnitude = projectile.derive_drag_force_magnitude(conditions.density, velocity_absolute.z, 1.2, projectile.axial_cross_sectional_area) / projectile.mass
+    axial_drag_direction = Acceleration(0, 0, 1) if velocity_absolute.z < 0 else Acceleration(0, 0, -1)
+    acceleration = (lateral_drag_direction * lateral_acceleration_magnitude) + (axial_drag_direction * axial_acceleration_magnitude)
+
+    velocity = velocity + acceleration * delta_t
+    velocity = velocity - simulator.g * delta_t
+    point = point + velocity * delta_t
+    return point, velocity
+
+def bench_geometry(steps=20000, delta_t=0.01):
+    """
+    Counts the Vector allocations and measures the time per Euler step, once with the out-of-place operators and
+    once with the step of the simulator.
+    """
+    simulator = create_simulator(direction=1200)
+    initial_point = Point(0, 691, 0)
+    initial_velocity = Velocity(577, 577, 0)
+
+    allocations = [0]
+    vector_init = Vector.__init__
+    def counting_init(self, x, y, z):
+        allocations[0] += 1
+        vector_init(self, x, y, z)
+
+    print("{:<12} {:>16} {:>16}".format("step", "vectors/step", "time/step us"))
+    for name, step in [("operators", lambda p, v: legacy_euler_step(simulator, p, v, delta_t)),
+                       ("in-place", lambda p, v: simulator.iterate(p, v, delta_t))]:
+        Vector.__init__ = counting_init
+        try:
+            allocations[0] = 0
+            point, velocity = initial_point, initial_velocity
+            for _ in range(1000):
+                point, velocity = step(point, velocity)
+            vectors_per_step = allocations[0] / 1000
+        finally:
+            Vector.__init__ = vector_init
+
+        point, velocity = initial_point, initial_velocity
+        start = time.perf_counter()
+        for _ in range(steps):
+            point, velocity = step(point, velocity)
+        duration = time.perf_counter() - start
+        print("{:<12} {:>16.1f} {:>16.2f}".format(name, vectors_per_step, duration / steps * 1e6))
+
+def read_meteo_data():
+    with open(METEO_A_PATH, "r", newline="") as file:
+        return [row for row in csv.reader(file)]
+
+def measure(function, repeat: int, number: int = 1):
+    """
+    Calls the function once to warm up, then number times per round and repeat rounds.
+
+    Returns:
+    dict: Median and minimum duration of a single call in s, and the last return value of the function
+    """
+    value = function()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            value = function()
+        durations.append((time.perf_counter() - start) / number)
+    return {"seconds": statistics.median(durations), "min_seconds": min(durations), "repeat": repeat, "number": number}, value
+
+def bench_suite(repeat: int = 5, v0: float = 816, phi0: float = 45):
+    """
+    Times the main operations of the simulator and records the impact range error of Simulator.calculate against a
+    fine rk4 reference, and of the batched firing table against the rk45 firing table.
+
+    Returns:
+    dict: Metadata of the run and one entry per benchmark
+    """
+    meteo_a = MeteoA(read_meteo_data())
+    results = {}
+
+    for meteo_name, meteo in [("standard", None), ("meteo", meteo_a)]:
+        reference = create_simulator("rk4", meteo_a=meteo, direction=1200).impact(v0, phi0, 0.01)
+        for delta_t in SUITE_DELTA_TS:
+            simulator = create_simulator(meteo_a=meteo, direction=1200)
+            timing, trajectory = measure(lambda: simulator.calculate(v0, phi0, delta_t), repeat)
+            timing.update({
+                "steps": len(trajectory) - 1,
+                "impact_range": float(trajectory.x[-1]),
+                "range_error": abs(float(trajectory.x[-1]) - reference.point.x),
+                "deflection_error": abs(float(trajectory.z[-1]) - reference.point.z),
+            })
+            results["calculate/{}/dt={:g}".format(meteo_name, delta_t)] = timing
+
+    environment = Environment(21.5, 944, 691, meteo_a)
+    heights = np.linspace(0, 12000, 1000).tolist()
+    def interpolate():
+        for height in heights:
+            environment.get_linear_interpolation_at(height)
+    timing, _ = measure(interpolate, repeat)
+    timing["seconds_per_lookup"] = timing["seconds"] / len(heights)
+    results["get_linear_interpolation_at"] = timing
+
+    data = read_meteo_data()
+    results["meteo_a_parse"], _ = measure(lambda: MeteoA(data), repeat, number=100)
+
+    simulator = create_simulator("rk45")
+    timing, impacts = measure(lambda: [simulator.impact(v0, phi0, 0.1) for phi0 in SUITE_ELEVATIONS], repeat)
+    timing["shots"] = len(SUITE_ELEVATIONS)
+    results["firing_table/rk45"] = timing
+
+    simulator = create_simulator()
+    timing, trajectories = measure(lambda: simulator.calculate_batch(v0, SUITE_ELEVATIONS, None, 0.1), repeat)
+    timing["shots"] = len(SUITE_ELEVATIONS)
+    timing["max_range_error"] = max(abs(float(trajectory.x[-1]) - impact.point.x) for trajectory, impact in zip(trajectories, impacts))
+    results["firing_table/batch"] = timing
+
+    return {
+        "metadata": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+def compare_results(baseline: dict, current: dict, threshold: float = REGRESSION_THRESHOLD):
+    """
+    Compares two runs of the suite. A benchmark regresses if its median time grows by more than the threshold, or if
+    one of its errors grows by more than the threshold and at least 1 cm.
+
+    Returns:
+    list: One row (name, baseline seconds, current seconds, relative change, regressions) per common benchmark
+    """
+    rows = []
+    for name in sorted(baseline["results"].keys() & current["results"].keys()):
+        before = baseline["results"][name]
+        after = current["results"][name]
+        change = after["seconds"] / before["seconds"] - 1
+        regressions = []
+        if change > threshold:
+            regressions.append("time")
+        for key in ("range_error", "deflection_error", "max_range_error"):
+            if key in before and key in after and after[key] > before[key] * (1 + threshold) + 0.01:
+                regressions.append(key)
+        rows.append((name, before["seconds"], after["seconds"], change, regressions))
+    return rows
+
+def bench_startup(repeat: int = 5):
+    """
+    Measures the cold start in fresh interpreters: the imports of the core modules and of the GUI, and the time until
+    the first window has been drawn. The seconds are measured from the start of each program and by the parent
+    process, which includes the start of the interpreter itself.
+    """
+    print("{:<14} {:>12} {:>12}  {}".format("program", "inside/ms", "process/ms", "plotting modules loaded"))
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name, program in STARTUP_PROGRAMS.items():
+        inside, outside, report = [], [], None
+        for _ in range(repeat):
+            code = "import time\nstart = time.perf_counter()\n" + program + "\n" + STARTUP_REPORT
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, "-c", code], cwd=directory, capture_output=True, text=True)
+            outside.append(time.perf_counter() - start)
+            if process.returncode != 0:
+                report = process.stderr.strip().splitlines()[-1]
+                break
+            report = json.loads(process.stdout.strip().splitlines()[-1])
+            inside.append(report["seconds"])
+
+        if not inside:
+            print("{:<14} {:>12} {:>12}  skipped: {}".format(name, "-", "-", report))
+            continue
+        print("{:<14} {:>12.1f} {:>12.1f}  {}".format(name, statistics.median(inside) * 1000, statistics.median(outside) * 1000,
+                                                      ", ".join(report["plotting"]) or "none"))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks for the trajectory simulator")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    subparsers.add_parser("integrators", help="Steps needed by each integrator for a given accuracy")
+    subparsers.add_parser("geometry", help="Vector allocations and time per Euler step")
+    startup_parser = subparsers.add_parser("startup", help="Cold start of the core modules, the GUI and its first window")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per program, the median is reported")
+    suite_parser = subparsers.add_parser("suite", help="Times the main operations and writes the results as JSON")
+    suite_parser.add_argument("-o", "--output", default="-", help="Result file, - to write to stdout (default)")
+    suite_parser.add_argument("--repeat", type=int, default=5, help="Rounds per benchmark, the median is reported")
+    compare_parser = subparsers.add_parser("compare", help="Compares two results of the suite, exits with 1 on regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    if args.benchmark == "integrators":
+        bench_integrators()
+    elif args.benchmark == "geometry":
+        bench_geometry()
+    elif args.benchmark == "startup":
+        bench_startup(args.repeat)
+    elif args.benchmark == "suite":
+        report = json.dumps(bench_suite(args.repeat), indent=2)
+        if args.output == "-":
+            print(report)
+        else:
+            with open(args.output, "w") as file:
+                file.write(report + "\n")
+    elif args.benchmark == "compare":
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        with open(args.current, "r") as file:
+            current = json.load(file)
+
+        rows = compare_results(baseline, current, args.threshold)
+        print("{:<32} {:>12} {:>12} {:>8}  {}".format("benchmark", "baseline/ms", "current/ms", "change", "regression"))
+        for name, before, after, change, regressions in rows:
+            print("{:<32} {:>12.3f} {:>12.3f} {:>+7.1%}  {}".format(name, before * 1000, after * 1000, change, ", ".join(regressions)))
+        sys.exit(1 if any(regressions for *_, regressions in rows) else 0)
@@ -0,0 +1,228 @@
+import threading
+from collections import OrderedDict
+from math import inf
+from environment import Environment
+from meteo_a import MeteoA
+from meteo_cache import changed_heights
+from result_cache import MODEL_VERSION
+from simulator import Simulator
+from trajectory import Trajectory
+
+class Checkpoint:
+    """
+    State of a trajectory after a step, together with what the steps up to it depended on.
+    """
+
+    __slots__ = ("index", "t", "point", "velocity", "delta_t", "min_height", "max_height", "max_wind")
+
+    def __init__(self, index: int, t: float, point, velocity, delta_t: float, min_height: float, max_height: float, max_wind: float):
+        self.index = index # Index of the state in the trajectory, 0 is the muzzle
+        self.t = t
+        self.point = point
+        self.velocity = velocity
+        self.delta_t = delta_t # Next step size, changes along the trajectory with the rk45 integrator
+        self.min_height = min_height # Lowest and highest height at which the atmosphere was evaluated so far
+        self.max_height = max_height
+        self.max_wind = max_wind # Strongest wind in m/s seen so far
+
+class Record:
+    """
+    The latest trajectory of a shot with its checkpoints and the inputs which may change between requests.
+    """
+
+    def __init__(self, direction: float, meteo_a: MeteoA, trajectory: Trajectory, checkpoints: list):
+        self.direction = direction
+        self.meteo_a = meteo_a
+        self.trajectory = trajectory
+        self.checkpoints = checkpoints
+
+class TrackingEnvironment:
+    """
+    View of an environment for a single calculation which records the range of heights at which the atmosphere was
+    evaluated and the strongest wind, everything else is delegated to the environment.
+    """
+
+    def __init__(self, environment: Environment, lookups: list):
+        """
+        Parameters:
+        environment (Environment): The environment
+        lookups (list): Lowest height, highest height and strongest wind so far, updated in place
+        """
+        self.environment = environment
+        self.lookups = lookups
+
+    def __getattr__(self, name):
+        return getattr(self.environment, name)
+
+    def get_conditions(self, point):
+        conditions = self.environment.get_conditions(point)
+        lookups = self.lookups
+        if point.y < lookups[0]:
+            lookups[0] = point.y
+        if point.y > lookups[1]:
+            lookups[1] = point.y
+        if abs(conditions.wind_velocity) > lookups[2]:
+            lookups[2] = abs(conditions.wind_velocity)
+        return conditions
+
+def affected_heights(previous: MeteoA, current: MeteoA):
+    """
+    Finds the heights at which the atmosphere differs between two Meteo A. A row influences the segments to its
+    neighbouring rows, the outermost segments also the extrapolation beyond the measured range.
+
+    Returns:
+    tuple: The lowest and highest affected height in m, None if the atmosphere is the same at all heights
+    """
+    def given(meteo_a):
+        return meteo_a is not None and meteo_a.measurements is not None
+
+    if given(previous) != given(current):
+        return -inf, inf
+    changed = changed_heights(previous, current)
+    if not changed:
+        return None
+
+    lowest, highest = inf, -inf
+    for meteo_a in (previous, current):
+        heights = sorted(measurement.height for measurement in meteo_a.measurements)
+        for height in changed:
+            if height not in heights:
+                continue
+            index = heights.index(height)
+            lowest = min(lowest, heights[index - 1] if index > 1 else -inf)
+            highest = max(highest, heights[index + 1] if index < len(heights) - 2 else inf)
+    return lowest, highest
+
+class CheckpointCache:
+    """
+    Re-simulates a shot incrementally after the direction of fire or rows of the Meteo A have changed. Every
+    trajectory keeps a checkpoint every few steps, recording the range of heights at which the atmosphere was
+    evaluated up to there and the strongest wind. A new request resumes from the last checkpoint which cannot be
+    affected by the change and integrates only the rest, the result is identical to a full run:
+
+    - A changed Meteo A row only alters the atmosphere between its neighbouring rows, a checkpoint is usable as long as
+      the trajectory up to it stayed out of these heights.
+    - The direction only enters through the wind, a checkpoint is usable after a change of the direction if there was
+      no wind up to it.
+
+    Any other change of the inputs starts a new trajectory. Only plain Environment objects are supported, other
+    environments are simulated in full.
+    """
+
+    def __init__(self, every: int = 16, max_entries: int = 64):
+        """
+        Parameters:
+        every (int): Number of steps between two checkpoints
+        max_entries (int): Number of shots kept, the least recently used ones are dropped
+        """
+        self.every = every
+        self.max_entries = max_entries
+        self.records = OrderedDict() # key -> Record
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.resumed = 0
+        self.uncacheable = 0
+        self.steps = 0
+        self.saved_steps = 0
+
+    @staticmethod
+    def key(simulator: Simulator, v0: float, phi0: float, delta_t: float):
+        """
+        Returns:
+        tuple: The inputs which must be equal to resume from a checkpoint, everything except the direction and the
+               content of the Meteo A
+        """
+        environment = simulator.environment
+        numbers = (v0, phi0, delta_t, simulator.tolerance, simulator.impact_height, environment.temp0, environment.pressure0,
+                   environment.height0)
+        return (MODEL_VERSION, simulator.integrator, simulator.projectile.fingerprint()) + tuple(float(number) + 0.0 for number in numbers)
+
+    def find_checkpoint(self, record: Record, simulator: Simulator):
+        """
+        Returns:
+        Checkpoint: The last checkpoint of the record which is not affected by the changed inputs, None if there is none
+        """
+        heights = affected_heights(record.meteo_a, simulator.environment.meteo_a)
+        direction_changed = record.direction != simulator.projectile.direction
+        for checkpoint in reversed(record.checkpoints):
+            if direction_changed and checkpoint.max_wind != 0:
+                continue
+            if heights is not None and not (checkpoint.max_height < heights[0] or checkpoint.min_height > heights[1]):
+                continue
+            return checkpoint
+        return None
+
+    def calculate(self, simulator: Simulator, v0: float, phi0: float, delta_t: float):
+        """
+        Returns the trajectory of simulator.calculate(v0, phi0, delta_t), resumed from a checkpoint of an earlier
+        request if possible. The trajectory is shared with later requests and read-only.
+        """
+        environment = simulator.environment
+        if type(environment) is not Environment:
+            with self.lock:
+                self.uncacheable += 1
+            return simulator.calculate(v0, phi0, delta_t)
+
+        key = self.key(simulator, v0, phi0, delta_t)
+        with self.lock:
+            record = self.records.get(key)
+        resumed = self.find_checkpoint(record, simulator) if record is not None else None
+
+        if resumed is not None:
+            prefix = record.trajectory.data[:, :resumed.index + 1]
+            trajectory = Trajectory(2 * prefix.shape[1])
+            trajectory.data[:, :prefix.shape[1]] = prefix
+            trajectory.length = prefix.shape[1]
+            checkpoints = [checkpoint for checkpoint in record.checkpoints if checkpoint.index <= resumed.index]
+            start = (resumed.t, resumed.point.copy(), resumed.velocity.copy(), resumed.delta_t)
+            lookups = [resumed.min_height, resumed.max_height, resumed.max_wind]
+            index = resumed.index
+        else:
+            trajectory = Trajectory()
+            checkpoints = []
+            start = None
+            lookups = [inf, -inf, 0.0]
+            index = 0
+
+        def checkpoint(t, point, velocity, next_delta_t):
+            nonlocal index
+            index += 1
+            if index % self.every == 0:
+                checkpoints.append(Checkpoint(index, t, point.copy(), velocity.copy(), next_delta_t, *lookups))
+
+        # The shared environment stays untouched, only this run sees the tracking view. A new simulator, a copy would
+        # keep methods patched on the instance (see Instrumentation.attach) which are bound to the original one
+        tracking = Simulator(TrackingEnvironment(environment, lookups), simulator.projectile, simulator.integrator, simulator.tolerance,
+                             simulator.impact_height)
+        for t, point, velocity in tracking.iter_steps(v0, phi0, delta_t, start=start, checkpoint=checkpoint):
+            trajectory.append(t, point, velocity)
+        trajectory.trim()
+        trajectory.data.flags.writeable = False
+
+        with self.lock:
+            self.requests += 1
+            self.steps += len(trajectory) - 1
+            if resumed is not None:
+                self.resumed += 1
+                self.saved_steps += resumed.index
+            self.records[key] = Record(simulator.projectile.direction, environment.meteo_a, trajectory, checkpoints)
+            self.records.move_to_end(key)
+            if len(self.records) > self.max_entries:
+                self.records.popitem(last=False)
+        return trajectory
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self.records),
+            "requests": self.requests,
+            "resumed": self.resumed,
+            "uncacheable": self.uncacheable,
+            "hit_rate": self.resumed / self.requests if self.requests else 0,
+            "steps": self.steps,
+            "saved_steps": self.saved_steps,
+            "saved_fraction": self.saved_steps / self.steps if self.steps else 0,
+        }
@@ -0,0 +1,236 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from drag import DEFAULT_PROJECTILE, load_registry
+from environment import Environment
+from meteo_cache import MeteoCache
+from parallel import submit_bounded
+from projectile import Projectile
+from result_cache import TrajectoryCache
+from simulator import Simulator, INTEGRATORS
+from trajectory import Impact
+
+REQUIRED_FIELDS = ("v0", "elevation", "temp0", "pressure0", "height0")
+RESULT_FIELDS = ("id", "v0", "elevation", "temp0", "pressure0", "height0", "direction", "projectile", "meteo",
+                 "range", "deflection", "time_of_flight", "apex_height", "angle_of_fall", "terminal_velocity", "steps", "error")
+
+# Meteo A files already parsed in this process
+_meteo_cache = MeteoCache()
+# Trajectory caches of this process, keyed by their directory
+_trajectory_caches = {}
+
+def read_json_lines(file):
+    """
+    Yields:
+    dict: The object of every non-empty line, or a row with an error message for lines which are not a JSON object
+    """
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield {"error": "Line {}: invalid JSON: {}".format(line_number, error)}
+            continue
+        if not isinstance(row, dict):
+            yield {"error": "Line {}: expected a JSON object".format(line_number)}
+            continue
+        yield row
+
+def read_csv_rows(file):
+    """
+    Yields:
+    dict: The cells of every row by the names of the header, or a row with an error message for rows with more
+          cells than the header
+    """
+    reader = csv.DictReader(file)
+    for row in reader:
+        if None in row:
+            yield {"error": "Line {}: {} more cells than the header".format(reader.line_num, len(row[None]))}
+            continue
+        yield row
+
+def read_missions(file, input_format: str, base_path: str):
+    """
+    Reads missions lazily from a .csv file with a header or from a .jsonl file with one object per line. Lines which
+    cannot be read become missions with an error, so the remaining missions are still processed.
+
+    Parameters:
+    file (file): The opened file
+    input_format (str): Either "csv" or "jsonl"
+    base_path (str): Directory against which relative meteo paths are resolved
+
+    Yields:
+    dict: The fields of each mission
+    """
+    if input_format == "csv":
+        rows = read_csv_rows(file)
+    else:
+        rows = read_json_lines(file)
+
+    for number, row in enumerate(rows, start=1):
+        mission = {key.strip(): value for key, value in row.items() if value not in (None, "")}
+        mission.setdefault("id", number)
+        if isinstance(mission.get("meteo"), str) and not os.path.isabs(mission["meteo"]):
+            mission["meteo"] = os.path.join(base_path, mission["meteo"])
+        yield mission
+
+def get_meteo_a(file_path: str):
+    return _meteo_cache.load_file(file_path)
+
+def get_trajectory_cache(directory: str):
+    if directory not in _trajectory_caches:
+        _trajectory_caches[directory] = TrajectoryCache(directory=directory)
+    return _trajectory_caches[directory]
+
+def run_mission(mission: dict, integrator: str, delta_t: float, cache_directory: str = None):
+    """
+    Simulates a single mission. Runs in a worker process.
+
+    Parameters:
+    mission (dict): The fields of the mission, see read_missions
+    integrator (str): Integrator of the simulator, see Simulator
+    delta_t (float): Number of seconds per iteration, the initial step for the rk45 integrator
+    cache_directory (str): Directory of stored trajectories, see TrajectoryCache. None to stream the steps without
+                           keeping the trajectory
+
+    Returns:
+    dict: The mission together with its results, or with an error message
+    """
+    result = dict(mission)
+    if "error" in mission:
+        return result
+    try:
+        missing = [field for field in REQUIRED_FIELDS if field not in mission]
+        if missing:
+            raise ValueError("Missing fields: " + ", ".join(missing))
+
+        v0, elevation, temp0, pressure0, height0 = (float(mission[field]) for field in REQUIRED_FIELDS)
+        direction = float(mission.get("direction", 0))
+
+        meteo_a = None
+        if "meteo" in mission:
+            if not isinstance(mission["meteo"], str):
+                raise TypeError("meteo must be the path to a Meteo A file")
+            meteo_a = get_meteo_a(mission["meteo"])
+            if getattr(meteo_a, "error", None):
+                raise ValueError("Invalid Meteo A: " + meteo_a.error)
+
+        environment = Environment(temp0, pressure0, height0, meteo_a)
+        projectile = Projectile.from_type(mission.get("projectile", DEFAULT_PROJECTILE), direction)
+        simulator = Simulator(environment, projectile, integrator)
+
+        if cache_directory is not None:
+            trajectory = get_trajectory_cache(cache_directory).calculate(simulator, v0, elevation, delta_t)
+            steps = len(trajectory) - 1
+            apex_height = float(trajectory.y.max())
+            impact = trajectory.impact
+        else:
+            # Stream the steps, only the apex and the last state are kept
+            steps = -1
+            apex_height = height0
+            for t, point, velocity in simulator.iter_steps(v0, elevation, delta_t):
+                steps += 1
+                apex_height = max(apex_height, point.y)
+            impact = Impact(t, point, velocity)
+        result.update({
+            "range": impact.point.x,
+            "deflection": impact.point.z,
+            "time_of_flight": impact.time_of_flight,
+            "apex_height": apex_height,
+            "angle_of_fall": impact.angle_of_fall,
+            "terminal_velocity": impact.terminal_velocity,
+            "steps": steps,
+        })
+    except (ValueError, TypeError, OSError) as error:
+        result["error"] = str(error)
+
+    return result
+
+class ResultWriter:
+
+    def __init__(self, file, output_format: str):
+        self.file = file
+        self.output_format = output_format
+        if output_format == "csv":
+            self.writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+            self.writer.writeheader()
+
+    def write(self, result: dict):
+        if self.output_format == "csv":
+            self.writer.writerow(result)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculates fire missions without the GUI. Missions are read from a .csv "
+                                                 "file with a header or a .jsonl file with the fields " + ", ".join(REQUIRED_FIELDS) +
+                                                 " and optionally id, direction, projectile (name of a registered projectile type) "
+                                                 "and meteo (path to a Meteo A .csv file).")
+    parser.add_argument("missions", help="Mission file, - to read from stdin")
+    parser.add_argument("-o", "--output", default="-", help="Result file, - to write to stdout (default)")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="Format of the missions, derived from the file extension by default (csv for stdin)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl", help="Format of the results")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="Number of worker processes, 1 to calculate in this process")
+    parser.add_argument("--integrator", choices=INTEGRATORS, default="rk45")
+    parser.add_argument("--delta-t", type=float, default=0.1, help="Seconds per step, the initial step for rk45")
+    parser.add_argument("--cache-dir", help="Directory in which calculated trajectories are stored and reused across runs")
+    parser.add_argument("--projectiles", help="A .json file with additional drag tables and projectile types, see drag.load_registry")
+    parser.add_argument("--progress-interval", type=float, default=1.0, help="Seconds between progress reports on stderr")
+    args = parser.parse_args(argv)
+    if args.projectiles:
+        load_registry(args.projectiles)
+
+    input_format = args.input_format or ("jsonl" if args.missions.endswith((".jsonl", ".json")) else "csv")
+    input_file = sys.stdin if args.missions == "-" else open(args.missions, "r", newline="")
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    base_path = os.getcwd() if args.missions == "-" else os.path.dirname(os.path.abspath(args.missions))
+
+    writer = ResultWriter(output_file, args.format)
+    tasks = ((mission, args.integrator, args.delta_t, args.cache_dir) for mission in read_missions(input_file, input_format, base_path))
+
+    start = time.perf_counter()
+    last_report = start
+    count = 0
+    errors = 0
+
+    def report(final=False):
+        elapsed = time.perf_counter() - start
+        print("{} {} missions ({} errors) in {:.1f} s, {:.1f} missions/s".format(
+            "Finished" if final else "Processed", count, errors, elapsed, count / elapsed if elapsed > 0 else 0), file=sys.stderr)
+
+    executor = None
+    try:
+        if args.workers == 1:
+            results = (run_mission(*task) for task in tasks)
+        else:
+            # Workers started with spawn do not inherit the registry
+            initializer, initargs = (load_registry, (args.projectiles,)) if args.projectiles else (None, ())
+            executor = ProcessPoolExecutor(max_workers=args.workers, initializer=initializer, initargs=initargs)
+            results = submit_bounded(executor, run_mission, tasks, 4 * args.workers)
+
+        for result in results:
+            writer.write(result)
+            count += 1
+            errors += "error" in result
+            if time.perf_counter() - last_report >= args.progress_interval:
+                last_report = time.perf_counter()
+                report()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    report(final=True)
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
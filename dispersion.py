@@ -0,0 +1,273 @@
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from math import sqrt, atan2, pi
+import os
+from drag import DEFAULT_PROJECTILE, get_projectile_type
+from environment import Environment
+from meteo_a import Measurement, MeteoA
+from parallel import submit_bounded
+from projectile import Projectile
+from simulator import Simulator
+import numpy as np
+
+# Scale factors of a standard deviation to the probable error (50% within) in one and two dimensions
+PROBABLE_ERROR_FACTOR = 0.6745
+ELLIPSE_FACTOR = 1.1774
+
+class Perturbations:
+    """
+    Standard deviations of the inputs of an ensemble, all perturbations are normally distributed and independent.
+    The meteo deviations are drawn separately for every row of the Meteo A.
+    """
+
+    def __init__(self, v0: float = 0, mass: float = 0, temp0: float = 0, pressure0: float = 0,
+                 meteo_temperature: float = 0, meteo_wind_direction: float = 0, meteo_wind_velocity: float = 0):
+        self.v0 = v0 # m/s
+        self.mass = mass # kg
+        self.temp0 = temp0 # °C
+        self.pressure0 = pressure0 # hPa
+        self.meteo_temperature = meteo_temperature # °C
+        self.meteo_wind_direction = meteo_wind_direction # hundreds of Azimute, as in the Meteo A
+        self.meteo_wind_velocity = meteo_wind_velocity # m/s
+
+class P2Quantile:
+    """
+    Streaming estimate of a quantile with the P² algorithm of Jain and Chlamtac, using five markers and constant memory.
+    """
+
+    def __init__(self, quantile: float):
+        self.quantile = quantile
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value: float):
+        if len(self.heights) < 5:
+            self.heights.append(value)
+            self.heights.sort()
+            return
+
+        heights = self.heights
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = next(i for i in range(4) if heights[i] <= value < heights[i + 1])
+
+        for i in range(cell + 1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Adjust the inner markers towards their desired positions
+        for i in range(1, 4):
+            offset = self.desired[i] - self.positions[i]
+            if (offset >= 1 and self.positions[i + 1] - self.positions[i] > 1) or (offset <= -1 and self.positions[i - 1] - self.positions[i] < -1):
+                step = 1 if offset > 0 else -1
+                candidate = self.parabolic(i, step)
+                if not heights[i - 1] < candidate < heights[i + 1]:
+                    candidate = heights[i] + step * (heights[i + step] - heights[i]) / (self.positions[i + step] - self.positions[i])
+                heights[i] = candidate
+                self.positions[i] += step
+
+    def parabolic(self, i: int, step: int):
+        heights = self.heights
+        positions = self.positions
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - step) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+        )
+
+    @property
+    def value(self):
+        if len(self.heights) < 5:
+            if not self.heights:
+                return float("nan")
+            return float(np.quantile(self.heights, self.quantile))
+        return self.heights[2]
+
+class ImpactStatistics:
+    """
+    Streaming accumulator of impact points (range x and deflection z). Mean and covariance are updated with
+    Welford's algorithm, percentiles with P² estimators, so no impact point has to be kept.
+    """
+
+    def __init__(self, percentiles=(5, 25, 50, 75, 95)):
+        self.count = 0
+        self.mean = np.zeros(2)
+        self.m2 = np.zeros((2, 2))
+        self.time_of_flight = 0.0
+        self.percentiles = percentiles
+        self.range_quantiles = [P2Quantile(p / 100) for p in percentiles]
+        self.deflection_quantiles = [P2Quantile(p / 100) for p in percentiles]
+
+    def add(self, x: float, z: float, time_of_flight: float):
+        self.count += 1
+        point = np.array([x, z])
+        delta = point - self.mean
+        self.mean += delta / self.count
+        self.m2 += np.outer(delta, point - self.mean)
+        self.time_of_flight += (time_of_flight - self.time_of_flight) / self.count
+
+        for estimator in self.range_quantiles:
+            estimator.add(x)
+        for estimator in self.deflection_quantiles:
+            estimator.add(z)
+
+    @property
+    def covariance(self):
+        if self.count < 2:
+            return np.zeros((2, 2))
+        return self.m2 / (self.count - 1)
+
+    @property
+    def probable_error_range(self):
+        return PROBABLE_ERROR_FACTOR * sqrt(self.covariance[0, 0])
+
+    @property
+    def probable_error_deflection(self):
+        return PROBABLE_ERROR_FACTOR * sqrt(self.covariance[1, 1])
+
+    @property
+    def cep(self):
+        """
+        Circular error probable around the mean point of impact, approximated from the standard deviations.
+        """
+        return 0.5887 * (sqrt(self.covariance[0, 0]) + sqrt(self.covariance[1, 1]))
+
+    @property
+    def dispersion_ellipse(self):
+        """
+        The ellipse around the mean point of impact which contains 50% of the impacts.
+
+        Returns:
+        float: The semi-major axis in m
+        float: The semi-minor axis in m
+        float: The angle of the major axis against the x axis in degrees
+        """
+        eigenvalues, eigenvectors = np.linalg.eigh(self.covariance)
+        major = eigenvectors[:, 1]
+        # The sign of an eigenvector is arbitrary, report the angle within (-90, 90]
+        angle = atan2(major[1], major[0]) * 180 / pi
+        if angle > 90:
+            angle -= 180
+        elif angle <= -90:
+            angle += 180
+        return ELLIPSE_FACTOR * sqrt(max(eigenvalues[1], 0)), ELLIPSE_FACTOR * sqrt(max(eigenvalues[0], 0)), angle
+
+    def range_percentiles(self):
+        return {p: estimator.value for p, estimator in zip(self.percentiles, self.range_quantiles)}
+
+    def deflection_percentiles(self):
+        return {p: estimator.value for p, estimator in zip(self.percentiles, self.deflection_quantiles)}
+
+    def to_dict(self):
+        semi_major, semi_minor, angle = self.dispersion_ellipse
+        return {
+            "count": self.count,
+            "mean_x": float(self.mean[0]),
+            "mean_z": float(self.mean[1]),
+            "covariance": self.covariance.tolist(),
+            "time_of_flight": self.time_of_flight,
+            "probable_error_range": self.probable_error_range,
+            "probable_error_deflection": self.probable_error_deflection,
+            "cep": self.cep,
+            "ellipse_semi_major": semi_major,
+            "ellipse_semi_minor": semi_minor,
+            "ellipse_angle": angle,
+            "range_percentiles": self.range_percentiles(),
+            "deflection_percentiles": self.deflection_percentiles(),
+        }
+
+def perturb_meteo_a(meteo_a: MeteoA, perturbations: Perturbations, rng: np.random.Generator):
+    if meteo_a is None or meteo_a.measurements is None:
+        return meteo_a
+
+    measurements = meteo_a.measurements
+    temperatures = rng.normal(0, perturbations.meteo_temperature, len(measurements))
+    wind_directions = rng.normal(0, perturbations.meteo_wind_direction, len(measurements))
+    wind_velocities = rng.normal(0, perturbations.meteo_wind_velocity, len(measurements))
+
+    perturbed = copy(meteo_a)
+    perturbed.content_hash = None # The content differs from the parsed message
+    perturbed.measurements = [
+        Measurement(m.height, m.temperature + temperature, m.wind_direction + wind_direction, max(m.wind_velocity + wind_velocity, 0))
+        for m, temperature, wind_direction, wind_velocity in zip(measurements, temperatures, wind_directions, wind_velocities)
+    ]
+    return perturbed
+
+def simulate_chunk(seed, samples, v0, phi0, temp0, pressure0, height0, direction, meteo_a, projectile_type, radius, mass, perturbations,
+                   integrator, delta_t):
+    """
+    Simulates a chunk of perturbed shots. Runs in a worker process.
+
+    Parameters:
+    projectile_type (ProjectileType): The projectile, radius and mass override its values if not None
+
+    Returns:
+    np.ndarray: Impact x, impact z and time of flight of each shot, shape (samples, 3)
+    """
+    rng = np.random.default_rng(seed)
+    impacts = np.empty((samples, 3))
+    mass = projectile_type.mass if mass is None else mass
+
+    for sample in range(samples):
+        environment = Environment(temp0 + rng.normal(0, perturbations.temp0), pressure0 + rng.normal(0, perturbations.pressure0),
+                                  height0, perturb_meteo_a(meteo_a, perturbations, rng))
+        projectile = Projectile.of_type(projectile_type, direction, radius, mass + rng.normal(0, perturbations.mass))
+        simulator = Simulator(environment, projectile, integrator)
+        impact = simulator.impact(v0 + rng.normal(0, perturbations.v0), phi0, delta_t)
+        impacts[sample] = impact.point.x, impact.point.z, impact.time_of_flight
+
+    return impacts
+
+def run_ensemble(v0: float, phi0: float, temp0: float, pressure0: float, height0: float, direction: float, meteo_a: MeteoA,
+                 perturbations: Perturbations, samples: int, seed: int = 0, workers: int = None, chunk_size: int = 64,
+                 projectile: str = DEFAULT_PROJECTILE, radius: float = None, mass: float = None, integrator: str = "rk45",
+                 delta_t: float = 0.1, percentiles=(5, 25, 50, 75, 95)):
+    """
+    Runs a Monte Carlo ensemble of perturbed shots on a process pool and reduces the impact points to streaming
+    statistics. Every chunk draws from its own seed derived from the given seed, so the results only depend on
+    seed, samples and chunk_size, not on the number of workers.
+
+    Parameters:
+    v0, phi0, temp0, pressure0, height0, direction, meteo_a: The unperturbed shot, see Environment and Simulator
+    perturbations (Perturbations): Standard deviations of the inputs
+    samples (int): Number of shots
+    seed (int): Seed of the random numbers
+    workers (int): Number of worker processes, None for one per core and 1 to run in this process
+    chunk_size (int): Number of shots per task of a worker
+    projectile (str): Name of a registered projectile type, see drag.get_projectile_type
+    radius, mass (float): Override the radius and mean mass of the projectile type, None to keep them
+    integrator (str): Integrator of the simulator, see Simulator
+    delta_t (float): Number of seconds per iteration, the initial step for the rk45 integrator
+    percentiles (tuple): Percentiles of range and deflection to estimate
+
+    Returns:
+    ImpactStatistics: The statistics of the impact points
+    """
+    chunks = [min(chunk_size, samples - start) for start in range(0, samples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    # The type is resolved here, worker processes may not know types registered at runtime
+    arguments = (v0, phi0, temp0, pressure0, height0, direction, meteo_a, get_projectile_type(projectile), radius, mass,
+                 perturbations, integrator, delta_t)
+    statistics = ImpactStatistics(percentiles)
+
+    def reduce(results):
+        for impacts in results:
+            for x, z, time_of_flight in impacts:
+                statistics.add(x, z, time_of_flight)
+
+    if workers == 1:
+        reduce(simulate_chunk(chunk_seed, chunk, *arguments) for chunk_seed, chunk in zip(seeds, chunks))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            tasks = [(chunk_seed, chunk) + arguments for chunk_seed, chunk in zip(seeds, chunks)]
+            reduce(submit_bounded(executor, simulate_chunk, tasks, 2 * workers))
+
+    return statistics
@@ -0,0 +1,238 @@
+import json
+from bisect import bisect_right
+import numpy as np
+
+INTERPOLATIONS = ("linear", "pchip")
+DEFAULT_PROJECTILE = "standard"
+
+class DragTable:
+    """
+    Drag coefficient as a function of the Mach number, interpolated monotonically between tabulated points: linear or
+    piecewise cubic Hermite with Fritsch-Carlson slopes (pchip), which never overshoots the tabulated values. Outside
+    of the table the curve is extrapolated linearly with the slope at the outermost point.
+
+    The curve is compiled into one polynomial per segment, evaluated from the start of the segment. Segment 0 lies below
+    the first point and the last segment above the last point, so a lookup is a binary search and a Horner scheme.
+    """
+
+    def __init__(self, name: str, machs: list, coefficients: list, interpolation: str = "linear"):
+        """
+        Parameters:
+        name (str): Name of the table
+        machs (list): Mach numbers, strictly increasing
+        coefficients (list): The drag coefficients at these Mach numbers
+        interpolation (str): One of INTERPOLATIONS
+        """
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError("Unknown interpolation: " + str(interpolation))
+        if len(machs) != len(coefficients) or len(machs) < 2:
+            raise ValueError("A drag table needs at least two Mach numbers with one coefficient each")
+        if any(later <= earlier for earlier, later in zip(machs, machs[1:])):
+            raise ValueError("The Mach numbers of a drag table must be strictly increasing")
+
+        self.name = name
+        self.machs = [float(mach) for mach in machs]
+        self.values = [float(coefficient) for coefficient in coefficients]
+        self.interpolation = interpolation
+
+        slopes = self.slopes()
+        self.starts = [self.machs[0]] + self.machs
+        # Polynomial per segment: c0 + c1 * s + c2 * s^2 + c3 * s^3 with s = mach - start
+        self.polynomials = [(self.values[0], slopes[0], 0.0, 0.0)]
+        for index in range(len(self.machs) - 1):
+            width = self.machs[index + 1] - self.machs[index]
+            secant = (self.values[index + 1] - self.values[index]) / width
+            if interpolation == "linear":
+                self.polynomials.append((self.values[index], secant, 0.0, 0.0))
+            else:
+                self.polynomials.append((
+                    self.values[index],
+                    slopes[index],
+                    (3 * secant - 2 * slopes[index] - slopes[index + 1]) / width,
+                    (slopes[index] + slopes[index + 1] - 2 * secant) / width ** 2,
+                ))
+        self.polynomials.append((self.values[-1], slopes[-1], 0.0, 0.0))
+        self.start_array = np.array(self.starts)
+        self.mach_array = np.array(self.machs)
+        self.polynomial_array = np.array(self.polynomials)
+
+    def slopes(self):
+        """
+        Returns:
+        list: The slope at every tabulated point, for linear interpolation only the outermost ones are used
+        """
+        widths = [later - earlier for earlier, later in zip(self.machs, self.machs[1:])]
+        secants = [(later - earlier) / width for earlier, later, width in zip(self.values, self.values[1:], widths)]
+        if self.interpolation == "linear" or len(secants) == 1:
+            return [secants[0]] + secants
+
+        slopes = [0.0] * len(self.machs)
+        for index in range(1, len(self.machs) - 1):
+            before, after = secants[index - 1], secants[index]
+            if before * after <= 0:
+                continue
+            # Weighted harmonic mean, keeps the interpolation monotone between the points
+            weight_before = 2 * widths[index] + widths[index - 1]
+            weight_after = widths[index] + 2 * widths[index - 1]
+            slopes[index] = (weight_before + weight_after) / (weight_before / before + weight_after / after)
+
+        def end_slope(width, next_width, secant, next_secant):
+            slope = ((2 * width + next_width) * secant - width * next_secant) / (width + next_width)
+            if slope * secant <= 0:
+                return 0.0
+            if secant * next_secant < 0 and abs(slope) > 3 * abs(secant):
+                return 3 * secant
+            return slope
+
+        slopes[0] = end_slope(widths[0], widths[1], secants[0], secants[1])
+        slopes[-1] = end_slope(widths[-1], widths[-2], secants[-1], secants[-2])
+        return slopes
+
+    def at(self, mach: float):
+        """
+        Returns:
+        float: The drag coefficient at the Mach number
+        """
+        segment = bisect_right(self.machs, mach)
+        c0, c1, c2, c3 = self.polynomials[segment]
+        offset = mach - self.starts[segment]
+        return c0 + offset * (c1 + offset * (c2 + offset * c3))
+
+    def at_batch(self, machs: np.ndarray):
+        """
+        Vectorized variant of at.
+        """
+        segment = np.searchsorted(self.mach_array, machs, side="right")
+        polynomial = self.polynomial_array[segment]
+        offset = machs - self.start_array[segment]
+        return polynomial[..., 0] + offset * (polynomial[..., 1] + offset * (polynomial[..., 2] + offset * polynomial[..., 3]))
+
+    def __call__(self, mach):
+        if np.ndim(mach) == 0:
+            return self.at(mach)
+        return self.at_batch(np.asarray(mach, dtype=float))
+
+    def shifted(self, start: float, representative: float):
+        """
+        Returns:
+        tuple: The polynomial of the segment containing the representative Mach number, evaluated from start
+        """
+        segment = bisect_right(self.machs, representative)
+        c0, c1, c2, c3 = self.polynomials[segment]
+        offset = start - self.starts[segment]
+        return (
+            c0 + offset * (c1 + offset * (c2 + offset * c3)),
+            c1 + offset * (2 * c2 + offset * 3 * c3),
+            c2 + 3 * c3 * offset,
+            c3,
+        )
+
+    def fingerprint(self):
+        return (self.interpolation, tuple(self.machs), tuple(self.values))
+
+    def to_dict(self):
+        return {"machs": self.machs, "coefficients": self.values, "interpolation": self.interpolation}
+
+class DragTableStack:
+    """
+    Several drag tables compiled onto the union of their Mach numbers, so that shots with different tables are
+    evaluated together: every shot selects its row of polynomials, without branching per table.
+    """
+
+    def __init__(self, tables: list):
+        self.tables = tables
+        machs = sorted({mach for table in tables for mach in table.machs})
+        self.mach_array = np.array(machs)
+        self.start_array = np.array([machs[0]] + machs)
+        # The representative Mach number of a segment selects the polynomial of each table covering the segment
+        representatives = [machs[0] - 1] + [(earlier + later) / 2 for earlier, later in zip(machs, machs[1:])] + [machs[-1] + 1]
+        self.polynomial_array = np.array([
+            [table.shifted(start, representative) for start, representative in zip(self.start_array, representatives)]
+            for table in tables
+        ])
+
+    def at_batch(self, machs: np.ndarray, rows: np.ndarray):
+        """
+        Parameters:
+        machs (np.ndarray): The Mach numbers
+        rows (np.ndarray): Index of the table of each Mach number in tables
+
+        Returns:
+        np.ndarray: The drag coefficients
+        """
+        segment = np.searchsorted(self.mach_array, machs, side="right")
+        polynomial = self.polynomial_array[rows, segment]
+        offset = machs - self.start_array[segment]
+        return polynomial[:, 0] + offset * (polynomial[:, 1] + offset * (polynomial[:, 2] + offset * polynomial[:, 3]))
+
+class ProjectileType:
+    """
+    Definition of a kind of ammunition.
+    """
+
+    def __init__(self, name: str, radius: float, mass: float, drag_table: DragTable, axial_drag_coefficient: float = 1.2,
+                 axial_cross_sectional_area: float = 0.125):
+        """
+        Parameters:
+        name (str): Name under which the type is registered
+        radius (float): Radius in m
+        mass (float): Mass in kg
+        drag_table (DragTable): Lateral drag coefficient by Mach number
+        axial_drag_coefficient (float): Drag coefficient of the movement along the axis of the gun (z)
+        axial_cross_sectional_area (float): Area in m^2 exposed to the axial movement
+        """
+        self.name = name
+        self.radius = radius
+        self.mass = mass
+        self.drag_table = drag_table
+        self.axial_drag_coefficient = axial_drag_coefficient
+        self.axial_cross_sectional_area = axial_cross_sectional_area
+
+# The curve of Regl. 55.210 1.3.1: constant below Mach 0.8, rising linearly up to Mach 1.2, falling linearly above
+STANDARD_DRAG_TABLE = DragTable("standard", [0, 0.8, 1.2, 3.8], [0.14, 0.14, 0.39, 0.0])
+
+drag_tables = {STANDARD_DRAG_TABLE.name: STANDARD_DRAG_TABLE}
+projectile_types = {DEFAULT_PROJECTILE: ProjectileType(DEFAULT_PROJECTILE, 0.077, 42, STANDARD_DRAG_TABLE)}
+
+def register_drag_table(table: DragTable):
+    drag_tables[table.name] = table
+
+def register_projectile_type(projectile_type: ProjectileType):
+    projectile_types[projectile_type.name] = projectile_type
+
+def get_drag_table(name: str):
+    try:
+        return drag_tables[name]
+    except KeyError:
+        raise ValueError("Unknown drag table: " + str(name)) from None
+
+def get_projectile_type(name: str):
+    try:
+        return projectile_types[name]
+    except KeyError:
+        raise ValueError("Unknown projectile: " + str(name)) from None
+
+def load_registry(file_path: str):
+    """
+    Registers the drag tables and projectile types of a .json file of the form
+    {"drag_tables": {name: {"machs": [...], "coefficients": [...], "interpolation": "pchip"}},
+     "projectiles": {name: {"radius": 0.077, "mass": 42, "drag_table": name, "axial_drag_coefficient": 1.2,
+                            "axial_cross_sectional_area": 0.125}}}
+    Projectiles may refer to the tables of the same file and to tables registered before.
+
+    Returns:
+    list: The names of the registered projectile types
+    """
+    with open(file_path, encoding="utf-8") as file:
+        registry = json.load(file)
+
+    for name, table in registry.get("drag_tables", {}).items():
+        register_drag_table(DragTable(name, table["machs"], table["coefficients"], table.get("interpolation", "linear")))
+
+    names = []
+    for name, definition in registry.get("projectiles", {}).items():
+        definition = dict(definition)
+        definition["drag_table"] = get_drag_table(definition.get("drag_table", STANDARD_DRAG_TABLE.name))
+        register_projectile_type(ProjectileType(name, **definition))
+        names.append(name)
+    return names
@@ -1,6 +1,7 @@
 from geometry import Point
-from math import e
+from atmosphere import AtmosphereProfile, AIR_MOLAR_MASS, GAS_CONSTANT, GRAVITY
 from meteo_a import Measurement, MeteoA
+import numpy as np
 
 class Environment:
     def __init__(self, temp0: float, pressure0: float, height0: float, meteo_a: MeteoA):
@@ -8,14 +9,74 @@ class Environment:
         self.pressure0 = pressure0
         self.height0 = height0
         self.meteo_a = meteo_a
-        self.air_molar_mass = 0.02896968 # kg/mol
-        self.gas_constant = 8.314462618 # J / (mol * K)
-        self.gravity = 9.80665 # m / s^2
+        self.air_molar_mass = AIR_MOLAR_MASS
+        self.gas_constant = GAS_CONSTANT
+        self.gravity = GRAVITY
+        self.profile = AtmosphereProfile(temp0, pressure0, height0, meteo_a)
+
+    def get_conditions(self, point: Point):
+        """
+        Derives density, temperature, speed of sound and wind at the specified point with a single lookup
+        in the compiled atmosphere profile.
+
+        Parameters:
+        point (Point): The point at whose height the conditions should be calculated
+
+        Returns:
+        AtmosphericConditions: The atmospheric conditions
+        """
+        return self.profile.at(point.y)
+
+    def get_conditions_batch(self, heights: np.ndarray):
+        """
+        Vectorized variant of get_conditions.
+
+        Parameters:
+        heights (np.ndarray): The heights at which the conditions should be calculated
+
+        Returns:
+        AtmosphericConditions: The atmospheric conditions, one array entry per height
+        """
+        return self.profile.at_batch(heights)
+
+    def get_conditions_points(self, points: np.ndarray, directions: np.ndarray = None):
+        """
+        Vectorized variant of get_conditions for whole positions. The atmosphere only varies with the height here,
+        environments which vary along the ground as well override this.
+
+        Parameters:
+        points (np.ndarray): The positions, shape (n, 3)
+        directions (np.ndarray): Direction of fire of the shot of each point in Azimute, places the positions on the
+                                 ground for environments which vary along it. None for the direction of the environment
+
+        Returns:
+        AtmosphericConditions: The atmospheric conditions, one array entry per point
+        """
+        return self.get_conditions_batch(points[:, 1])
+
+    def for_direction(self, direction: float):
+        """
+        Returns:
+        Environment: The environment for shots in the given direction of fire, the same one as the atmosphere does
+                     not vary along the ground here
+        """
+        return self
+
+    def fingerprint(self):
+        """
+        Returns:
+        tuple: Identifies the atmosphere by its content, e.g. for caches. None if it cannot be identified, which is
+               the case for a Meteo A without content hash
+        """
+        meteo_hash = None
+        if self.is_meteo_a_given():
+            meteo_hash = getattr(self.meteo_a, "content_hash", None)
+            if meteo_hash is None:
+                return None
+        return (float(self.temp0) + 0.0, float(self.pressure0) + 0.0, float(self.height0) + 0.0, meteo_hash)
 
     def get_air_density(self, point: Point):
-        pressure = self.derive_pressure(point)
-        temperature = self.derive_temperature(point)
-        return (100 * pressure) / (287.05 * temperature)
+        return self.get_conditions(point).density
 
     def derive_temperature(self, point: Point):
         """
@@ -28,12 +89,7 @@ class Environment:
         Returns:
         float: The temperature in K
         """
-        if self.is_meteo_a_given():
-            return self.get_linear_interpolation_at(point.y).temperature + 273.15
-        else:
-            if point.y > 11000:
-                return 216.65
-            return (273.15 + self.temp0) - 0.0065 * (point.y - self.height0)
+        return self.get_conditions(point).temperature
 
     def derive_pressure(self, point: Point):
         """
@@ -45,16 +101,8 @@ class Environment:
         Returns:
         float: The pressure in hPa
         """
-        height_difference = point.y - self.height0
-
-        if self.is_meteo_a_given():
-            temperature = self.get_linear_interpolation_at(point.y).temperature
-        else:
-            temperature = self.temp0 - 0.0065 * height_difference
+        return self.get_conditions(point).pressure
 
-        return self.pressure0 * pow(e, - (self.gravity * self.air_molar_mass * height_difference / (self.gas_constant * (temperature + 273.15))))
-
-        
     def get_wind(self, point: Point):
         """
         Derives the wind direction and velocity at a given point.
@@ -66,66 +114,25 @@ class Environment:
         float: The direction of the wind in Azimute
         velocity: The velocity of the wind in m/s
         """
-        if self.is_meteo_a_given():
-            measurement = self.get_linear_interpolation_at(point.y)
-            return measurement.wind_direction * 100, measurement.wind_velocity
-        else:
-            return 0, 0
+        conditions = self.get_conditions(point)
+        return conditions.wind_direction, conditions.wind_velocity
 
     def get_speed_of_sound(self, point: Point):
-        return 331 + 0.6 * (self.derive_temperature(point) - 273.15)
+        return self.get_conditions(point).speed_of_sound
     
     def is_meteo_a_given(self):
         return self.meteo_a != None and self.meteo_a.measurements != None
     
     def get_linear_interpolation_at(self, height: float):
         """
-        Interpolates the fields of a set of vectors for a given target height.
+        Interpolates the fields of a set of vectors for a given target height. Heights outside the range of the
+        measurements are extrapolated from the two outermost measurements.
 
         Parameters:
         height (float): The height at which to interpolate the fields.
 
         Returns:
         Measurement: Interpolated values for the fields at the given height.
-
-        Raises:
-        ValueError: If the height is outside the range of the given heights.
-        """
-
-        lower_idx = 0
-        upper_idx = 0
-
-        # Determine lower and upper indices
-        if height < self.meteo_a.measurements[0].height:
-            lower_idx = 0
-            upper_idx = 1
-        elif height > self.meteo_a.measurements[-1].height:
-            lower_idx = len(self.meteo_a.measurements) - 2
-            upper_idx = len(self.meteo_a.measurements) - 1
-        else:
-            for i in range(len(self.meteo_a.measurements) - 1):
-                if self.meteo_a.measurements[i].height <= height < self.meteo_a.measurements[i + 1].height:
-                    lower_idx = i
-                    upper_idx = i + 1
-                    break
-
-        # Get the two closest objects
-        lower_obj = self.meteo_a.measurements[lower_idx]
-        upper_obj = self.meteo_a.measurements[upper_idx]
-
-        # Heights for interpolation
-        h1, h2 = lower_obj.height, upper_obj.height
-
-        # Fields for interpolation
-        interpolated_temperature = lower_obj.temperature + (
-            (upper_obj.temperature - lower_obj.temperature) * (height - h1) / (h2 - h1)
-        )
-        interpolated_wind_direction = lower_obj.wind_direction + (
-            (upper_obj.wind_direction - lower_obj.wind_direction) * (height - h1) / (h2 - h1)
-        )
-        interpolated_wind_velocity = lower_obj.wind_velocity + (
-            (upper_obj.wind_velocity - lower_obj.wind_velocity) * (height - h1) / (h2 - h1)
-        )
-
-        # Return interpolated results
-        return Measurement(height, interpolated_temperature, interpolated_wind_direction, interpolated_wind_velocity)
\ No newline at end of file
+        """
+        temperature, wind_direction, wind_velocity = self.profile.interpolate_meteo_a(height)
+        return Measurement(height, temperature, wind_direction, wind_velocity)
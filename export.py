@@ -0,0 +1,299 @@
+import argparse
+import json
+import os
+import struct
+import sys
+from drag import DEFAULT_PROJECTILE, load_registry
+from environment import Environment
+from meteo_cache import MeteoCache
+from projectile import Projectile
+from result_cache import MODEL_VERSION
+from simulator import Simulator, INTEGRATORS
+from trajectory import COLUMNS, Trajectory
+import numpy as np
+
+# Layout of a file: MAGIC, the length of the header as unsigned 64 bit little endian integer, the header as JSON and
+# the raw arrays, each starting at a multiple of ALIGNMENT bytes. The header lists the dtype, shape and offset of every
+# array, so each array can be memory mapped on its own.
+MAGIC = b"BALLCOL1"
+ALIGNMENT = 64
+FIRING_TABLE_FIELDS = ("range", "deflection", "time_of_flight", "apex_height", "angle_of_fall", "terminal_velocity")
+
+def align(offset: int):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def create_file(path: str, kind: str, arrays: dict, attributes: dict = None):
+    """
+    Creates a columnar file of the given size and maps its arrays for writing, so they can be filled piece by piece
+    without holding them in memory.
+
+    Parameters:
+    path (str): The file to create
+    kind (str): What the file contains, e.g. "trajectories" or "firing_table"
+    arrays (dict): Name -> (dtype, shape) of every array
+    attributes (dict): Additional JSON serializable metadata
+
+    Returns:
+    dict: Name -> writable np.memmap, flush them before the file is read
+    """
+    # The offsets depend on the length of the header, which contains them. Reserve enough room for any offset.
+    specs = {name: {"dtype": np.dtype(dtype).str, "shape": [int(size) for size in np.atleast_1d(shape)], "offset": 0}
+             for name, (dtype, shape) in arrays.items()}
+    header = {"version": 1, "kind": kind, "model_version": MODEL_VERSION, "attributes": attributes or {}, "arrays": specs}
+    reserved = len(json.dumps(header).encode()) + 20 * len(specs)
+    offset = align(len(MAGIC) + 8 + reserved)
+    for spec in specs.values():
+        spec["offset"] = offset
+        offset = align(offset + int(np.prod(spec["shape"])) * np.dtype(spec["dtype"]).itemsize)
+
+    encoded = json.dumps(header).encode().ljust(reserved)
+    with open(path, "wb") as file:
+        file.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+        file.truncate(offset)
+
+    return {name: np.memmap(path, dtype=spec["dtype"], mode="r+", offset=spec["offset"], shape=tuple(spec["shape"]))
+            for name, spec in specs.items()}
+
+def read_header(path: str):
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a columnar export: " + path)
+        length, = struct.unpack("<Q", file.read(8))
+        return json.loads(file.read(length))
+
+class ColumnarFile:
+    """
+    Read access to a columnar file. Arrays are memory mapped when first used, only the pages which are accessed are
+    read from disk.
+    """
+
+    kind = None
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header = read_header(path)
+        if self.kind is not None and self.header["kind"] != self.kind:
+            raise ValueError("Expected {} but {} contains {}".format(self.kind, path, self.header["kind"]))
+        self.attributes = self.header["attributes"]
+        self.arrays = {}
+
+    @property
+    def names(self):
+        return list(self.header["arrays"])
+
+    def array(self, name: str):
+        """
+        Returns:
+        np.memmap: The read-only array
+        """
+        if name not in self.arrays:
+            spec = self.header["arrays"][name]
+            self.arrays[name] = np.memmap(self.path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=tuple(spec["shape"]))
+        return self.arrays[name]
+
+class TrajectoryFile(ColumnarFile):
+    """
+    Many trajectories of different length. Every column of COLUMNS holds the states of all trajectories one after the
+    other, offsets[i] is the first state of trajectory i. Parameters of the shots, e.g. v0 and elevation, are stored as
+    arrays "parameter/<name>" with one entry per trajectory.
+    """
+
+    kind = "trajectories"
+
+    def __len__(self):
+        return len(self.array("offsets")) - 1
+
+    @property
+    def parameters(self):
+        return [name.split("/", 1)[1] for name in self.names if name.startswith("parameter/")]
+
+    def parameter(self, name: str):
+        return self.array("parameter/" + name)
+
+    def trajectory(self, index: int):
+        """
+        Returns:
+        Trajectory: A copy of the trajectory in double precision
+        """
+        offsets = self.array("offsets")
+        start, end = int(offsets[index]), int(offsets[index + 1])
+        return Trajectory.from_array(np.array([self.array(column)[start:end] for column in COLUMNS], dtype=float))
+
+    def impacts(self):
+        """
+        Returns:
+        np.ndarray: The last state of every trajectory, shape (trajectories, 7) with the columns ordered as in COLUMNS
+        """
+        last = np.asarray(self.array("offsets")[1:]) - 1
+        return np.stack([self.array(column)[last] for column in COLUMNS], axis=1).astype(float)
+
+class FiringTable(ColumnarFile):
+    """
+    Impact values over a grid of initial velocities and elevations, one array of shape (v0s, elevations) per field of
+    FIRING_TABLE_FIELDS. Values are nan where the impact height is not reached.
+    """
+
+    kind = "firing_table"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        # The axes are small, they are read completely
+        self.v0s = np.array(self.array("v0"))
+        self.elevations = np.array(self.array("elevation"))
+
+    def value(self, field: str, v0: float, elevation: float):
+        """
+        Interpolates a field bilinearly, reading only the four surrounding entries.
+
+        Returns:
+        float: The value, nan outside the table or where a surrounding entry is nan
+        """
+        if not (self.v0s[0] <= v0 <= self.v0s[-1] and self.elevations[0] <= elevation <= self.elevations[-1]):
+            return float("nan")
+        row = min(max(int(np.searchsorted(self.v0s, v0, side="right")) - 1, 0), max(len(self.v0s) - 2, 0))
+        column = min(max(int(np.searchsorted(self.elevations, elevation, side="right")) - 1, 0), max(len(self.elevations) - 2, 0))
+        cells = np.asarray(self.array(field)[row:row + 2, column:column + 2], dtype=float)
+
+        def fraction(axis, index, value):
+            return (value - axis[index]) / (axis[index + 1] - axis[index]) if index + 1 < len(axis) else 0.0
+
+        u = fraction(self.v0s, row, v0)
+        w = fraction(self.elevations, column, elevation)
+        cells = np.pad(cells, ((0, 2 - cells.shape[0]), (0, 2 - cells.shape[1])), mode="edge")
+        return float((1 - u) * ((1 - w) * cells[0, 0] + w * cells[0, 1]) + u * ((1 - w) * cells[1, 0] + w * cells[1, 1]))
+
+def write_trajectories(path: str, trajectories: list, parameters: dict = None, dtype=np.float64, attributes: dict = None):
+    """
+    Writes trajectories into a columnar file, see TrajectoryFile. The file is filled one trajectory after the other.
+
+    Parameters:
+    path (str): The file to write
+    trajectories (list): The Trajectory objects
+    parameters (dict): Name -> one value per trajectory, e.g. {"v0": [...], "elevation": [...]}
+    dtype: Type of the states, np.float32 halves the size at a precision of about 2 mm over 30 km
+    attributes (dict): Additional JSON serializable metadata
+    """
+    lengths = np.array([len(trajectory) for trajectory in trajectories], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    parameters = {name: np.asarray(values, dtype=float) for name, values in (parameters or {}).items()}
+    for name, values in parameters.items():
+        if values.shape != (len(trajectories),):
+            raise ValueError("Expected one value of {} per trajectory".format(name))
+
+    arrays = {"offsets": (np.int64, len(offsets))}
+    arrays.update({column: (dtype, offsets[-1]) for column in COLUMNS})
+    arrays.update({"parameter/" + name: (np.float64, len(trajectories)) for name in parameters})
+    mapped = create_file(path, TrajectoryFile.kind, arrays, attributes)
+
+    mapped["offsets"][:] = offsets
+    for name, values in parameters.items():
+        mapped["parameter/" + name][:] = values
+    columns = [mapped[column] for column in COLUMNS]
+    for index, trajectory in enumerate(trajectories):
+        for row, column in enumerate(columns):
+            column[offsets[index]:offsets[index + 1]] = trajectory.data[row, :len(trajectory)]
+    for array in mapped.values():
+        array.flush()
+
+def firing_table_rows(simulator: Simulator, v0s, elevations, delta_t: float):
+    """
+    Calculates a firing table one initial velocity after the other with the integrator of the simulator. With the
+    Euler integrator each row is calculated in one batch, the others are more accurate for the same delta_t but
+    calculate the elevations one by one.
+
+    Yields:
+    dict: Field of FIRING_TABLE_FIELDS -> values over the elevations
+    """
+    for v0 in v0s:
+        row = {field: np.full(len(elevations), np.nan) for field in FIRING_TABLE_FIELDS}
+        if simulator.integrator == "euler":
+            trajectories = simulator.calculate_batch(v0, elevations, None, delta_t)
+        else:
+            trajectories = (simulator.calculate(v0, elevation, delta_t) for elevation in elevations)
+        for index, trajectory in enumerate(trajectories):
+            if abs(trajectory.y[-1] - simulator.impact_height) > 1e-6:
+                continue
+            impact = trajectory.impact
+            row["range"][index] = impact.point.x
+            row["deflection"][index] = impact.point.z
+            row["time_of_flight"][index] = impact.time_of_flight
+            row["apex_height"][index] = float(trajectory.y.max())
+            row["angle_of_fall"][index] = impact.angle_of_fall
+            row["terminal_velocity"][index] = impact.terminal_velocity
+        yield row
+
+def write_firing_table(path: str, v0s, elevations, rows, dtype=np.float64, attributes: dict = None):
+    """
+    Writes a firing table into a columnar file, see FiringTable. The rows are written as they come, so a table larger
+    than the memory can be streamed from firing_table_rows.
+
+    Parameters:
+    path (str): The file to write
+    v0s, elevations (array_like): The axes of the table, increasing
+    rows (iterable): One dict per v0 with an array over the elevations per field of FIRING_TABLE_FIELDS
+    dtype: Type of the values, e.g. np.float32
+    attributes (dict): Additional JSON serializable metadata
+    """
+    shape = (len(v0s), len(elevations))
+    arrays = {"v0": (np.float64, len(v0s)), "elevation": (np.float64, len(elevations))}
+    arrays.update({field: (dtype, shape) for field in FIRING_TABLE_FIELDS})
+    mapped = create_file(path, FiringTable.kind, arrays, attributes)
+
+    mapped["v0"][:] = v0s
+    mapped["elevation"][:] = elevations
+    for index, row in enumerate(rows):
+        for field in FIRING_TABLE_FIELDS:
+            mapped[field][index] = row[field]
+    for array in mapped.values():
+        array.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Writes firing tables as columnar binary files and shows their content")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    table_parser = subparsers.add_parser("firing-table", help="Calculates a firing table over v0 and elevation")
+    table_parser.add_argument("-o", "--output", required=True, help="File to write")
+    table_parser.add_argument("--v0", type=float, nargs="+", required=True, help="Initial velocities in m/s")
+    table_parser.add_argument("--elevations", type=float, nargs=3, default=[0, 90, 1], metavar=("FROM", "TO", "STEP"),
+                              help="Elevations in degrees, including TO")
+    table_parser.add_argument("--temp0", type=float, required=True)
+    table_parser.add_argument("--pressure0", type=float, required=True)
+    table_parser.add_argument("--height0", type=float, required=True)
+    table_parser.add_argument("--direction", type=float, default=0, help="Direction of fire in Azimute")
+    table_parser.add_argument("--meteo", help="Meteo A .csv file")
+    table_parser.add_argument("--projectile", default=DEFAULT_PROJECTILE, help="Name of a registered projectile type")
+    table_parser.add_argument("--projectiles", help="A .json file with additional projectile types, see drag.load_registry")
+    table_parser.add_argument("--integrator", choices=INTEGRATORS, default="rk45", help="Integrator, see Simulator")
+    table_parser.add_argument("--tolerance", type=float, default=1e-3, help="Allowed local error per step of rk45")
+    table_parser.add_argument("--delta-t", type=float, default=0.1, help="Seconds per step, the initial step for rk45")
+    table_parser.add_argument("--float32", action="store_true", help="Store the values in single precision")
+    info_parser = subparsers.add_parser("info", help="Prints the header of a file")
+    info_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        print(json.dumps(read_header(args.path), indent=2))
+        return 0
+
+    if args.projectiles:
+        load_registry(args.projectiles)
+    meteo_a = None
+    if args.meteo:
+        meteo_a = MeteoCache().load_file(args.meteo)
+        if getattr(meteo_a, "error", None):
+            print("Invalid Meteo A: " + meteo_a.error, file=sys.stderr)
+            return 1
+
+    start, stop, step = args.elevations
+    elevations = np.arange(start, stop + step / 2, step)
+    v0s = sorted(args.v0)
+    environment = Environment(args.temp0, args.pressure0, args.height0, meteo_a)
+    simulator = Simulator(environment, Projectile.from_type(args.projectile, args.direction), args.integrator, args.tolerance)
+    attributes = {name: getattr(args, name) for name in ("temp0", "pressure0", "height0", "direction", "projectile", "integrator",
+                                                         "tolerance", "delta_t")}
+    attributes["meteo"] = os.path.abspath(args.meteo) if args.meteo else None
+    write_firing_table(args.output, v0s, elevations, firing_table_rows(simulator, v0s, elevations, args.delta_t),
+                       np.float32 if args.float32 else np.float64, attributes)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
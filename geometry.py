@@ -1,35 +1,77 @@
 class Vector:
+    # No per-instance __dict__, arithmetic keeps the type of the left operand (Point, Velocity, ...)
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x: float, y: float, z: float):
         self.x = x
         self.y = y
         self.z = z
 
     def __add__(self, other: "Vector") -> "Vector":
-        return Vector(self.x + other.x, self.y + other.y, self.z + other.z)
+        return self.__class__(self.x + other.x, self.y + other.y, self.z + other.z)
 
     def __sub__(self, other: "Vector") -> "Vector":
-        return Vector(self.x - other.x, self.y - other.y, self.z - other.z)
-    
+        return self.__class__(self.x - other.x, self.y - other.y, self.z - other.z)
+
     def __mul__(self, factor: float) -> "Vector":
-        return Vector(self.x * factor, self.y * factor, self.z * factor)
-    
+        return self.__class__(self.x * factor, self.y * factor, self.z * factor)
+
     def __truediv__(self, divisor: float) -> "Vector":
-        return Vector(self.x / divisor, self.y / divisor, self.z / divisor)
-    
+        return self.__class__(self.x / divisor, self.y / divisor, self.z / divisor)
+
+    def __iadd__(self, other: "Vector") -> "Vector":
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def __isub__(self, other: "Vector") -> "Vector":
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    def __imul__(self, factor: float) -> "Vector":
+        self.x *= factor
+        self.y *= factor
+        self.z *= factor
+        return self
+
+    def __itruediv__(self, divisor: float) -> "Vector":
+        self.x /= divisor
+        self.y /= divisor
+        self.z /= divisor
+        return self
+
+    def fma(self, other: "Vector", factor: float) -> "Vector":
+        """
+        Fused multiply-add, returns self + other * factor with a single allocation.
+        """
+        return self.__class__(self.x + other.x * factor, self.y + other.y * factor, self.z + other.z * factor)
+
+    def add_scaled(self, other: "Vector", factor: float) -> "Vector":
+        """
+        In-place fused multiply-add, self += other * factor without any allocation.
+        """
+        self.x += other.x * factor
+        self.y += other.y * factor
+        self.z += other.z * factor
+        return self
+
+    def copy(self) -> "Vector":
+        return self.__class__(self.x, self.y, self.z)
+
     def dot(self, other: "Vector") -> float:
         return self.x * other.x + self.y * other.y + self.z * other.z
 
     def __repr__(self):
-        return f"Vector(x={self.x}, y={self.y}, z={self.z})"
+        return f"{self.__class__.__name__}(x={self.x}, y={self.y}, z={self.z})"
 
 class Point(Vector):
-    def __init__(self, x: float, y: float, z: float):
-        super().__init__(x, y, z)
+    __slots__ = ()
 
 class Velocity(Vector):
-    def __init__(self, x: float, y: float, z: float):
-        super().__init__(x, y, z)
+    __slots__ = ()
 
 class Acceleration(Vector):
-    def __init__(self, x: float, y: float, z: float):
-        super().__init__(x, y, z)
\ No newline at end of file
+    __slots__ = ()
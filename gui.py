@@ -1,23 +1,35 @@
-import csv
 import tkinter as tk
 from tkinter import filedialog
+from background import CalculationJob, CalculationWorker
+from drag import DEFAULT_PROJECTILE
 from environment import Environment
+from instrumentation import Instrumentation
 from meteo_a import MeteoA
+from meteo_cache import MeteoCache
 from projectile import Projectile
-from simulator import Simulator
-import matplotlib.pyplot as plt
-import webbrowser
-from PIL import Image, ImageTk
+from result_cache import TrajectoryCache
+from simulator import Simulator, INTEGRATORS
 import sys
 import os
+import numpy as np
+
+# Milliseconds between two polls of the background calculation
+POLL_INTERVAL = 50
+# Milliseconds after the start until matplotlib is loaded in advance, so the window appears before it is loaded
+PRELOAD_DELAY = 500
 
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
 
-        ico = Image.open(self.resource('schneeflocke.ico'))
-        photo = ImageTk.PhotoImage(ico)
-        self.wm_iconphoto(False, photo)
+        self.meteo_cache = MeteoCache()
+        self.trajectory_cache = TrajectoryCache()
+        self.instrumentation = Instrumentation()
+        self.worker = CalculationWorker(self.trajectory_cache)
+        self.meteo_a = None # The Meteo A of the latest calculation, also used for series
+        self.running_jobs = {} # CalculationJob -> chunks of the points received so far
+        self._plot_manager = None
+        self.polling = False
 
         self.title("Meteo A - Auswertung")
         self.geometry("1000x500")
@@ -29,6 +41,28 @@ class App(tk.Tk):
         # Initial validation
         self.validate_inputs()
 
+        # The icon and the plotting stack are loaded once the window is shown
+        self.after_idle(self.load_icon)
+        self.after(PRELOAD_DELAY, self.preload_plotting)
+
+    def load_icon(self):
+        try:
+            from PIL import Image, ImageTk
+        except ImportError:
+            return # Keep the default icon
+        self.icon = ImageTk.PhotoImage(Image.open(self.resource('schneeflocke.ico')))
+        self.wm_iconphoto(False, self.icon)
+
+    def preload_plotting(self):
+        import plotting
+
+    @property
+    def plot_manager(self):
+        if self._plot_manager is None:
+            from plotting import PlotManager
+            self._plot_manager = PlotManager()
+        return self._plot_manager
+
     def resource(self, relative_path):
         base_path = getattr(
             sys,
@@ -68,6 +102,7 @@ class App(tk.Tk):
 
         self.calculate_button.config(state=tk.NORMAL if valid_base_data else tk.DISABLED)
         self.calculate_with_csv_button.config(state=tk.NORMAL if valid_base_data else tk.DISABLED)
+        self.series_button.config(state=tk.NORMAL if valid_base_data else tk.DISABLED)
 
         # Update feedback label
         if not valid_base_data:
@@ -78,43 +113,138 @@ class App(tk.Tk):
     def calculate_and_update_plot_with_standard(self):
         self.calculate_and_update_plot(None)
 
-    def calculate_and_update_plot(self, meteo_a: MeteoA):
-        """Generate and display the plot based on current datasets."""
-       
-        v0 = float(self.base_data_entry1.get())
-        phi0 = float(self.base_data_entry2.get())
-        temp0 = float(self.base_data_entry3.get())
-        pressure0 = float(self.base_data_entry4.get())
-        height0 = float(self.base_data_entry5.get())
-        direction = float(self.trajectory_direction_entry.get())
+    def read_shot(self):
+        """
+        Reads the base data and the direction once on the main thread.
 
+        Returns:
+        tuple: v0, phi0, temp0, pressure0, height0 and direction
+        """
+        entries = [self.base_data_entry1, self.base_data_entry2, self.base_data_entry3, self.base_data_entry4,
+                   self.base_data_entry5, self.trajectory_direction_entry]
+        return tuple(float(entry.get()) for entry in entries)
+
+    def create_job(self, meteo_a: MeteoA, v0, phi0, temp0, pressure0, height0, direction):
         environment = Environment(temp0, pressure0, height0, meteo_a)
-        projectile = Projectile(radius= 0.077, mass=42, direction=direction)
-        simulator = Simulator(environment, projectile)
-        points = simulator.calculate(v0, phi0, 0.1)
+        projectile = Projectile.from_type(DEFAULT_PROJECTILE, direction)
+        simulator = Simulator(environment, projectile, self.integrator_var.get())
+        label = "v0={},phi0={},temp0={},pressure0={},direction={}".format(v0, phi0, temp0, pressure0, direction)
+        instrumentation = self.instrumentation if self.instrumentation_var.get() else None
+        return CalculationJob(simulator, v0, phi0, 0.1, label, instrumentation)
 
-        # Extract data for plotting
-        x_values = [item.x for item in points]
-        y_values = [item.y for item in points]
-        z_values = [item.z for item in points]
+    def calculate_and_update_plot(self, meteo_a: MeteoA):
+        """Start the calculation of the shot in the background, its trajectory is plotted while it is calculated."""
+        try:
+            job = self.create_job(meteo_a, *self.read_shot())
+        except ValueError as error:
+            # E.g. a Meteo A with a repeated height, which cannot be compiled
+            self.progress_label.config(text="Fehler: " + str(error), fg="red")
+            return
+        self.meteo_a = meteo_a
+        self.submit([job])
+
+    def calculate_series(self):
+        """Calculate the shot for every elevation from the given one up to the end of the series."""
+        v0, phi0, temp0, pressure0, height0, direction = self.read_shot()
+        try:
+            last_elevation = float(self.series_end_entry.get())
+            step = float(self.series_step_entry.get())
+        except ValueError:
+            self.progress_label.config(text="Serie: Elevation bis und Schritt müssen Zahlen sein.", fg="red")
+            return
+        if step <= 0 or not phi0 <= last_elevation <= 90:
+            self.progress_label.config(text="Serie: Schritt > 0 und Elevation bis zwischen Elevation und 90°.", fg="red")
+            return
 
-        label = "v0={},phi0={},temp0={},pressure0={},direction={}".format(v0, phi0, temp0, pressure0, direction)
+        elevations = np.arange(phi0, last_elevation + step / 2, step)
+        try:
+            jobs = [self.create_job(self.meteo_a, v0, float(elevation), temp0, pressure0, height0, direction) for elevation in elevations]
+        except ValueError as error:
+            self.progress_label.config(text="Fehler: " + str(error), fg="red")
+            return
+        self.submit(jobs)
+
+    def submit(self, jobs: list):
+        for job in jobs:
+            self.running_jobs[job] = []
+            self.plot_manager.add(job, job.label)
+            self.worker.submit(job)
+
+        self.cancel_button.config(state=tk.NORMAL)
+        self.update_progress()
+        if not self.polling:
+            self.polling = True
+            self.after(POLL_INTERVAL, self.poll_worker)
+
+    def cancel_calculation(self):
+        self.worker.cancel()
+
+    def clear_plots(self):
+        self.plot_manager.clear()
+        self.plot_manager.flush()
+
+    def poll_worker(self):
+        """Apply the events of the background calculation to the plots, runs on the main thread."""
+        changed = set()
+        for event in self.worker.poll():
+            kind, job = event[0], event[1]
+            if job not in self.running_jobs:
+                continue
+            if kind == "progress":
+                self.running_jobs[job].append(event[2])
+                changed.add(job)
+                continue
+
+            if kind == "done":
+                self.update_curve(job)
+                self.plot_manager.finish(job)
+            else:
+                self.plot_manager.remove(job)
+                if kind == "error":
+                    self.progress_label.config(text="Fehler: " + event[2], fg="red")
+            changed.discard(job)
+            del self.running_jobs[job]
+            self.update_progress()
+
+        for job in changed:
+            self.update_curve(job)
+        if changed:
+            self.update_progress()
+        self.plot_manager.flush()
+
+        if self.running_jobs:
+            self.after(POLL_INTERVAL, self.poll_worker)
+        else:
+            self.polling = False
+            self.cancel_button.config(state=tk.DISABLED)
+
+    def update_curve(self, job: CalculationJob):
+        chunks = self.running_jobs[job]
+        if len(chunks) > 1:
+            chunks[:] = [np.concatenate(chunks)]
+        if chunks:
+            self.plot_manager.update(job, chunks[0])
+
+    def update_progress(self):
+        if not self.running_jobs:
+            self.progress_label.config(text="", fg="#f5f5f5")
+            return
+
+        chunks = next(iter(self.running_jobs.values()))
+        text = "Berechne {} Flugbahn(en)".format(len(self.running_jobs))
+        if chunks:
+            x, y = chunks[-1][-1, 0], chunks[-1][-1, 1]
+            text += ", aktuell x={:.0f} m, y={:.0f} m".format(x, y)
+        self.progress_label.config(text=text, fg="#f5f5f5")
+
+    def export_instrumentation(self):
+        """Write the counters and timings of the measured calculations to a .json file."""
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+        if not file_path:
+            return
 
-        x_y_figure = plt.figure("x_y")
-        plt.plot(x_values, y_values, label=label)
-        plt.title('X / Y ')
-        plt.xlabel('x /m')
-        plt.ylabel('y /m')
-        plt.legend()
-        x_y_figure.show()
-
-        x_z_figure = plt.figure("x_z")
-        plt.plot(x_values, z_values, label=label)
-        plt.title('X / Z ')
-        plt.xlabel('x /m')
-        plt.ylabel('z /m')
-        plt.legend()
-        x_z_figure.show()
+        with open(file_path, "w") as file:
+            file.write(self.instrumentation.to_json())
 
     def update_display(self):
         """Display all datasets in the editable format."""
@@ -155,12 +285,16 @@ class App(tk.Tk):
 
         self.info_repo_label = tk.Label(self, text="Repository: https://github.com/lukaskaeppeli/artillery-trajectory", font=("Helvetica", 12), fg="#f5f5f5", bg="#2e2e2e")
         self.info_repo_label.pack(side="bottom", pady=10)
-        self.info_repo_label.bind("<Button-1>", lambda e: webbrowser.open_new("https://github.com/lukaskaeppeli/artillery-trajectory"))
+        self.info_repo_label.bind("<Button-1>", lambda e: self.open_repository("https://github.com/lukaskaeppeli/artillery-trajectory"))
 
         # Revalidate inputs on changes
         for entry in [self.base_data_entry1, self.base_data_entry2, self.base_data_entry3, self.base_data_entry4, self.base_data_entry5]:
             entry.bind("<KeyRelease>", lambda e: self.validate_inputs())
 
+    def open_repository(self, url: str):
+        import webbrowser
+        webbrowser.open_new(url)
+
     def create_base_data_section(self):
         """Create the base data input section."""
         self.base_data_entry_frame = tk.Frame(self, bg="#2e2e2e")
@@ -183,12 +317,55 @@ class App(tk.Tk):
         self.base_data_entry4.insert(0, "944")
         self.base_data_entry5.insert(0, "691")
 
+        self.integrator_frame = tk.Frame(self, bg="#2e2e2e")
+        self.integrator_frame.pack()
+        tk.Label(self.integrator_frame, text="Integrationsverfahren", font=("Helvetica", 10), fg="#f5f5f5", bg="#2e2e2e").pack(side="left", padx=5)
+        self.integrator_var = tk.StringVar(self, value="rk4")
+        self.integrator_menu = tk.OptionMenu(self.integrator_frame, self.integrator_var, *INTEGRATORS)
+        self.integrator_menu.config(font=("Helvetica", 10), bg="#555555", fg="white", activebackground="#777777", activeforeground="white", borderwidth=0)
+        self.integrator_menu.pack(side="left", padx=5)
+
+        self.instrumentation_var = tk.BooleanVar(self, value=False)
+        tk.Checkbutton(self.integrator_frame, text="Messung", variable=self.instrumentation_var, font=("Helvetica", 10),
+                       fg="#f5f5f5", bg="#2e2e2e", selectcolor="#555555", activebackground="#2e2e2e",
+                       activeforeground="white").pack(side="left", padx=5)
+        self.export_instrumentation_button = tk.Button(self.integrator_frame, text="Messung exportieren", command=self.export_instrumentation,
+                                                       font=("Helvetica", 10), bg="#555555", fg="white",
+                                                       activebackground="#777777", activeforeground="white", borderwidth=0)
+        self.export_instrumentation_button.pack(side="left", padx=5)
+
         self.calculate_button = tk.Button(self, text="Berechne via Standardathmosphäre", command=self.calculate_and_update_plot_with_standard,
                                           font=("Helvetica", 12), bg="#555555", fg="white",
                                           activebackground="#777777", activeforeground="white",
                                           padx=10, pady=5, borderwidth=0, state=tk.DISABLED)
         self.calculate_button.pack(pady=10)
 
+        self.series_frame = tk.Frame(self, bg="#2e2e2e")
+        self.series_frame.pack()
+        tk.Label(self.series_frame, text="Serie: Elevation bis [°]", font=("Helvetica", 10), fg="#f5f5f5", bg="#2e2e2e").pack(side="left", padx=5)
+        self.series_end_entry = tk.Entry(self.series_frame, width=8, font=("Helvetica", 12))
+        self.series_end_entry.pack(side="left", padx=5)
+        self.series_end_entry.insert(0, "60")
+        tk.Label(self.series_frame, text="Schritt [°]", font=("Helvetica", 10), fg="#f5f5f5", bg="#2e2e2e").pack(side="left", padx=5)
+        self.series_step_entry = tk.Entry(self.series_frame, width=8, font=("Helvetica", 12))
+        self.series_step_entry.pack(side="left", padx=5)
+        self.series_step_entry.insert(0, "1")
+        self.series_button = tk.Button(self.series_frame, text="Berechne Serie", command=self.calculate_series,
+                                       font=("Helvetica", 10), bg="#555555", fg="white",
+                                       activebackground="#777777", activeforeground="white", borderwidth=0, state=tk.DISABLED)
+        self.series_button.pack(side="left", padx=5)
+        self.cancel_button = tk.Button(self.series_frame, text="Abbrechen", command=self.cancel_calculation,
+                                       font=("Helvetica", 10), bg="#555555", fg="white",
+                                       activebackground="#777777", activeforeground="white", borderwidth=0, state=tk.DISABLED)
+        self.cancel_button.pack(side="left", padx=5)
+        self.clear_button = tk.Button(self.series_frame, text="Grafiken leeren", command=self.clear_plots,
+                                      font=("Helvetica", 10), bg="#555555", fg="white",
+                                      activebackground="#777777", activeforeground="white", borderwidth=0)
+        self.clear_button.pack(side="left", padx=5)
+
+        self.progress_label = tk.Label(self, text="", font=("Helvetica", 10), fg="#f5f5f5", bg="#2e2e2e")
+        self.progress_label.pack()
+
         self.base_data_label = tk.Label(self, text="", font=("Helvetica", 12), fg="#f5f5f5", bg="#2e2e2e", wraplength=400)
         self.base_data_label.pack(pady=10)
 
@@ -216,14 +393,11 @@ class App(tk.Tk):
         if not file_path:
             return None
         
-        # Read the CSV file and store it as an array of arrays
-        data = []
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                data.append(row)
-
-        meteo_a = MeteoA(data)
+        meteo_a = self.meteo_cache.load_file(file_path)
+        if getattr(meteo_a, "error", None):
+            # No shot with a partial Meteo A
+            self.progress_label.config(text="Ungültiges Meteo A: " + meteo_a.error, fg="red")
+            return None
         return self.calculate_and_update_plot(meteo_a)
 
 
@@ -0,0 +1,201 @@
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+class Instrumentation:
+    """
+    Opt-in counters and timings of a simulation. Nothing is measured until a simulator is attached: attach replaces
+    the hot methods of the simulator, its environment, atmosphere profiles (one per station of a spatial environment)
+    and projectile with counting wrappers on these instances only, and detaching restores them. A simulator which is
+    not attached runs without any overhead.
+
+    Usage:
+        instrumentation = Instrumentation()
+        with instrumentation.attach(simulator):
+            simulator.calculate(v0, phi0, delta_t)
+        instrumentation.to_dict()
+    """
+
+    def __init__(self, step_callback=None, detailed_timing: bool = False):
+        """
+        Parameters:
+        step_callback (callable): Called as step_callback(t, point, velocity) after every step of a trajectory
+        detailed_timing (bool): Whether to time every environment lookup and drag evaluation as well. This costs
+                                two clock reads per call, so the measured total gets slower
+        """
+        self.step_callback = step_callback
+        self.detailed_timing = detailed_timing
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.spans = {} # name -> [calls, seconds]
+        self.steps_per_trajectory = []
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_span(self, name: str, seconds: float):
+        span = self.spans.setdefault(name, [0, 0.0])
+        span[0] += 1
+        span[1] += seconds
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Measures the time of a phase, e.g. "with instrumentation.span('plot'):". Nested and repeated spans of the same
+        name are summed up.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def counting(self, function, counter: str, timed: bool = False, amount=None):
+        """
+        Returns:
+        callable: The function, counting its calls (or amount(*args) per call) and optionally timing them
+        """
+        if timed:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                self.count(counter, amount(*args) if amount else 1)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.add_span(counter, time.perf_counter() - start)
+        else:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                self.count(counter, amount(*args) if amount else 1)
+                return function(*args, **kwargs)
+        return wrapper
+
+    def stepping(self, integrate):
+        """
+        Wraps the step generator of the simulator: counts the steps of each trajectory, times the integration without
+        the time spent by the consumer of the steps, and calls the step callback.
+        """
+        @wraps(integrate)
+        def wrapper(*args, **kwargs):
+            steps = 0
+            generator = integrate(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        state = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        self.add_span("integration", time.perf_counter() - start)
+                    steps += 1
+                    if self.step_callback is not None:
+                        self.step_callback(*state)
+                    yield state
+            finally:
+                generator.close()
+                self.count("trajectories")
+                self.count("steps", steps)
+                self.steps_per_trajectory.append(steps)
+        return wrapper
+
+    def timing(self, function, name: str):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def instrumenting(self, for_shot):
+        """
+        Wraps Simulator.for_shot, so the simulators of the single shots of a small batch are counted as well. They are
+        discarded after their shot and keep the wrappers. Objects they share with the batch, e.g. the environment, are
+        counted by the wrappers of the batch already.
+        """
+        @wraps(for_shot)
+        def wrapper(*args, **kwargs):
+            simulator = for_shot(*args, **kwargs)
+            for target, name, method in self.counting_patches(simulator):
+                if name not in vars(target):
+                    setattr(target, name, method)
+            return simulator
+        return wrapper
+
+    def counting_patches(self, simulator):
+        """
+        Returns:
+        list: Tuples of the object, the name of the method and its counting wrapper for the steps of the simulator and
+              the hot methods of the objects it uses
+        """
+        environment = simulator.environment
+        detailed = self.detailed_timing
+        patches = [
+            (simulator, "_integrate", self.stepping(simulator._integrate)),
+            (simulator, "iterate", self.counting(simulator.iterate, "euler_steps")),
+            (simulator, "iterate_rk4", self.counting(simulator.iterate_rk4, "rk4_steps")),
+            (simulator, "iterate_rk45", self.counting(simulator.iterate_rk45, "rk45_attempts")),
+            (environment, "get_conditions", self.counting(environment.get_conditions, "environment_lookups", detailed)),
+            (environment, "get_conditions_points", self.counting(environment.get_conditions_points, "batch_environment_lookups",
+                                                                 detailed, amount=lambda points, *_: len(points))),
+            (simulator.projectile, "derive_acceleration", self.counting(simulator.projectile.derive_acceleration, "drag_evaluations", detailed)),
+            (simulator.projectile, "derive_lateral_cw", self.counting(simulator.projectile.derive_lateral_cw, "drag_coefficient_evaluations")),
+            (simulator.projectile, "update_velocity_batch", self.counting(simulator.projectile.update_velocity_batch, "batch_drag_evaluations",
+                                                                          detailed, amount=lambda points, *_: len(points))),
+        ]
+        for profile in getattr(environment, "profiles", None) or [environment.profile]:
+            patches += [
+                (profile, "at", self.counting(profile.at, "atmosphere_evaluations")),
+                (profile, "at_batch", self.counting(profile.at_batch, "batch_atmosphere_evaluations", amount=len)),
+                (profile, "interpolate_meteo_a", self.counting(profile.interpolate_meteo_a, "meteo_interpolations")),
+            ]
+        return patches
+
+    @contextmanager
+    def attach(self, simulator):
+        """
+        Instruments the simulator and the objects it uses while the context is active.
+        """
+        patches = [
+            (simulator, "calculate", self.timing(simulator.calculate, "calculate")),
+            (simulator, "impact", self.timing(simulator.impact, "impact")),
+            (simulator, "calculate_batch", self.timing(simulator.calculate_batch, "calculate_batch")),
+            (simulator, "for_shot", self.instrumenting(simulator.for_shot)),
+        ] + self.counting_patches(simulator)
+
+        # Shadow the methods on the instances, instance attributes which were there before are put back afterwards
+        previous = []
+        for target, name, wrapper in patches:
+            previous.append((target, name, target.__dict__.get(name)))
+            setattr(target, name, wrapper)
+        try:
+            yield self
+        finally:
+            for target, name, method in reversed(previous):
+                if method is None:
+                    del target.__dict__[name]
+                else:
+                    setattr(target, name, method)
+
+    def to_dict(self):
+        """
+        Returns:
+        dict: The counters, the spans with their number of calls and total time in s, and the steps per trajectory
+        """
+        steps = self.steps_per_trajectory
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "spans": {name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in sorted(self.spans.items())},
+            "steps_per_trajectory": {
+                "count": len(steps),
+                "min": min(steps) if steps else 0,
+                "max": max(steps) if steps else 0,
+                "mean": sum(steps) / len(steps) if steps else 0,
+            },
+        }
+
+    def to_json(self, indent: int = 2):
+        return json.dumps(self.to_dict(), indent=indent)
@@ -1,8 +1,82 @@
+import csv
+import hashlib
+
+def normalize_rows(data):
+    """
+    Strips the cells and drops empty rows, as written by csv.reader for blank lines.
+    """
+    return [[cell.strip() for cell in row] for row in data if row]
+
+def content_hash(rows):
+    """
+    Parameters:
+    rows (list): The normalized rows of a Meteo A, see normalize_rows
+
+    Returns:
+    str: SHA-256 of the rows, identical for messages which only differ in whitespace or blank lines
+    """
+    return hashlib.sha256("\n".join(",".join(row) for row in rows).encode()).hexdigest()
+
+# Removes the sign and the decimal point of a formatted number, leaving its digits
+_NON_DIGITS = str.maketrans("", "", "-.")
+
+def digit_sum(number: float):
+    digits = str(number).translate(_NON_DIGITS)
+    # The code points of the digits are consecutive, starting at 48 for "0"
+    return sum(digits.encode()) - 48 * len(digits)
+
+def parse_row(row, first_row: bool = False):
+    """
+    Parses and verifies a single row of a Meteo A. Missing values (//) are only allowed in the first row, they
+    are read as 0.
+
+    Returns:
+    Measurement: The measurement, None if the checksum does not match
+
+    Raises:
+    ValueError: If a cell cannot be parsed as float
+    """
+    if first_row:
+        row = [0 if cell == "//" else cell for cell in row]
+    row = [float(cell) for cell in row]
+    if not is_row_valid(row):
+        return None
+    return Measurement(row[0], row[1], row[2], row[3])
+
+def is_row_valid(row):
+    """
+    Checks that the digits of all cells but the last one sum up to the last cell.
+    """
+    return sum(digit_sum(cell) for cell in row[:-1]) == int(row[-1])
+
 class MeteoA:
-    def __init__(self, data):
-        self.measurements = self.parse_measurements(data)
+    def __init__(self, data, known_rows: dict = None):
+        """
+        Parameters:
+        data (list): The rows of the Meteo A, optionally starting with the header row
+        known_rows (dict): Rows parsed before, e.g. of the previous message of the same station, see self.rows. Rows
+                           found in there are taken over without parsing and verifying them again
+        """
+        rows = normalize_rows(data)
+        self.content_hash = content_hash(rows)
+        self.rows = {} # (first row, cells) -> Measurement or None if the checksum failed
+        self.measurements = self.parse_measurements(rows, known_rows)
 
-    def parse_measurements(self, data):
+    @classmethod
+    def from_measurements(cls, measurements: list, content_hash: str = None, error: str = None, rows: dict = None):
+        """
+        Creates a Meteo A from already parsed measurements, e.g. from a cache. The parsed rows (see self.rows) are
+        only needed to parse the next message of the same station incrementally.
+        """
+        meteo_a = cls.__new__(cls)
+        meteo_a.content_hash = content_hash
+        meteo_a.measurements = measurements
+        meteo_a.rows = rows or {}
+        if error is not None:
+            meteo_a.error = error
+        return meteo_a
+
+    def parse_measurements(self, data, known_rows: dict = None):
         if len(data) == 0:
             self.error = "No data provided"
             return
@@ -13,33 +87,33 @@ class MeteoA:
         else:
             rows = data
         
-        rows[0] = [0 if cell == "//" else cell for cell in rows[0]]
-        try:
-            rows = [[float(cell) for cell in row] for row in rows]
-        except:
-            self.error = "Parsing error. Some data in meteo a cannot be parsed as float"
-            return
-        
+        known_rows = known_rows or {}
         measurements = []
-        for row in rows:
-            if self.is_row_valid(row):
-                measurements.append(Measurement(row[0], row[1], row[2], row[3]))
+        for index, row in enumerate(rows):
+            key = (index == 0, tuple(row))
+            if key in known_rows:
+                measurement = known_rows[key]
             else:
-                self.error = "Checksum verification failed at height: " + row[0]
+                try:
+                    measurement = parse_row(row, index == 0)
+                except ValueError:
+                    self.error = "Parsing error. Some data in meteo a cannot be parsed as float"
+                    return
+            self.rows[key] = measurement
+            if measurement is not None:
+                measurements.append(measurement)
+            else:
+                self.error = "Checksum verification failed at height: " + str(row[0])
 
-        return sorted(measurements, key=lambda item: item.height)
+        measurements = sorted(measurements, key=lambda item: item.height)
+        for lower, upper in zip(measurements, measurements[1:]):
+            if lower.height == upper.height:
+                self.error = "Duplicate height: " + str(upper.height)
+                break
+        return measurements
 
     def is_row_valid(self, row):
-        numbers_to_process = row[:-1]
-        digit_sum = 0
-
-        for cell in numbers_to_process:
-            if isinstance(cell, (int, float)) or cell.replace('.', '', 1).replace('-', '', 1).isdigit():
-                # Convert the cell to a string, iterate over each character, and sum up its digits
-                for digit in str(cell).replace('.', '').replace('-', ''):
-                    digit_sum += int(digit)
-
-        return digit_sum == int(row[-1])
+        return is_row_valid(row)
 
 class Measurement:
 
@@ -48,3 +122,18 @@ class Measurement:
         self.temperature = temperature
         self.wind_direction = wind_direction
         self.wind_velocity = wind_velocity
+
+def load_meteo_a(file_path: str):
+    """
+    Reads a Meteo A from a .csv file.
+
+    Parameters:
+    file_path (str): Path to the .csv file
+
+    Returns:
+    MeteoA: The parsed Meteo A
+    """
+    with open(file_path, 'r') as file:
+        data = [row for row in csv.reader(file)]
+
+    return MeteoA(data)
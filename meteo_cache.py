@@ -0,0 +1,207 @@
+import csv
+import glob
+import json
+import os
+import threading
+from collections import OrderedDict
+from meteo_a import MeteoA, Measurement, normalize_rows, content_hash
+
+class MeteoCache:
+    """
+    Parsed Meteo A messages keyed by the hash of their content, kept in memory with LRU eviction and optionally in a
+    directory on disk. Messages of a station are parsed incrementally: only the rows which changed since the
+    previous message of the same station are parsed and verified again. The parsed rows are stored on disk as well,
+    so this also works for the first new message after a restart.
+    """
+
+    def __init__(self, max_entries: int = 128, directory: str = None):
+        """
+        Parameters:
+        max_entries (int): Number of parsed messages kept in memory
+        directory (str): Directory for parsed messages shared between processes and runs, None to keep them in memory only
+        """
+        self.entries = OrderedDict() # content hash -> MeteoA
+        self.max_entries = max_entries
+        self.directory = directory
+        self.files = {} # path -> (modification time, size, content hash)
+        self.stations = {} # station -> rows of the latest message, see MeteoA.rows
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.parsed_rows = 0
+        self.reused_rows = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, data: list, station: str = None):
+        """
+        Parameters:
+        data (list): The rows of the Meteo A as read by csv.reader
+        station (str): Name of the station, the rows of its previous message are reused while parsing
+
+        Returns:
+        MeteoA: The parsed Meteo A, shared between all callers asking for the same content
+        """
+        rows = normalize_rows(data)
+        key = content_hash(rows)
+        with self.lock:
+            meteo_a = self.lookup(key)
+            if meteo_a is None:
+                self.misses += 1
+                known_rows = self.stations.get(station) if station is not None else None
+                meteo_a = MeteoA(rows, known_rows)
+                reused = sum(1 for row in meteo_a.rows if known_rows and row in known_rows)
+                self.reused_rows += reused
+                self.parsed_rows += len(meteo_a.rows) - reused
+                self.store(key, meteo_a)
+
+            if station is not None and meteo_a.rows:
+                self.stations[station] = meteo_a.rows
+            return meteo_a
+
+    def lookup(self, key: str):
+        meteo_a = self.entries.get(key)
+        if meteo_a is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return meteo_a
+
+        if self.directory is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, key + ".json"), "r") as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        measurements = None
+        if stored["measurements"] is not None:
+            measurements = [Measurement(*values) for values in stored["measurements"]]
+        # Entries written before the rows were stored have none, the next message is then parsed in full
+        rows = {(first_row, tuple(cells)): Measurement(*values) if values is not None else None
+                for first_row, cells, values in stored.get("rows", [])}
+        meteo_a = MeteoA.from_measurements(measurements, key, stored["error"], rows)
+        self.disk_hits += 1
+        self.remember(key, meteo_a)
+        return meteo_a
+
+    def store(self, key: str, meteo_a: MeteoA):
+        self.remember(key, meteo_a)
+        if self.directory is None:
+            return
+
+        def values(m):
+            return [m.height, m.temperature, m.wind_direction, m.wind_velocity] if m is not None else None
+
+        measurements = None
+        if meteo_a.measurements is not None:
+            measurements = [values(m) for m in meteo_a.measurements]
+        rows = [[first_row, list(cells), values(m)] for (first_row, cells), m in meteo_a.rows.items()]
+        path = os.path.join(self.directory, key + ".json")
+        # Write to a temporary file first, so that concurrent readers never see a partial entry
+        temporary_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary_path, "w") as file:
+            json.dump({"measurements": measurements, "error": getattr(meteo_a, "error", None), "rows": rows}, file)
+        os.replace(temporary_path, path)
+
+    def remember(self, key: str, meteo_a: MeteoA):
+        self.entries[key] = meteo_a
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def load_file(self, file_path: str, station: str = None):
+        """
+        Reads a Meteo A from a .csv file. An unchanged file (same modification time and size) is neither read nor
+        hashed again.
+
+        Parameters:
+        file_path (str): Path to the .csv file
+        station (str): Name of the station, see get
+
+        Returns:
+        MeteoA: The parsed Meteo A
+        """
+        status = os.stat(file_path)
+        with self.lock:
+            known = self.files.get(file_path)
+            if known is not None and known[:2] == (status.st_mtime, status.st_size) and known[2] in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(known[2])
+                return self.entries[known[2]]
+
+        with open(file_path, "r", newline="") as file:
+            data = [row for row in csv.reader(file)]
+        meteo_a = self.get(data, station)
+        with self.lock:
+            self.files[file_path] = (status.st_mtime, status.st_size, meteo_a.content_hash)
+        return meteo_a
+
+    def load_directory(self, directory: str, pattern: str = "*.csv"):
+        """
+        Reads all Meteo A files of a directory. The name of each file (without extension) is taken as its station,
+        so loading the directory again after new messages arrived only parses the changed rows.
+
+        Parameters:
+        directory (str): The directory
+        pattern (str): Pattern of the file names
+
+        Returns:
+        dict: Station -> MeteoA, check the error attribute of each Meteo A for invalid messages
+        """
+        results = {}
+        for file_path in sorted(glob.glob(os.path.join(directory, pattern))):
+            station = os.path.splitext(os.path.basename(file_path))[0]
+            results[station] = self.load_file(file_path, station)
+        return results
+
+    def load_stream(self, file, station: str = None):
+        """
+        Reads consecutive Meteo A messages from a stream of .csv rows. A message ends at a blank line or where the
+        header row (HOEHE) of the next message starts.
+
+        Parameters:
+        file (file): The opened stream
+        station (str): Name of the station, consecutive messages are parsed incrementally
+
+        Yields:
+        MeteoA: The parsed Meteo A of each message
+        """
+        message = []
+        for row in csv.reader(file):
+            starts_message = bool(row) and row[0].strip() == "HOEHE"
+            if (not row or starts_message) and message:
+                yield self.get(message, station)
+                message = []
+            if row:
+                message.append(row)
+        if message:
+            yield self.get(message, station)
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "parsed_rows": self.parsed_rows,
+            "reused_rows": self.reused_rows,
+        }
+
+def changed_heights(previous: MeteoA, current: MeteoA):
+    """
+    Compares two Meteo A messages row by row.
+
+    Returns:
+    list: The sorted heights in m whose measurements were added, removed or changed
+    """
+    def by_height(meteo_a):
+        if meteo_a is None or meteo_a.measurements is None:
+            return {}
+        return {m.height: (m.temperature, m.wind_direction, m.wind_velocity) for m in meteo_a.measurements}
+
+    before = by_height(previous)
+    after = by_height(current)
+    return sorted(height for height in before.keys() | after.keys() if before.get(height) != after.get(height))
@@ -0,0 +1,23 @@
+from collections import deque
+
+def submit_bounded(executor, function, tasks, window: int):
+    """
+    Submits the tasks to the executor with at most window of them in flight and yields their results in order,
+    so finished results do not pile up in memory. The tasks are consumed lazily and may be a generator.
+
+    Parameters:
+    executor (Executor): The executor
+    function (callable): The function to run for every task
+    tasks (iterable): The arguments of each call as tuples
+    window (int): Maximum number of submitted but not yet yielded tasks
+
+    Yields:
+    The results of the calls, in the order of the tasks
+    """
+    pending = deque()
+    for arguments in tasks:
+        pending.append(executor.submit(function, *arguments))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,221 @@
+import matplotlib.pyplot as plt
+import numpy as np
+
+# Figure name, title, label of the vertical axis and column of the points shown on it
+VIEWS = (
+    ("x_y", "X / Y ", "y /m", 1),
+    ("x_z", "X / Z ", "z /m", 2),
+)
+# Above this number of curves the legend is hidden, it would cover the plot and is slow to lay out
+LEGEND_LIMIT = 10
+# Relative headroom added when a growing curve leaves the axes, so the limits do not change on every update
+HEADROOM = 0.1
+
+def decimate(x: np.ndarray, y: np.ndarray, max_points: int):
+    """
+    Reduces a curve to about max_points points without visible difference at that resolution. The points are split
+    into buckets of consecutive points, each bucket keeps its first, last, lowest and highest point. The first point,
+    the apex and the last point (the impact) are always kept.
+
+    Parameters:
+    x, y (np.ndarray): The coordinates of the curve
+    max_points (int): The number of points to keep at most, about twice the width of the axes in pixels
+
+    Returns:
+    np.ndarray: The sorted indices of the points to keep
+    """
+    count = len(x)
+    if count <= max_points:
+        return np.arange(count)
+
+    buckets = max(max_points // 4, 1)
+    size = -(-count // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:count] = y
+    rows = padded.reshape(buckets, size)
+    starts = np.arange(buckets) * size
+    # The last bucket may be partly padded, all buckets contain at least one point
+    starts = starts[starts < count]
+    rows = rows[:len(starts)]
+
+    indices = np.concatenate([
+        starts,
+        np.minimum(starts + size - 1, count - 1),
+        starts + np.nanargmin(rows, axis=1),
+        starts + np.nanargmax(rows, axis=1),
+        [0, int(np.argmax(y)), count - 1],
+    ])
+    return np.unique(indices)
+
+class Curve:
+
+    def __init__(self, label: str):
+        self.label = label
+        self.points = np.empty((0, 3))
+        self.lines = {} # figure name -> Line2D
+        self.finished = False
+
+class PlotManager:
+    """
+    Draws trajectories into two figures (x/y and x/z) which are created once and reused. Every curve is decimated to
+    the resolution of the axes. Curves which are still being calculated are animated: an update only restores the
+    cached background and draws these curves on top (blitting). The background, which contains all finished curves,
+    is only redrawn when a curve is finished or removed, or when the limits of the axes have to grow.
+    """
+
+    def __init__(self, legend_limit: int = LEGEND_LIMIT):
+        self.legend_limit = legend_limit
+        self.curves = {} # key -> Curve
+        self.axes = {} # figure name -> Axes
+        self.backgrounds = {} # figure name -> background of the last full draw
+        self.limits = {} # figure name -> [x min, x max, y min, y max]
+        self.stale = set() # figure names which need a full draw
+
+    def get_axes(self, name: str):
+        """
+        Returns the axes of the figure, creating the figure if it does not exist yet or has been closed. The curves
+        are added again to a new figure.
+        """
+        axes = self.axes.get(name)
+        if axes is not None and plt.fignum_exists(name):
+            return axes
+
+        _, title, ylabel, _ = next(view for view in VIEWS if view[0] == name)
+        figure = plt.figure(name)
+        figure.clear()
+        axes = figure.add_subplot()
+        axes.set_title(title)
+        axes.set_xlabel('x /m')
+        axes.set_ylabel(ylabel)
+        figure.canvas.mpl_connect("draw_event", lambda event, name=name: self.on_draw(name))
+        self.axes[name] = axes
+        self.backgrounds.pop(name, None)
+        self.limits.pop(name, None)
+        self.stale.add(name)
+
+        for curve in self.curves.values():
+            curve.lines.pop(name, None)
+            self.update_line(name, curve)
+        figure.show()
+        return axes
+
+    def max_points(self, axes):
+        return max(2 * int(axes.get_window_extent().width), 100)
+
+    def update_line(self, name: str, curve: Curve):
+        axes = self.get_axes(name)
+        column = next(view[3] for view in VIEWS if view[0] == name)
+        x = curve.points[:, 0]
+        y = curve.points[:, column]
+        if len(x) == 0:
+            return
+
+        line = curve.lines.get(name)
+        if line is None:
+            line = axes.plot([], [], label=curve.label, animated=not curve.finished)[0]
+            curve.lines[name] = line
+        indices = decimate(x, y, self.max_points(axes))
+        line.set_data(x[indices], y[indices])
+        self.include(name, x, y)
+
+    def include(self, name: str, x: np.ndarray, y: np.ndarray):
+        """
+        Grows the limits of the axes if the points are outside of them.
+        """
+        x_min, x_max, y_min, y_max = float(x.min()), float(x.max()), float(y.min()), float(y.max())
+        limits = self.limits.get(name)
+        if limits is not None and limits[0] <= x_min and x_max <= limits[1] and limits[2] <= y_min and y_max <= limits[3]:
+            return
+
+        if limits is not None:
+            x_min, x_max = min(x_min, limits[0]), max(x_max, limits[1])
+            y_min, y_max = min(y_min, limits[2]), max(y_max, limits[3])
+        x_margin = (x_max - x_min) * HEADROOM or 1
+        y_margin = (y_max - y_min) * HEADROOM or 1
+        self.limits[name] = [x_min - x_margin, x_max + x_margin, y_min - y_margin, y_max + y_margin]
+        axes = self.axes[name]
+        axes.set_xlim(self.limits[name][0], self.limits[name][1])
+        axes.set_ylim(self.limits[name][2], self.limits[name][3])
+        self.stale.add(name)
+
+    def add(self, key, label: str):
+        self.curves[key] = Curve(label)
+
+    def update(self, key, points: np.ndarray):
+        """
+        Replaces the points of a curve which is still being calculated.
+
+        Parameters:
+        key: The key of the curve given to add
+        points (np.ndarray): All points of the curve so far, shape (n, 3) with the columns x, y and z
+        """
+        curve = self.curves[key]
+        curve.points = points
+        for name, *_ in VIEWS:
+            self.update_line(name, curve)
+
+    def finish(self, key):
+        """
+        Moves a completed curve into the background.
+        """
+        curve = self.curves[key]
+        curve.finished = True
+        for name, line in curve.lines.items():
+            line.set_animated(False)
+            self.stale.add(name)
+
+    def remove(self, key):
+        curve = self.curves.pop(key)
+        for name, line in curve.lines.items():
+            line.remove()
+            self.stale.add(name)
+
+    def clear(self):
+        """
+        Removes all finished curves, the curves still being calculated are kept.
+        """
+        for key in [key for key, curve in self.curves.items() if curve.finished]:
+            self.remove(key)
+        if not self.curves:
+            self.limits.clear()
+
+    def update_legend(self, name: str):
+        axes = self.axes[name]
+        labelled = [curve.lines[name] for curve in self.curves.values() if curve.finished and name in curve.lines]
+        if 0 < len(labelled) <= self.legend_limit:
+            axes.legend(handles=labelled)
+        elif axes.get_legend() is not None:
+            axes.get_legend().remove()
+
+    def on_draw(self, name: str):
+        """
+        Called after every full draw of a figure, which leaves out the animated curves. Keeps the result as background
+        and draws the animated curves on top.
+        """
+        canvas = self.axes[name].figure.canvas
+        self.backgrounds[name] = canvas.copy_from_bbox(self.axes[name].figure.bbox)
+        self.blit(name)
+
+    def blit(self, name: str):
+        axes = self.axes[name]
+        canvas = axes.figure.canvas
+        canvas.restore_region(self.backgrounds[name])
+        for curve in self.curves.values():
+            line = curve.lines.get(name)
+            if line is not None and not curve.finished:
+                axes.draw_artist(line)
+        canvas.blit(axes.figure.bbox)
+
+    def flush(self):
+        """
+        Shows all changes since the previous flush, call it once after a batch of updates.
+        """
+        for name, *_ in VIEWS:
+            if name not in self.axes:
+                continue
+            if name in self.stale or name not in self.backgrounds:
+                self.update_legend(name)
+                self.axes[name].figure.canvas.draw_idle()
+            else:
+                self.blit(name)
+        self.stale.clear()
@@ -1,15 +1,55 @@
 from geometry import Point, Velocity, Acceleration
+from drag import DragTable, DragTableStack, ProjectileType, STANDARD_DRAG_TABLE, get_projectile_type
 from environment import Environment
 from math import sin, cos, pi, sqrt
+import numpy as np
 
 class Projectile:
-    def __init__(self, radius: float, mass: float, direction: float):
+    def __init__(self, radius: float, mass: float, direction: float, drag_table: DragTable = STANDARD_DRAG_TABLE,
+                 axial_drag_coefficient: float = 1.2, axial_cross_sectional_area: float = 0.125):
         self.radius = radius
         self.mass = mass
         self.lateral_cross_sectional_area = pi * radius**2
-        self.axial_cross_sectional_area = 0.125 # TODO: Just an estimate
+        self.axial_cross_sectional_area = axial_cross_sectional_area # TODO: The default is just an estimate
+        self.axial_drag_coefficient = axial_drag_coefficient
+        self.drag_table = drag_table
         self.direction = direction
 
+    @classmethod
+    def from_type(cls, name: str, direction: float, radius: float = None, mass: float = None):
+        """
+        Creates a projectile of a type registered in drag, see drag.get_projectile_type and of_type.
+        """
+        return cls.of_type(get_projectile_type(name), direction, radius, mass)
+
+    @classmethod
+    def of_type(cls, projectile_type: ProjectileType, direction: float, radius: float = None, mass: float = None):
+        """
+        Creates a projectile of a type, e.g. in a worker process which does not know the registry.
+
+        Parameters:
+        projectile_type (ProjectileType): The type
+        direction (float): Direction of fire in Azimute
+        radius, mass (float): Override the values of the type, e.g. for perturbed shots
+        """
+        return cls(projectile_type.radius if radius is None else radius, projectile_type.mass if mass is None else mass, direction,
+                   projectile_type.drag_table, projectile_type.axial_drag_coefficient, projectile_type.axial_cross_sectional_area)
+
+    def with_direction(self, direction: float):
+        """
+        Returns:
+        Projectile: A new projectile with the same properties, fired in the given direction
+        """
+        return Projectile(self.radius, self.mass, direction, self.drag_table, self.axial_drag_coefficient, self.axial_cross_sectional_area)
+
+    def fingerprint(self):
+        """
+        Returns:
+        tuple: All properties which determine the trajectory apart from the direction, e.g. for caches
+        """
+        numbers = (self.radius, self.mass, self.axial_drag_coefficient, self.axial_cross_sectional_area)
+        return tuple(float(number) + 0.0 for number in numbers) + (self.drag_table.fingerprint(),)
+
     def update_velocity(self, point: Point, velocity: Velocity, environment: Environment, delta_t: float):
         """
         Calculates the resulting velocity vector based on air resistance and wind
@@ -24,56 +64,60 @@ class Projectile:
         Velocity: The resulting velocity vector
         """
 
-        air_density = environment.get_air_density(point)
-        wind_direction, wind_velocity = environment.get_wind(point)
+        # Update the velocity using: v_new = v_old + a * delta_t
+        return velocity.fma(self.derive_acceleration(point, velocity, environment), delta_t)
 
-        angle_relative = (wind_direction - self.direction) * (2 * pi / 6400)
-        wind_relative = Velocity(wind_velocity * cos(angle_relative), 0, wind_velocity * sin(angle_relative))
+    def derive_acceleration(self, point: Point, velocity: Velocity, environment: Environment):
+        """
+        Calculates the acceleration caused by air resistance and wind
+
+        Parameters:
+        point (Point): Current position of the projectile
+        velocity (Velocity): Current velocity of the projectile
+        environment (Environment): The environment
+
+        Returns:
+        Acceleration: The acceleration due to drag, without gravity
+        """
+
+        conditions = environment.get_conditions(point)
+        air_density = conditions.density
 
-        velocity_absolute = velocity - wind_relative
+        # The arithmetic is done on plain floats, only the resulting acceleration is allocated
+        angle_relative = (conditions.wind_direction - self.direction) * (2 * pi / 6400)
+        velocity_absolute_x = velocity.x - conditions.wind_velocity * cos(angle_relative)
+        velocity_absolute_y = velocity.y
+        velocity_absolute_z = velocity.z - conditions.wind_velocity * sin(angle_relative)
 
-        speed = sqrt(velocity_absolute.x ** 2 + velocity_absolute.y ** 2) # Ignore z axis for now
+        speed = sqrt(velocity_absolute_x ** 2 + velocity_absolute_y ** 2) # Ignore z axis for now
         
         # If the speed is zero, the object isn't moving, and there's no drag force
         if speed == 0:
-            return velocity
+            return Acceleration(0, 0, 0)
         
-        # Lateral part        
-        lateral_drag_coefficient = self.derive_lateral_cw(speed, environment, point)
+        # Lateral part, opposite to the direction of the velocity
+        lateral_drag_coefficient = self.derive_lateral_cw(speed, conditions.speed_of_sound)
         lateral_acceleration_magnitude = self.derive_drag_force_magnitude(air_density, speed, lateral_drag_coefficient, self.lateral_cross_sectional_area) / self.mass
-        lateral_drag_direction = velocity * -1 / speed  # Negative sign to indicate the opposite direction
+        lateral_factor = -lateral_acceleration_magnitude / speed
 
         # Axial part
-        axial_drag_coefficient = 1.2
-        axial_acceleration_magnitude = self.derive_drag_force_magnitude(air_density, velocity_absolute.z, axial_drag_coefficient, self.axial_cross_sectional_area) / self.mass
-        axial_drag_direction = Acceleration(0, 0, 1) if velocity_absolute.z < 0 else Acceleration(0, 0, -1)
+        axial_acceleration_magnitude = self.derive_drag_force_magnitude(air_density, velocity_absolute_z, self.axial_drag_coefficient, self.axial_cross_sectional_area) / self.mass
+        axial_acceleration = axial_acceleration_magnitude if velocity_absolute_z < 0 else -axial_acceleration_magnitude
         
-        acceleration = (lateral_drag_direction * lateral_acceleration_magnitude) + (axial_drag_direction * axial_acceleration_magnitude)
-
-        # Update the velocity using: v_new = v_old + a * delta_t
-        new_velocity = velocity + acceleration * delta_t
+        return Acceleration(velocity.x * lateral_factor, velocity.y * lateral_factor, velocity.z * lateral_factor + axial_acceleration)
 
-        return new_velocity
-
-    def derive_lateral_cw(self, speed: float, environment: Environment, point: Point):
+    def derive_lateral_cw(self, speed: float, speed_of_sound: float):
         """
-        Derives the drag coefficient cw as described in Regl. 55.210 1.3.1
+        Derives the drag coefficient cw from the drag table of the projectile, by default the curve of Regl. 55.210 1.3.1
 
         Parameters:
         speed (float): Current velocity of the projectile
-        environment (Environment): Meteorogical environment
-        point (Point): The point at which the cw should be derived for
+        speed_of_sound (float): Speed of sound at the position of the projectile
 
         Returns:
         float: the drag coefficient cw
         """
-        speed_of_sound = environment.get_speed_of_sound(point)
-        mach = speed / speed_of_sound
-        if mach < 0.8:
-            return 0.14
-        elif mach > 1.2:
-            return -0.15 * mach + 0.57
-        return -0.36 + mach * 0.625
+        return self.drag_table.at(speed / speed_of_sound)
     
     def derive_drag_force_magnitude(self, air_density: float, speed: float, drag_coefficient: float, area: float):
         """
@@ -89,3 +133,113 @@ class Projectile:
         float: The resulting drag force magnitude
         """
         return 0.5 * air_density * speed**2 * drag_coefficient * area
+
+    def update_velocity_batch(self, points: np.ndarray, velocities: np.ndarray, directions: np.ndarray, environment: Environment, delta_t: float,
+                              shots: np.ndarray = None):
+        """
+        Vectorized variant of update_velocity which advances many projectiles at once
+
+        Parameters:
+        points (np.ndarray): Current positions of the projectiles, shape (n, 3)
+        velocities (np.ndarray): Current velocities of the projectiles, shape (n, 3)
+        directions (np.ndarray): Direction of fire of each projectile in Azimute, shape (n,)
+        environment (Environment): The environment
+        delta_t (float): Number of seconds to iterate
+        shots (np.ndarray): Indices of the projectiles among all shots of the batch, only used by ProjectileMix
+
+        Returns:
+        np.ndarray: The resulting velocity vectors, shape (n, 3)
+        """
+        mass, lateral_cross_sectional_area, axial_drag_coefficient, axial_cross_sectional_area = self.select(shots)
+        conditions = environment.get_conditions_points(points, directions)
+        air_density = conditions.density
+
+        angle_relative = (conditions.wind_direction - directions) * (2 * pi / 6400)
+        velocity_absolute_x = velocities[:, 0] - conditions.wind_velocity * np.cos(angle_relative)
+        velocity_absolute_y = velocities[:, 1]
+        velocity_absolute_z = velocities[:, 2] - conditions.wind_velocity * np.sin(angle_relative)
+
+        speed = np.sqrt(velocity_absolute_x ** 2 + velocity_absolute_y ** 2) # Ignore z axis for now
+        moving = speed != 0
+        safe_speed = np.where(moving, speed, 1.0)
+
+        # Lateral part
+        lateral_drag_coefficient = self.derive_lateral_cw_batch(speed, conditions.speed_of_sound, shots)
+        lateral_acceleration_magnitude = self.derive_drag_force_magnitude(air_density, speed, lateral_drag_coefficient, lateral_cross_sectional_area) / mass
+        acceleration = velocities * (-lateral_acceleration_magnitude / safe_speed)[:, np.newaxis]
+
+        # Axial part
+        axial_acceleration_magnitude = self.derive_drag_force_magnitude(air_density, velocity_absolute_z, axial_drag_coefficient, axial_cross_sectional_area) / mass
+        acceleration[:, 2] += np.where(velocity_absolute_z < 0, axial_acceleration_magnitude, -axial_acceleration_magnitude)
+
+        # Projectiles without relative speed experience no drag, see update_velocity
+        acceleration[~moving] = 0
+
+        return velocities + acceleration * delta_t
+
+    def select(self, shots: np.ndarray = None):
+        """
+        Returns:
+        The mass, lateral cross sectional area, axial drag coefficient and axial cross sectional area of the shots
+        """
+        return self.mass, self.lateral_cross_sectional_area, self.axial_drag_coefficient, self.axial_cross_sectional_area
+
+    def derive_lateral_cw_batch(self, speeds: np.ndarray, speeds_of_sound: np.ndarray, shots: np.ndarray = None):
+        """
+        Vectorized variant of derive_lateral_cw
+
+        Parameters:
+        speeds (np.ndarray): Current velocities of the projectiles
+        speeds_of_sound (np.ndarray): Speed of sound at the positions of the projectiles
+        shots (np.ndarray): Indices of the projectiles among all shots of the batch, only used by ProjectileMix
+
+        Returns:
+        np.ndarray: the drag coefficients cw
+        """
+        return self.drag_table.at_batch(speeds / speeds_of_sound)
+
+class ProjectileMix(Projectile):
+    """
+    Projectiles of different types fired in one batch, see Simulator.calculate_batch. The properties are arrays with
+    one entry per shot and the drag tables are stacked, so all shots are advanced together without a branch per type.
+    """
+
+    def __init__(self, projectiles: list):
+        """
+        Parameters:
+        projectiles (list): One Projectile per shot
+        """
+        tables = []
+        rows = []
+        for projectile in projectiles:
+            if not any(table is projectile.drag_table for table in tables):
+                tables.append(projectile.drag_table)
+            rows.append(next(row for row, table in enumerate(tables) if table is projectile.drag_table))
+
+        def values(name):
+            return np.array([getattr(projectile, name) for projectile in projectiles], dtype=float)
+
+        # The drag tables of the shots are stacked in drag_tables, there is no single one
+        super().__init__(values("radius"), values("mass"), values("direction"), None, values("axial_drag_coefficient"),
+                         values("axial_cross_sectional_area"))
+        self.projectiles = projectiles
+        self.drag_tables = DragTableStack(tables)
+        self.rows = np.array(rows)
+
+    def fingerprint(self):
+        return tuple(projectile.fingerprint() for projectile in self.projectiles)
+
+    def select(self, shots: np.ndarray = None):
+        if shots is None:
+            return super().select()
+        return self.mass[shots], self.lateral_cross_sectional_area[shots], self.axial_drag_coefficient[shots], self.axial_cross_sectional_area[shots]
+
+    def derive_lateral_cw_batch(self, speeds: np.ndarray, speeds_of_sound: np.ndarray, shots: np.ndarray = None):
+        rows = self.rows if shots is None else self.rows[shots]
+        return self.drag_tables.at_batch(speeds / speeds_of_sound, rows)
+
+    def update_velocity(self, point: Point, velocity: Velocity, environment: Environment, delta_t: float):
+        raise TypeError("A mix of projectiles can only be simulated in a batch, see Simulator.calculate_batch")
+
+    def derive_acceleration(self, point: Point, velocity: Velocity, environment: Environment):
+        raise TypeError("A mix of projectiles can only be simulated in a batch, see Simulator.calculate_batch")
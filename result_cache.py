@@ -0,0 +1,150 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from simulator import Simulator
+from trajectory import Trajectory
+import numpy as np
+
+# Part of every key, increase it whenever a change of the model alters the results, so stored trajectories of older
+# versions are not used anymore
+MODEL_VERSION = 2
+
+class TrajectoryCache:
+    """
+    Memoizes Simulator.calculate. Trajectories are kept in memory with LRU eviction bounded by their size, and
+    optionally stored on disk as one .npy file per key so they survive restarts.
+
+    The cached trajectories are shared between all callers and read-only.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, directory: str = None):
+        """
+        Parameters:
+        max_bytes (int): Size of the trajectories kept in memory
+        directory (str): Directory for the stored trajectories, None to keep them in memory only
+        """
+        self.entries = OrderedDict() # key -> Trajectory
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(simulator: Simulator, v0: float, phi0: float, delta_t: float):
+        """
+        Returns:
+        tuple: All inputs which determine the trajectory, None if the environment cannot be identified (e.g. a
+               perturbed copy of a Meteo A) and the shot therefore cannot be cached
+        """
+        environment = simulator.environment.fingerprint()
+        if environment is None:
+            return None
+
+        projectile = simulator.projectile
+        # Adding 0.0 maps -0.0 to 0.0
+        numbers = (v0, phi0, delta_t, simulator.tolerance, simulator.impact_height, projectile.direction)
+        return (MODEL_VERSION, simulator.integrator, environment, projectile.fingerprint()) + tuple(float(number) + 0.0 for number in numbers)
+
+    def calculate(self, simulator: Simulator, v0: float, phi0: float, delta_t: float):
+        """
+        Returns the trajectory of simulator.calculate(v0, phi0, delta_t), computed at most once per key.
+        """
+        key = self.key(simulator, v0, phi0, delta_t)
+        if key is None:
+            with self.lock:
+                self.uncacheable += 1
+            return simulator.calculate(v0, phi0, delta_t)
+
+        trajectory = self.get(key)
+        if trajectory is None:
+            trajectory = simulator.calculate(v0, phi0, delta_t)
+            self.put(key, trajectory)
+        return trajectory
+
+    def get(self, key: tuple):
+        """
+        Returns:
+        Trajectory: The cached trajectory from memory or disk, None if it has not been calculated yet
+        """
+        with self.lock:
+            trajectory = self.entries.get(key)
+            if trajectory is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return trajectory
+
+        trajectory = self.load(key)
+        if trajectory is None:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.disk_hits += 1
+        trajectory.data.flags.writeable = False
+        self.remember(key, trajectory)
+        return trajectory
+
+    def put(self, key: tuple, trajectory: Trajectory):
+        """
+        Adds a trajectory calculated elsewhere, e.g. step by step, under the key of its inputs.
+        """
+        self.save(key, trajectory)
+        trajectory.data.flags.writeable = False
+        self.remember(key, trajectory)
+
+    def remember(self, key: tuple, trajectory: Trajectory):
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries[key].data.nbytes
+            self.entries[key] = trajectory
+            self.bytes += trajectory.data.nbytes
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.data.nbytes
+
+    def path(self, key: tuple):
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest() + ".npy")
+
+    def load(self, key: tuple):
+        if self.directory is None:
+            return None
+        try:
+            data = np.load(self.path(key))
+        except (OSError, ValueError):
+            return None
+        return Trajectory.from_array(data)
+
+    def save(self, key: tuple, trajectory: Trajectory):
+        if self.directory is None:
+            return
+        path = self.path(key)
+        # Write to a temporary file first, so that concurrent readers never see a partial trajectory
+        temporary_path = "{}.{}.tmp.npy".format(path[:-4], os.getpid())
+        np.save(temporary_path, trajectory.data)
+        os.replace(temporary_path, path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        requests = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "uncacheable": self.uncacheable,
+            "hit_rate": (self.hits + self.disk_hits) / requests if requests else 0,
+        }
@@ -0,0 +1,164 @@
+from concurrent.futures import ProcessPoolExecutor
+from math import nan
+import os
+from drag import DEFAULT_PROJECTILE, ProjectileType, get_projectile_type
+from environment import Environment
+from meteo_a import Measurement, MeteoA
+from parallel import submit_bounded
+from projectile import Projectile
+from simulator import Simulator
+import numpy as np
+
+OUTPUTS = ("x", "z", "time_of_flight")
+# Half width of the central differences per input, in the units of the input
+DEFAULT_STEPS = {
+    "v0": 1.0, # m/s
+    "phi0": 0.01, # °
+    "temp0": 1.0, # °C
+    "pressure0": 1.0, # hPa
+    "height0": 1.0, # m
+    "direction": 1.0, # Azimute
+    "temperature": 1.0, # °C, of a Meteo A row
+    "wind_direction": 1.0, # hundreds of Azimute, of a Meteo A row
+    "wind_velocity": 1.0, # m/s, of a Meteo A row
+}
+GROUND_INPUTS = ("v0", "phi0", "temp0", "pressure0", "height0", "direction")
+METEO_FIELDS = ("temperature", "wind_direction", "wind_velocity")
+
+class Sensitivity:
+    """
+    Jacobian of the impact (range x, deflection z and time of flight) with respect to the inputs of a shot, computed
+    with central differences around the nominal shot.
+    """
+
+    def __init__(self, parameters: list, nominal: np.ndarray, jacobian: np.ndarray, steps: dict):
+        self.parameters = parameters # Names of the inputs, meteo rows as "meteo[<height>].<field>"
+        self.nominal = nominal # x, z and time of flight of the nominal shot
+        self.jacobian = jacobian # Shape (3, parameters), rows ordered as in OUTPUTS
+        self.steps = steps # Half width of the difference per parameter
+
+    def derivative(self, output: str, parameter: str):
+        """
+        Returns:
+        float: The change of the output (x, z or time_of_flight) per unit of the parameter
+        """
+        return float(self.jacobian[OUTPUTS.index(output), self.parameters.index(parameter)])
+
+    def predict(self, deltas: dict):
+        """
+        Applies changes of the inputs linearly instead of simulating again.
+
+        Parameters:
+        deltas (dict): Parameter name -> change in the unit of the parameter
+
+        Returns:
+        dict: Predicted x, z and time of flight
+        """
+        change = np.zeros(len(self.parameters))
+        for parameter, delta in deltas.items():
+            change[self.parameters.index(parameter)] = delta
+        return dict(zip(OUTPUTS, (self.nominal + self.jacobian @ change).tolist()))
+
+    def to_dict(self):
+        return {
+            "nominal": dict(zip(OUTPUTS, self.nominal.tolist())),
+            "jacobian": {output: dict(zip(self.parameters, row.tolist())) for output, row in zip(OUTPUTS, self.jacobian)},
+            "steps": self.steps,
+        }
+
+def meteo_parameter(height: float, field: str):
+    return "meteo[{:g}].{}".format(height, field)
+
+def perturb_row(meteo_a: MeteoA, row: int, field: str, delta: float):
+    measurements = list(meteo_a.measurements)
+    measurement = measurements[row]
+    values = {name: getattr(measurement, name) for name in ("height",) + METEO_FIELDS}
+    values[field] += delta
+    measurements[row] = Measurement(**values)
+    return MeteoA.from_measurements(measurements)
+
+def simulate_impacts(cases: list, projectile_type: ProjectileType, radius: float, mass: float, impact_height: float, integrator: str,
+                     tolerance: float, delta_t: float):
+    """
+    Simulates the impact of a list of shots. Runs in a worker process.
+
+    Parameters:
+    cases (list): Tuples of v0, phi0, temp0, pressure0, height0, direction and Meteo A
+    projectile_type (ProjectileType): The projectile, radius and mass override its values if not None
+
+    Returns:
+    np.ndarray: Impact x, impact z and time of flight of each shot, nan where the impact height is not reached
+    """
+    impacts = np.empty((len(cases), len(OUTPUTS)))
+    for index, (v0, phi0, temp0, pressure0, height0, direction, meteo_a) in enumerate(cases):
+        environment = Environment(temp0, pressure0, height0, meteo_a)
+        simulator = Simulator(environment, Projectile.of_type(projectile_type, direction, radius, mass), integrator, tolerance, impact_height)
+        impact = simulator.impact(v0, phi0, delta_t)
+        impacts[index] = (impact.point.x, impact.point.z, impact.time_of_flight) if impact.reached else (nan, nan, nan)
+    return impacts
+
+def impact_jacobian(v0: float, phi0: float, temp0: float, pressure0: float, height0: float, direction: float, meteo_a: MeteoA = None,
+                    projectile: str = DEFAULT_PROJECTILE, radius: float = None, mass: float = None, impact_height: float = 0, integrator: str = "rk4",
+                    delta_t: float = 0.05, tolerance: float = 1e-6, steps: dict = None, workers: int = None, chunk_size: int = 8):
+    """
+    Computes the Jacobian of the impact point and time of flight with respect to v0, phi0, temp0, pressure0, height0,
+    direction and the temperature, wind direction and wind velocity of every Meteo A row. All perturbed shots are
+    simulated together on a process pool.
+
+    A fixed step integrator is used by default: with the same sequence of steps for every perturbed shot the
+    differences are smooth, while the step size control of rk45 would add noise to them.
+
+    Parameters:
+    v0, phi0, temp0, pressure0, height0, direction, meteo_a: The nominal shot, see Environment and Simulator
+    projectile (str): Name of a registered projectile type, see drag.get_projectile_type
+    radius, mass (float): Override the radius and mass of the projectile type, None to keep them
+    impact_height (float): Height of the impact in m
+    integrator (str): Integrator of the simulator, see Simulator
+    delta_t (float): Number of seconds per iteration, the initial step for the rk45 integrator
+    tolerance (float): Allowed local error per step of the rk45 integrator
+    steps (dict): Half widths of the differences overriding DEFAULT_STEPS, by input name or field of the Meteo A
+    workers (int): Number of worker processes, None for one per core and 1 to run in this process
+    chunk_size (int): Number of shots per task of a worker
+
+    Returns:
+    Sensitivity: The nominal impact and the Jacobian
+    """
+    steps = dict(DEFAULT_STEPS, **(steps or {}))
+    nominal = (v0, phi0, temp0, pressure0, height0, direction, meteo_a)
+    parameters = []
+    parameter_steps = {}
+    cases = [nominal]
+
+    for index, name in enumerate(GROUND_INPUTS):
+        parameters.append(name)
+        parameter_steps[name] = steps[name]
+        for sign in (1, -1):
+            case = list(nominal)
+            case[index] += sign * steps[name]
+            cases.append(tuple(case))
+
+    if meteo_a is not None and meteo_a.measurements:
+        for row, measurement in enumerate(meteo_a.measurements):
+            for field in METEO_FIELDS:
+                name = meteo_parameter(measurement.height, field)
+                parameters.append(name)
+                parameter_steps[name] = steps[field]
+                for sign in (1, -1):
+                    cases.append(nominal[:-1] + (perturb_row(meteo_a, row, field, sign * steps[field]),))
+
+    # Passed as object, types loaded with drag.load_registry are unknown to spawned workers
+    arguments = (get_projectile_type(projectile), radius, mass, impact_height, integrator, tolerance, delta_t)
+    chunks = [cases[start:start + chunk_size] for start in range(0, len(cases), chunk_size)]
+    if workers == 1:
+        impacts = np.concatenate([simulate_impacts(chunk, *arguments) for chunk in chunks])
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            tasks = [(chunk,) + arguments for chunk in chunks]
+            impacts = np.concatenate(list(submit_bounded(executor, simulate_impacts, tasks, 2 * workers)))
+
+    plus = impacts[1::2]
+    minus = impacts[2::2]
+    widths = 2 * np.array([parameter_steps[name] for name in parameters])
+    jacobian = ((plus - minus) / widths[:, np.newaxis]).T
+    return Sensitivity(parameters, impacts[0], jacobian, parameter_steps)
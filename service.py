@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from cli import REQUIRED_FIELDS
+from drag import DEFAULT_PROJECTILE, get_projectile_type
+from environment import Environment
+from meteo_cache import MeteoCache
+from projectile import Projectile
+from simulator import Simulator, INTEGRATORS
+import numpy as np
+
+class MeteoStore:
+    """
+    Keeps parsed Meteo A files and compiled environments in memory. A file is parsed again only when it changes on disk.
+    """
+
+    def __init__(self, max_environments: int = 256, cache_directory: str = None):
+        self.meteo_cache = MeteoCache(directory=cache_directory)
+        self.environments = OrderedDict()
+        self.max_environments = max_environments
+        self.lock = threading.RLock() # Used from the worker threads of the batches
+
+    def get_meteo_a(self, file_path: str):
+        with self.lock:
+            meteo_a = self.meteo_cache.load_file(file_path)
+            if getattr(meteo_a, "error", None):
+                raise ValueError("Invalid Meteo A: " + meteo_a.error)
+            return meteo_a
+
+    def get_environment(self, key: tuple):
+        """
+        Parameters:
+        key (tuple): temp0, pressure0, height0 and the path of the Meteo A or None
+
+        Returns:
+        Environment: The environment, compiled once per key
+        """
+        temp0, pressure0, height0, meteo_path = key
+        with self.lock:
+            meteo_a = self.get_meteo_a(meteo_path) if meteo_path is not None else None
+
+            environment = self.environments.get(key)
+            if environment is None or environment.meteo_a is not meteo_a:
+                environment = Environment(temp0, pressure0, height0, meteo_a)
+                self.environments[key] = environment
+            self.environments.move_to_end(key)
+            if len(self.environments) > self.max_environments:
+                self.environments.popitem(last=False)
+            return environment
+
+class RequestCoalescer:
+    """
+    Collects concurrent requests with the same key for a short window and computes them as one batch.
+    """
+
+    def __init__(self, compute, window: float, max_batch_size: int):
+        """
+        Parameters:
+        compute (callable): Called as compute(key, items) in a worker thread, returns one result per item
+        window (float): Seconds to wait for further requests after the first one of a batch
+        max_batch_size (int): A batch is computed immediately once it has this many requests
+        """
+        self.compute = compute
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.pending = {}
+        self.timers = {} # key -> handle of the scheduled flush of the pending batch
+        self.batches = 0
+        self.batched_requests = 0
+
+    async def submit(self, key, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        if key not in self.pending:
+            self.pending[key] = []
+            self.timers[key] = loop.call_later(self.window, self.flush, key)
+        batch = self.pending[key]
+        batch.append((item, future))
+        if len(batch) >= self.max_batch_size:
+            self.flush(key)
+
+        return await future
+
+    def flush(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.pending.pop(key, None)
+        if batch:
+            self.batches += 1
+            self.batched_requests += len(batch)
+            asyncio.get_running_loop().create_task(self.run(key, batch))
+
+    async def run(self, key, batch):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, self.compute, key, [item for item, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+class TrajectoryService:
+    """
+    Local HTTP service around the simulator. Endpoints:
+
+    POST /trajectory  Body with the fields v0, elevation, temp0, pressure0, height0 and optionally direction, projectile
+                      (name of a registered projectile type) and meteo (path to a Meteo A .csv file), returns the
+                      impact and the integrator used. Shots of different projectile types are calculated in the
+                      same batch
+    GET  /stats       Request counts, batch sizes and latency percentiles in ms
+    GET  /health      Liveness check
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, delta_t: float = 0.1, window: float = 0.005,
+                 max_batch_size: int = 256, latency_samples: int = 10000, integrator: str = "euler", tolerance: float = 1e-3):
+        """
+        Parameters:
+        delta_t (float): Seconds per step, the initial step for rk45
+        integrator (str): Integrator of the simulator, see Simulator. Only "euler" advances a coalesced batch in one
+                          vectorized loop, the others calculate its shots one by one and gain nothing from coalescing.
+                          With delta_t = 0.1 Euler is about 134 m short of rk45 at 816 m/s and 45°
+        tolerance (float): Allowed local error per step of the rk45 integrator
+        """
+        if integrator not in INTEGRATORS:
+            raise ValueError("Unknown integrator: " + str(integrator))
+        self.host = host
+        self.port = port
+        self.delta_t = delta_t
+        self.integrator = integrator
+        self.tolerance = tolerance
+        self.meteo_store = MeteoStore()
+        self.coalescer = RequestCoalescer(self.compute_batch, window, max_batch_size)
+        self.latencies = deque(maxlen=latency_samples)
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+
+    async def start(self):
+        """
+        Starts listening. With port 0 a free port is chosen, it is available as self.port afterwards.
+        """
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def compute_batch(self, key: tuple, shots: list):
+        """
+        Computes all shots sharing one environment in a single batch. Runs in a worker thread.
+        """
+        environment = self.meteo_store.get_environment(key)
+        if self.integrator == "euler":
+            simulator = Simulator(environment, Projectile.from_type(DEFAULT_PROJECTILE, 0))
+            projectiles = [shot["projectile"] for shot in shots]
+            trajectories = simulator.calculate_batch([shot["v0"] for shot in shots], [shot["elevation"] for shot in shots],
+                                                     [shot["direction"] for shot in shots], self.delta_t,
+                                                     None if set(projectiles) == {DEFAULT_PROJECTILE} else projectiles)
+            impacts = [(trajectory.impact, float(np.max(trajectory.y)), len(trajectory) - 1) for trajectory in trajectories]
+        else:
+            # Only the impact is returned, no trajectory is kept
+            impacts = []
+            for shot in shots:
+                simulator = Simulator(environment, Projectile.from_type(shot["projectile"], shot["direction"]), self.integrator, self.tolerance)
+                impact = simulator.impact(shot["v0"], shot["elevation"], self.delta_t)
+                impacts.append((impact, impact.apex_height, impact.steps))
+
+        results = []
+        for impact, apex_height, steps in impacts:
+            results.append({
+                "range": impact.point.x,
+                "deflection": impact.point.z,
+                "time_of_flight": impact.time_of_flight,
+                "apex_height": apex_height,
+                "angle_of_fall": impact.angle_of_fall,
+                "terminal_velocity": impact.terminal_velocity,
+                "steps": steps,
+                "integrator": self.integrator,
+                "batch_size": len(shots),
+            })
+        return results
+
+    async def calculate(self, request: dict):
+        missing = [field for field in REQUIRED_FIELDS if field not in request]
+        if missing:
+            raise ValueError("Missing fields: " + ", ".join(missing))
+
+        v0, elevation, temp0, pressure0, height0 = (float(request[field]) for field in REQUIRED_FIELDS)
+        meteo_path = os.path.abspath(request["meteo"]) if request.get("meteo") else None
+        if meteo_path is not None:
+            # Parse or refresh the Meteo A before joining a batch, so errors only affect this request
+            await asyncio.get_running_loop().run_in_executor(None, self.meteo_store.get_meteo_a, meteo_path)
+
+        projectile = request.get("projectile", DEFAULT_PROJECTILE)
+        get_projectile_type(projectile) # Unknown types only fail this request
+        shot = {"v0": v0, "elevation": elevation, "direction": float(request.get("direction", 0)), "projectile": projectile}
+        return await self.coalescer.submit((temp0, pressure0, height0, meteo_path), shot)
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        percentiles = {}
+        if len(latencies) > 0:
+            percentiles = {"p" + str(p): float(np.percentile(latencies, p)) for p in (50, 90, 95, 99)}
+            percentiles["max"] = float(latencies.max())
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": self.coalescer.batches,
+            "mean_batch_size": self.coalescer.batched_requests / self.coalescer.batches if self.coalescer.batches else 0,
+            "meteo_cache": self.meteo_store.meteo_cache.stats(),
+            "latency_ms": percentiles,
+        }
+
+    async def handle_request(self, method: str, path: str, body: bytes):
+        """
+        Returns:
+        int: The HTTP status
+        dict: The response body
+        """
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok"}
+        if path == "/stats" and method == "GET":
+            return 200, self.stats()
+        if path == "/trajectory" and method == "POST":
+            start = time.perf_counter()
+            self.requests += 1
+            try:
+                result = await self.calculate(json.loads(body or b"{}"))
+            except (ValueError, TypeError, OSError) as error:
+                self.errors += 1
+                return 400, {"error": str(error)}
+            self.latencies.append(time.perf_counter() - start)
+            return 200, result
+        return 404, {"error": "Not found"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, response = await self.handle_request(method, path, body)
+
+                payload = json.dumps(response).encode()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(
+                    status, {200: "OK", 400: "Bad Request", 404: "Not Found"}[status], len(payload), "keep-alive" if keep_alive else "close").encode())
+                writer.write(payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Malformed requests and connections still open when the service shuts down
+            pass
+        finally:
+            writer.close()
+
+async def serve(host: str, port: int, delta_t: float, window: float, max_batch_size: int, integrator: str, tolerance: float):
+    service = TrajectoryService(host, port, delta_t, window, max_batch_size, integrator=integrator, tolerance=tolerance)
+    await service.start()
+    print("Listening on http://{}:{}".format(host, service.port))
+    await service.server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local trajectory service which coalesces concurrent requests into batches")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--integrator", choices=INTEGRATORS, default="euler", help="Only euler is vectorized over a batch")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Allowed local error per step of rk45")
+    parser.add_argument("--delta-t", type=float, default=0.1, help="Seconds per step, the initial step for rk45")
+    parser.add_argument("--window", type=float, default=0.005, help="Seconds to collect requests into a batch")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.host, args.port, args.delta_t, args.window, args.max_batch_size, args.integrator, args.tolerance))
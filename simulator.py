@@ -1,37 +1,435 @@
 from geometry import Point, Velocity, Acceleration
 from environment import Environment
-from projectile import Projectile
-from math import sin, cos, pi
+from projectile import Projectile, ProjectileMix
+from trajectory import Trajectory, Impact, COLUMNS
+from math import sin, cos, pi, ceil, isfinite
+import numpy as np
+
+# Butcher tableau of the Dormand-Prince 5(4) method
+DOPRI_C = (0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1)
+DOPRI_A = (
+    (),
+    (1 / 5,),
+    (3 / 40, 9 / 40),
+    (44 / 45, -56 / 15, 32 / 9),
+    (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+    (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656),
+    (35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84),
+)
+DOPRI_B5 = (35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0)
+DOPRI_B4 = (5179 / 57600, 0, 7571 / 16695, 393 / 640, -92097 / 339200, 187 / 2100, 1 / 40)
+
+INTEGRATORS = ("euler", "rk4", "rk45")
+# Below this number of shots calculate_batch simulates the shots one by one, the NumPy overhead per step outweighs the
+# vectorization for small batches (about 15 shots on a single core)
+BATCH_MIN_SHOTS = 16
+# Number of consecutive rejected steps after which the rk45 integrator gives up, each rejection shrinks the step by up to 5
+RK45_MAX_REJECTIONS = 40
+
+def hermite(p0: float, v0: float, p1: float, v1: float, s: float, delta_t: float):
+    """
+    Returns:
+    float: The cubic Hermite polynomial through p0 and p1 with the derivatives v0 and v1 at the fraction s of a step of
+           delta_t seconds
+    """
+    s2 = s * s
+    s3 = s2 * s
+    return (2 * s3 - 3 * s2 + 1) * p0 + (s3 - 2 * s2 + s) * delta_t * v0 + (-2 * s3 + 3 * s2) * p1 + (s3 - s2) * delta_t * v1
 
 class Simulator:
 
-    def __init__(self, environment: Environment, projectile: Projectile):
+    def __init__(self, environment: Environment, projectile: Projectile, integrator: str = "euler", tolerance: float = 1e-3, impact_height: float = 0):
+        """
+        Parameters:
+        environment (Environment): The environment
+        projectile (Projectile): The projectile to simulate
+        integrator (str): One of "euler" (fixed step, as used historically), "rk4" (fixed step) or "rk45"
+                          (adaptive Dormand-Prince, delta_t is only the initial step)
+        tolerance (float): Allowed local error per step of the rk45 integrator in m and m/s
+        impact_height (float): Height of the ground in m, the trajectory ends when descending through it
+        """
+        if integrator not in INTEGRATORS:
+            raise ValueError("Unknown integrator: " + str(integrator))
+
         self.environment = environment
         self.projectile = projectile
+        self.integrator = integrator
+        self.tolerance = tolerance
+        self.impact_height = float(impact_height)
         self.g = Acceleration(0, 9.80665, 0)
 
     def iterate(self, point: Point, velocity: Velocity, delta_t: float):
         velocity = self.projectile.update_velocity(point, velocity, self.environment, delta_t)
-        # Apply gravity
-        velocity -= self.g * delta_t
+        # Apply gravity, in place as the velocity has just been created
+        velocity.add_scaled(self.g, -delta_t)
         # Update position
-        point += velocity * delta_t
-        
+        point = point.fma(velocity, delta_t)
+
         return point, velocity
 
+    def derive_acceleration(self, point: Point, velocity: Velocity):
+        acceleration = self.projectile.derive_acceleration(point, velocity, self.environment)
+        acceleration -= self.g
+        return acceleration
 
-    def calculate(self, v0, phi0, delta_t):
-        points = []
-        vectors = []
-        point_i = Point(0, self.environment.height0, 0)
-        vector_i = Velocity(v0 * cos(phi0 * pi / 180), v0 * sin(phi0 * pi / 180), 0)
+    def iterate_rk4(self, point: Point, velocity: Velocity, delta_t: float):
+        """
+        Performs one step of the classical Runge-Kutta method.
+
+        Parameters:
+        point (Point): Current position of the projectile
+        velocity (Velocity): Current velocity of the projectile
+        delta_t (float): Number of seconds to iterate
+
+        Returns:
+        Point: The new position
+        Velocity: The new velocity
+        """
+        k1_p, k1_v = velocity, self.derive_acceleration(point, velocity)
+        k2_p = velocity.fma(k1_v, delta_t / 2)
+        k2_v = self.derive_acceleration(point.fma(k1_p, delta_t / 2), k2_p)
+        k3_p = velocity.fma(k2_v, delta_t / 2)
+        k3_v = self.derive_acceleration(point.fma(k2_p, delta_t / 2), k3_p)
+        k4_p = velocity.fma(k3_v, delta_t)
+        k4_v = self.derive_acceleration(point.fma(k3_p, delta_t), k4_p)
+
+        point = point.fma(k1_p, delta_t / 6).add_scaled(k2_p, delta_t / 3).add_scaled(k3_p, delta_t / 3).add_scaled(k4_p, delta_t / 6)
+        velocity = velocity.fma(k1_v, delta_t / 6).add_scaled(k2_v, delta_t / 3).add_scaled(k3_v, delta_t / 3).add_scaled(k4_v, delta_t / 6)
+
+        return point, velocity
+
+    def iterate_rk45(self, point: Point, velocity: Velocity, delta_t: float):
+        """
+        Performs one step of the Dormand-Prince method.
+
+        Parameters:
+        point (Point): Current position of the projectile
+        velocity (Velocity): Current velocity of the projectile
+        delta_t (float): Number of seconds to iterate
+
+        Returns:
+        Point: The new position (5th order)
+        Velocity: The new velocity (5th order)
+        float: The estimated local error, the largest deviation to the embedded 4th order solution
+        """
+        k_p = []
+        k_v = []
+        for stage in range(7):
+            stage_point = point.copy()
+            stage_velocity = velocity.copy()
+            for weight, p, v in zip(DOPRI_A[stage], k_p, k_v):
+                if weight != 0:
+                    stage_point.add_scaled(p, weight * delta_t)
+                    stage_velocity.add_scaled(v, weight * delta_t)
+            k_p.append(stage_velocity)
+            k_v.append(self.derive_acceleration(stage_point, stage_velocity))
+
+        new_point = point.copy()
+        new_velocity = velocity.copy()
+        error_point = Point(0, 0, 0)
+        error_velocity = Velocity(0, 0, 0)
+        for b5, b4, p, v in zip(DOPRI_B5, DOPRI_B4, k_p, k_v):
+            new_point.add_scaled(p, b5 * delta_t)
+            new_velocity.add_scaled(v, b5 * delta_t)
+            error_point.add_scaled(p, (b5 - b4) * delta_t)
+            error_velocity.add_scaled(v, (b5 - b4) * delta_t)
+
+        error = max(abs(error_point.x), abs(error_point.y), abs(error_point.z),
+                    abs(error_velocity.x), abs(error_velocity.y), abs(error_velocity.z))
+
+        return new_point, new_velocity, error
+
+    def find_ground_impact(self, point: Point, velocity: Velocity, new_point: Point, new_velocity: Velocity, delta_t: float):
+        """
+        Locates the crossing of the impact height within the last step. The Euler integrator moves along a straight line within
+        a step, the Runge-Kutta integrators are interpolated with a cubic Hermite polynomial.
+
+        Parameters:
+        point (Point): Position before the step, above the ground
+        velocity (Velocity): Velocity before the step
+        new_point (Point): Position after the step, below the ground
+        new_velocity (Velocity): Velocity after the step
+        delta_t (float): Length of the step in seconds
+
+        Returns:
+        float: Fraction of the step at which the ground is hit
+        Point: The impact point
+        Velocity: The velocity at impact
+        """
+        if self.integrator == "euler":
+            fraction = (point.y - self.impact_height) / (point.y - new_point.y)
+            impact_point = point + (new_point - point) * fraction
+        else:
+            # Bisection, the height is above the ground at 0 and below at 1
+            lower, upper = 0.0, 1.0
+            for _ in range(50):
+                fraction = (lower + upper) / 2
+                if hermite(point.y, velocity.y, new_point.y, new_velocity.y, fraction, delta_t) >= self.impact_height:
+                    lower = fraction
+                else:
+                    upper = fraction
+            fraction = (lower + upper) / 2
+            impact_point = Point(
+                hermite(point.x, velocity.x, new_point.x, new_velocity.x, fraction, delta_t),
+                0,
+                hermite(point.z, velocity.z, new_point.z, new_velocity.z, fraction, delta_t)
+            )
+
+        impact_point.y = self.impact_height
+        impact_velocity = velocity + (new_velocity - velocity) * fraction
+        return fraction, impact_point, impact_velocity
+
+    def _integrate(self, v0, phi0, delta_t, start: tuple = None, checkpoint=None):
+        """
+        Integrates a single trajectory and yields the state after every step. The last state is the exact ground
+        impact when the trajectory descends through the impact height. If the apex stays below the impact height,
+        the trajectory ends with the first descending step.
+
+        Parameters:
+        start (tuple): Time, position, velocity and next step size of a state to resume from instead of the muzzle,
+                       as given to checkpoint. Resuming gives the same states as integrating from the muzzle
+        checkpoint (callable): Called as checkpoint(t, point, velocity, delta_t) with the state after every step
+                               except the last one
+
+        Yields:
+        float: Time of flight in seconds
+        Point: Position of the projectile
+        Velocity: Velocity of the projectile
+
+        Raises:
+        ValueError: If the rk45 integrator cannot reach the tolerance, e.g. because the error is not finite
+        """
+        if start is not None:
+            t, point_i, vector_i, delta_t = start
+        else:
+            t = 0.0
+            point_i = Point(0, self.environment.height0, 0)
+            vector_i = Velocity(v0 * cos(phi0 * pi / 180), v0 * sin(phi0 * pi / 180), 0)
 
         while point_i.x >= 0:
-            point_i, vector_i = self.iterate(point_i, vector_i, delta_t)
-            points.append(point_i)
-            vectors.append(vector_i)
+            if self.integrator == "euler":
+                point_next, vector_next = self.iterate(point_i, vector_i, delta_t)
+                step = delta_t
+            elif self.integrator == "rk4":
+                point_next, vector_next = self.iterate_rk4(point_i, vector_i, delta_t)
+                step = delta_t
+            else:
+                rejections = 0
+                while True:
+                    point_next, vector_next, error = self.iterate_rk45(point_i, vector_i, delta_t)
+                    if not isfinite(error):
+                        raise ValueError("The rk45 integrator diverged at t = {:.3f} s".format(t))
+                    # Standard step size control with a safety factor, limited to shrink or grow by 5 at most
+                    factor = min(5.0, max(0.2, 0.9 * (self.tolerance / error) ** 0.2)) if error > 0 else 5.0
+                    step = delta_t
+                    delta_t *= factor
+                    if error <= self.tolerance:
+                        break
+                    rejections += 1
+                    if rejections >= RK45_MAX_REJECTIONS:
+                        raise ValueError("The rk45 integrator cannot reach the tolerance {} at t = {:.3f} s".format(self.tolerance, t))
 
-            if (point_i.y < 0):
+            if point_next.y < self.impact_height and vector_next.y < 0:
+                if point_i.y >= self.impact_height:
+                    fraction, point_next, vector_next = self.find_ground_impact(point_i, vector_i, point_next, vector_next, step)
+                    yield t + fraction * step, point_next, vector_next
+                else:
+                    yield t + step, point_next, vector_next
                 break
 
-        return points
+            t += step
+            point_i, vector_i = point_next, vector_next
+            if checkpoint is not None:
+                checkpoint(t, point_i, vector_i, delta_t)
+            yield t, point_i, vector_i
+
+    def iter_steps(self, v0, phi0, delta_t, every: int = 1, start: tuple = None, checkpoint=None):
+        """
+        Integrates a single trajectory step by step. The generator can be stopped at any time, e.g. at the apex.
+
+        Parameters:
+        v0 (float): Initial velocity in m/s
+        phi0 (float): Elevation in degrees
+        delta_t (float): Number of seconds per iteration, the initial step for the rk45 integrator
+        every (int): Only yield every n-th step, the muzzle and the impact are always yielded
+        start, checkpoint: See _integrate, when resuming from start the muzzle is not yielded
+
+        Yields:
+        float: Time of flight in seconds
+        Point: Position of the projectile
+        Velocity: Velocity of the projectile
+        """
+        if start is None:
+            yield 0.0, Point(0, self.environment.height0, 0), Velocity(v0 * cos(phi0 * pi / 180), v0 * sin(phi0 * pi / 180), 0)
+
+        step = 0
+        state = None
+        for state in self._integrate(v0, phi0, delta_t, start, checkpoint):
+            step += 1
+            if step % every == 0:
+                yield state
+                state = None
+
+        # The last state has not been yielded yet because of the decimation
+        if state is not None:
+            yield state
+
+    def iter_dense(self, v0, phi0, delta_t, spacing: float = None):
+        """
+        Integrates a single trajectory like iter_steps and inserts states interpolated with cubic Hermite polynomials
+        between steps which are longer than spacing, e.g. to plot the few long steps of the rk45 integrator as a smooth
+        curve. The integrated states are yielded unchanged.
+
+        Parameters:
+        v0, phi0, delta_t (float): See iter_steps
+        spacing (float): Largest time between two yielded states in seconds, by default delta_t
+
+        Yields:
+        float: Time of flight in seconds
+        Point: Position of the projectile
+        Velocity: Velocity of the projectile
+        """
+        spacing = spacing or delta_t
+        previous = None
+        for state in self.iter_steps(v0, phi0, delta_t):
+            if previous is not None:
+                t0, point0, velocity0 = previous
+                t1, point1, velocity1 = state
+                width = t1 - t0
+                count = ceil(width / spacing - 1e-9)
+                for index in range(1, count):
+                    s = index / count
+                    yield t0 + s * width, Point(
+                        hermite(point0.x, velocity0.x, point1.x, velocity1.x, s, width),
+                        hermite(point0.y, velocity0.y, point1.y, velocity1.y, s, width),
+                        hermite(point0.z, velocity0.z, point1.z, velocity1.z, s, width),
+                    ), velocity0 + (velocity1 - velocity0) * s
+            yield state
+            previous = state
+
+    def impact(self, v0, phi0, delta_t):
+        """
+        Integrates a single trajectory up to the impact without keeping any intermediate state.
+
+        Parameters:
+        v0 (float): Initial velocity in m/s
+        phi0 (float): Elevation in degrees
+        delta_t (float): Number of seconds per iteration, the initial step for the rk45 integrator
+
+        Returns:
+        Impact: Impact point, time of flight, velocity at impact, apex height and number of steps
+        """
+        apex_height = self.environment.height0
+        steps = 0
+        for t, point, velocity in self._integrate(v0, phi0, delta_t):
+            steps += 1
+            if point.y > apex_height:
+                apex_height = point.y
+
+        return Impact(t, point, velocity, point.y == self.impact_height, apex_height, steps)
+
+    def calculate(self, v0, phi0, delta_t):
+        """
+        Calculates the trajectory of a single shot.
+
+        Parameters:
+        v0 (float): Initial velocity in m/s
+        phi0 (float): Elevation in degrees
+        delta_t (float): Number of seconds per iteration, the initial step for the rk45 integrator
+
+        Returns:
+        Trajectory: The states of the trajectory from the muzzle to the ground impact
+        """
+        trajectory = Trajectory()
+        for t, point, velocity in self.iter_steps(v0, phi0, delta_t):
+            trajectory.append(t, point, velocity)
+        trajectory.trim()
+
+        return trajectory
+
+    def for_shot(self, projectile: Projectile):
+        """
+        Returns:
+        Simulator: The Euler simulator of a single shot of a batch, see calculate_batch
+        """
+        return Simulator(self.environment.for_direction(projectile.direction), projectile, "euler", self.tolerance, self.impact_height)
+
+    def calculate_batch(self, v0s, phi0s, directions, delta_t, projectiles=None):
+        """
+        Calculates many trajectories at once with the Euler integrator. All shots are advanced together in NumPy
+        arrays, each shot stops under the same conditions as in calculate and drops out of the active set. Batches of
+        less than BATCH_MIN_SHOTS shots are simulated one by one with calculate, which gives the same trajectories.
+
+        Parameters:
+        v0s (array_like): Initial velocities in m/s
+        phi0s (array_like): Elevations in degrees
+        directions (array_like): Directions of fire in Azimute, None to use the direction of the projectile
+        delta_t (float): Number of seconds per iteration
+        projectiles (list): Projectile or name of a registered projectile type per shot for mixed ammunition, None to
+                            fire the projectile of the simulator only
+
+        Returns:
+        list[Trajectory]: The trajectory of each shot
+        """
+        if directions is None:
+            directions = self.projectile.direction
+        v0s, phi0s, directions = np.broadcast_arrays(np.asarray(v0s, dtype=float), np.asarray(phi0s, dtype=float), np.asarray(directions, dtype=float))
+        v0s, phi0s, directions = v0s.ravel(), phi0s.ravel(), directions.ravel()
+        shots = len(v0s)
+
+        projectile = self.projectile
+        if projectiles is not None:
+            projectiles = [Projectile.from_type(entry, self.projectile.direction) if isinstance(entry, str) else entry for entry in projectiles]
+            if len(projectiles) == 1:
+                projectiles = projectiles * shots
+            if len(projectiles) != shots:
+                raise ValueError("Expected one projectile per shot")
+            projectile = ProjectileMix(projectiles)
+
+        if shots < BATCH_MIN_SHOTS:
+            trajectories = []
+            for shot in range(shots):
+                shot_projectile = (projectiles[shot] if projectiles is not None else self.projectile).with_direction(float(directions[shot]))
+                simulator = self.for_shot(shot_projectile)
+                trajectories.append(simulator.calculate(float(v0s[shot]), float(phi0s[shot]), delta_t))
+            return trajectories
+
+        # State of every shot, the columns are ordered as in a Trajectory
+        states = np.zeros((shots, len(COLUMNS)))
+        states[:, 2] = self.environment.height0
+        states[:, 4] = v0s * np.cos(phi0s * pi / 180)
+        states[:, 5] = v0s * np.sin(phi0s * pi / 180)
+
+        active = np.arange(shots)
+        steps = [(active, states.copy())] # Per iteration the indices of the active shots and their new states
+        while len(active) > 0:
+            previous = states[active]
+            velocities = projectile.update_velocity_batch(previous[:, 1:4], previous[:, 4:7], directions[active], self.environment, delta_t, active)
+            # Apply gravity
+            velocities[:, 1] -= self.g.y * delta_t
+            # Update position
+            current = np.empty_like(previous)
+            current[:, 0] = previous[:, 0] + delta_t
+            current[:, 1:4] = previous[:, 1:4] + velocities * delta_t
+            current[:, 4:7] = velocities
+
+            # Move shots that descended through the impact height back to the exact impact, see find_ground_impact
+            below = (current[:, 2] < self.impact_height) & (current[:, 5] < 0)
+            crossing = below & (previous[:, 2] >= self.impact_height)
+            if crossing.any():
+                fraction = (previous[crossing, 2] - self.impact_height) / (previous[crossing, 2] - current[crossing, 2])
+                current[crossing] = previous[crossing] + (current[crossing] - previous[crossing]) * fraction[:, np.newaxis]
+                current[crossing, 2] = self.impact_height
+
+            states[active] = current
+            steps.append((active, current))
+
+            active = active[~below & (current[:, 1] >= 0)]
+
+        counts = np.zeros(shots, dtype=int)
+        history = np.empty((len(steps), shots, len(COLUMNS)))
+        for step, (indices, step_states) in enumerate(steps):
+            counts[indices] += 1
+            history[step, indices] = step_states
+
+        return [Trajectory.from_array(np.ascontiguousarray(history[:counts[shot], shot].T)) for shot in range(shots)]
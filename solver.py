@@ -0,0 +1,284 @@
+from collections import OrderedDict
+from math import isnan, nan
+from environment import Environment
+from projectile import Projectile
+from simulator import Simulator
+import numpy as np
+
+# Elevations of the coarse table which seeds the root finding, in degrees
+TABLE_ELEVATIONS = np.linspace(0, 90, 91)
+TABLE_DELTA_T = 0.1
+TABLE_CACHE_SIZE = 64
+
+_table_cache = OrderedDict()
+
+class ElevationSolution:
+
+    def __init__(self, elevation: float, v0: float, impact_range: float, time_of_flight: float, evaluations: int, table_cached: bool):
+        self.elevation = elevation
+        self.v0 = v0
+        self.impact_range = impact_range
+        self.time_of_flight = time_of_flight
+        self.evaluations = evaluations
+        self.table_cached = table_cached
+
+    def __repr__(self):
+        return f"ElevationSolution(elevation={self.elevation}, v0={self.v0}, impact_range={self.impact_range}, evaluations={self.evaluations})"
+
+def evaluate_impact(simulator: Simulator, v0: float, phi0: float, delta_t: float):
+    """
+    Integrates a trajectory up to the impact only.
+
+    Returns:
+    float: Range to the impact in m, nan if the trajectory does not reach the impact height
+    float: Time of flight in s
+    """
+    impact = simulator.impact(v0, phi0, delta_t)
+    if not impact.reached:
+        return nan, impact.time_of_flight
+    return impact.point.x, impact.time_of_flight
+
+def coarse_table(v0: float, environment: Environment, projectile: Projectile, target_height: float):
+    """
+    Impact ranges over TABLE_ELEVATIONS, computed in one batch with the Euler integrator. Tables are cached per
+    ballistic situation, atmospheres without a fingerprint (see Environment.fingerprint) are never cached.
+
+    Returns:
+    np.ndarray: The impact ranges, nan where the impact height is not reached
+    bool: Whether the table was taken from the cache
+    """
+    fingerprint = environment.fingerprint()
+    key = (v0, target_height, fingerprint, projectile.fingerprint(), projectile.direction) if fingerprint is not None else None
+    if key in _table_cache:
+        _table_cache.move_to_end(key)
+        return _table_cache[key], True
+
+    simulator = Simulator(environment, projectile, impact_height=target_height)
+    ranges = np.array([
+        trajectory.x[-1] if abs(trajectory.y[-1] - target_height) <= 1e-6 else nan
+        for trajectory in simulator.calculate_batch(v0, TABLE_ELEVATIONS, None, TABLE_DELTA_T)
+    ])
+
+    if key is not None:
+        _table_cache[key] = ranges
+        if len(_table_cache) > TABLE_CACHE_SIZE:
+            _table_cache.popitem(last=False)
+    return ranges, False
+
+def brent(f, a: float, b: float, fa: float, fb: float, xtol: float, ftol: float, max_iterations: int = 100):
+    """
+    Finds a root of f within the bracket [a, b] with Brent's method.
+
+    Parameters:
+    f (callable): The function
+    a, b (float): Bracket of the root, f(a) and f(b) must have opposite signs
+    fa, fb (float): The function values at a and b
+    xtol (float): Tolerance on the argument
+    ftol (float): Tolerance on the function value
+
+    Returns:
+    float: The root
+    float: The function value at the root
+    """
+    c, fc = b, fb
+    d = e = b - a
+
+    for _ in range(max_iterations):
+        if (fb > 0) == (fc > 0):
+            # Keep the root between b and the contrapoint c
+            c, fc = a, fa
+            d = e = b - a
+        if abs(fc) < abs(fb):
+            a, fa = b, fb
+            b, fb = c, fc
+            c, fc = a, fa
+
+        tolerance = 2 * np.finfo(float).eps * abs(b) + xtol / 2
+        middle = (c - b) / 2
+        if abs(middle) <= tolerance or abs(fb) <= ftol:
+            return b, fb
+
+        if abs(e) >= tolerance and abs(fa) > abs(fb):
+            # Inverse quadratic interpolation, or secant if only two distinct points are known
+            s = fb / fa
+            if a == c:
+                p = 2 * middle * s
+                q = 1 - s
+            else:
+                q = fa / fc
+                r = fb / fc
+                p = s * (2 * middle * q * (q - r) - (b - a) * (r - 1))
+                q = (q - 1) * (r - 1) * (s - 1)
+            if p > 0:
+                q = -q
+            p = abs(p)
+            if 2 * p < min(3 * middle * q - abs(tolerance * q), abs(e * q)):
+                e, d = d, p / q
+            else:
+                d = e = middle
+        else:
+            d = e = middle
+
+        a, fa = b, fb
+        b += d if abs(d) > tolerance else (tolerance if middle > 0 else -tolerance)
+        fb = f(b)
+
+    return b, fb
+
+def reached_bound(f, unreached: float, reached: float, f_reached: float, xtol: float):
+    """
+    Bisects the border between arguments at which the target height is not reached (f is nan) and arguments at which
+    it is reached.
+
+    Returns:
+    float: The argument next to the border at which the target height is still reached
+    float: The function value there
+    """
+    while abs(reached - unreached) > xtol:
+        middle = (unreached + reached) / 2
+        f_middle = f(middle)
+        if isnan(f_middle):
+            unreached = middle
+        else:
+            reached, f_reached = middle, f_middle
+    return reached, f_reached
+
+def check_solution(f, a: float, b: float, fa: float, fb: float, range_tolerance: float):
+    """
+    Runs brent on a bracket whose ends reach the target height and checks the deviation of the result.
+
+    Raises:
+    ValueError: If the target height is not reached within the bracket or the root misses by more than range_tolerance
+    """
+    def bracketed(x):
+        value = f(x)
+        if isnan(value):
+            raise ValueError("The target height is not reached within the bracket")
+        return value
+
+    x, deviation = brent(bracketed, a, b, fa, fb, 1e-6, range_tolerance)
+    if abs(deviation) > range_tolerance:
+        raise ValueError("No solution within {:g} m of the target, the closest impact misses by {:.1f} m".format(range_tolerance, deviation))
+    return x, deviation
+
+def solve_elevation(target_range: float, target_height: float, v0: float, environment: Environment, projectile: Projectile,
+                    high_angle: bool = False, integrator: str = "rk45", delta_t: float = 0.1, range_tolerance: float = 0.5):
+    """
+    Finds the elevation which hits a target at the given range and height.
+
+    Parameters:
+    target_range (float): Range to the target in m, along the direction of fire
+    target_height (float): Height of the target in m
+    v0 (float): Initial velocity in m/s
+    environment (Environment): The environment
+    projectile (Projectile): The projectile
+    high_angle (bool): Whether to solve for the high angle (above the elevation of maximum range)
+    integrator (str): Integrator of the simulator, see Simulator
+    delta_t (float): Number of seconds per iteration, the initial step for the rk45 integrator
+    range_tolerance (float): Allowed deviation of the impact from the target in m
+
+    Returns:
+    ElevationSolution: The elevation and the number of trajectory evaluations used
+
+    Raises:
+    ValueError: If the target cannot be reached with the given initial velocity, or not within range_tolerance
+    """
+    table, table_cached = coarse_table(v0, environment, projectile, target_height)
+    ranges = np.where(np.isnan(table), -np.inf, table)
+    apex_index = int(np.argmax(ranges))
+    if ranges[apex_index] < target_range:
+        raise ValueError("Target out of range, the maximum range is about {:.0f} m".format(ranges[apex_index]))
+
+    # The range grows with the elevation on the low angle branch and shrinks on the high angle branch
+    if high_angle:
+        branch = range(apex_index, len(TABLE_ELEVATIONS) - 1)
+        crossing = next((i for i in branch if ranges[i + 1] <= target_range), len(TABLE_ELEVATIONS) - 2)
+    else:
+        branch = range(apex_index - 1, -1, -1)
+        crossing = next((i for i in branch if ranges[i] <= target_range), 0)
+
+    simulator = Simulator(environment, projectile, integrator, impact_height=target_height)
+    evaluations = 0
+    times = {}
+
+    def miss(phi0):
+        nonlocal evaluations
+        evaluations += 1
+        impact_range, times[phi0] = evaluate_impact(simulator, v0, phi0, delta_t)
+        return impact_range - target_range # nan if the target height is not reached
+
+    # The table stems from a coarser integration, widen the bracket until the accurate ranges enclose the target.
+    # Elevations which do not reach the target height lie below the ones which do, they are cut off the bracket.
+    lower, upper = crossing, crossing + 1
+    x_lower, x_upper = TABLE_ELEVATIONS[lower], TABLE_ELEVATIONS[upper]
+    f_lower, f_upper = miss(x_lower), miss(x_upper)
+    lower_bounded = False
+    while not f_lower * f_upper <= 0:
+        out_of_range = ValueError("Target out of range for elevations between {:g} and {:g} degrees".format(x_lower, TABLE_ELEVATIONS[-1]))
+        if isnan(f_upper):
+            if upper == len(TABLE_ELEVATIONS) - 1:
+                raise out_of_range
+            lower, x_lower, f_lower = upper, x_upper, f_upper
+            upper += 1
+            x_upper = TABLE_ELEVATIONS[upper]
+            f_upper = miss(x_upper)
+        elif isnan(f_lower):
+            x_lower, f_lower = reached_bound(miss, x_lower, x_upper, f_upper, 1e-6)
+            lower_bounded = True
+        elif ((f_lower > 0) != high_angle):
+            if lower == 0 or lower_bounded:
+                raise out_of_range
+            lower -= 1
+            x_lower = TABLE_ELEVATIONS[lower]
+            f_lower = miss(x_lower)
+        elif upper < len(TABLE_ELEVATIONS) - 1:
+            upper += 1
+            x_upper = TABLE_ELEVATIONS[upper]
+            f_upper = miss(x_upper)
+        else:
+            raise out_of_range
+
+    elevation, deviation = check_solution(miss, x_lower, x_upper, f_lower, f_upper, range_tolerance)
+    return ElevationSolution(float(elevation), v0, target_range + deviation, times[elevation], evaluations, table_cached)
+
+def solve_velocity(target_range: float, target_height: float, phi0: float, environment: Environment, projectile: Projectile,
+                   v0_min: float, v0_max: float, integrator: str = "rk45", delta_t: float = 0.1, range_tolerance: float = 0.5):
+    """
+    Finds the initial velocity (charge) which hits a target at the given range and height with a fixed elevation.
+
+    Parameters:
+    target_range (float): Range to the target in m, along the direction of fire
+    target_height (float): Height of the target in m
+    phi0 (float): Elevation in degrees
+    environment (Environment): The environment
+    projectile (Projectile): The projectile
+    v0_min, v0_max (float): Bracket of the initial velocity in m/s
+    integrator (str): Integrator of the simulator, see Simulator
+    delta_t (float): Number of seconds per iteration, the initial step for the rk45 integrator
+    range_tolerance (float): Allowed deviation of the impact from the target in m
+
+    Returns:
+    ElevationSolution: The initial velocity and the number of trajectory evaluations used
+
+    Raises:
+    ValueError: If the target cannot be reached within the bracket of initial velocities, or not within range_tolerance
+    """
+    simulator = Simulator(environment, projectile, integrator, impact_height=target_height)
+    evaluations = 0
+    times = {}
+
+    def miss(v0):
+        nonlocal evaluations
+        evaluations += 1
+        impact_range, times[v0] = evaluate_impact(simulator, v0, phi0, delta_t)
+        return impact_range - target_range # nan if the target height is not reached
+
+    f_min, f_max = miss(v0_min), miss(v0_max)
+    # Initial velocities which do not reach the target height lie below the ones which do
+    if isnan(f_min) and not isnan(f_max):
+        v0_min, f_min = reached_bound(miss, v0_min, v0_max, f_max, 1e-6)
+    if not f_min * f_max <= 0:
+        raise ValueError("Target out of range for initial velocities between {} and {} m/s".format(v0_min, v0_max))
+
+    v0, deviation = check_solution(miss, v0_min, v0_max, f_min, f_max, range_tolerance)
+    return ElevationSolution(phi0, float(v0), target_range + deviation, times[v0], evaluations, False)
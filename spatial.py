@@ -0,0 +1,348 @@
+import threading
+from collections import OrderedDict
+from math import atan2, cos, floor, hypot, pi, sin, sqrt
+from atmosphere import AtmosphereProfile, AtmosphericConditions
+from environment import Environment
+from geometry import Point
+from meteo_a import MeteoA
+import numpy as np
+
+# Weights are computed at the corners of square cells of this size in m and interpolated bilinearly inside the cells
+WEIGHT_RESOLUTION = 100
+WEIGHT_CACHE_SIZE = 4096
+
+class Station:
+    """
+    A Meteo A measured at a known place, given in m east and north of the gun.
+    """
+
+    def __init__(self, east: float, north: float, meteo_a: MeteoA, name: str = ""):
+        self.east = east
+        self.north = north
+        self.meteo_a = meteo_a
+        self.name = name
+
+class UniformGrid:
+    """
+    Spatial index of points in the plane. The points are sorted into square cells, a query searches the cells in rings
+    around the query point and stops as soon as no point in an unsearched cell can be nearer than the ones found.
+    """
+
+    def __init__(self, points: np.ndarray, cell_size: float = None):
+        """
+        Parameters:
+        points (np.ndarray): The points, shape (n, 2)
+        cell_size (float): Size of a cell in m, by default chosen for about one point per cell
+        """
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(self.points) == 0:
+            raise ValueError("At least one point is required")
+
+        if cell_size is None:
+            extent = float(np.ptp(self.points, axis=0).max())
+            cell_size = max(extent / sqrt(len(self.points)), 1.0)
+        self.cell_size = cell_size
+
+        self.cells = {} # (column, row) -> indices of the points
+        for index, (x, y) in enumerate(self.points):
+            self.cells.setdefault(self.cell_of(x, y), []).append(index)
+        columns = [column for column, _ in self.cells]
+        rows = [row for _, row in self.cells]
+        self.bounds = (min(columns), max(columns), min(rows), max(rows))
+
+    def cell_of(self, x: float, y: float):
+        return floor(x / self.cell_size), floor(y / self.cell_size)
+
+    def ring(self, column: int, row: int, radius: int):
+        """
+        Yields the occupied cells at Chebyshev distance radius around the cell.
+        """
+        if radius == 0:
+            cell = self.cells.get((column, row))
+            if cell is not None:
+                yield cell
+            return
+
+        min_column, max_column, min_row, max_row = self.bounds
+        for current in range(max(column - radius, min_column), min(column + radius, max_column) + 1):
+            for current_row in (row - radius, row + radius):
+                cell = self.cells.get((current, current_row))
+                if cell is not None:
+                    yield cell
+        for current_row in range(max(row - radius + 1, min_row), min(row + radius - 1, max_row) + 1):
+            for current in (column - radius, column + radius):
+                cell = self.cells.get((current, current_row))
+                if cell is not None:
+                    yield cell
+
+    def nearest(self, x: float, y: float, k: int):
+        """
+        Finds the k nearest points.
+
+        Returns:
+        list: The indices of the points, nearest first
+        list: Their distances
+        """
+        k = min(k, len(self.points))
+        column, row = self.cell_of(x, y)
+        min_column, max_column, min_row, max_row = self.bounds
+        # Rings which do not reach any occupied cell are skipped, so far away queries cost the same as near ones
+        radius = max(0, min_column - column, column - max_column, min_row - row, row - max_row)
+        last_radius = max(column - min_column, max_column - column, row - min_row, max_row - row)
+
+        candidates = []
+        while True:
+            for cell in self.ring(column, row, radius):
+                for index in cell:
+                    candidates.append((hypot(self.points[index, 0] - x, self.points[index, 1] - y), index))
+            # Points in the cells not searched yet are at least radius cells away
+            if len(candidates) >= k:
+                candidates.sort()
+                if candidates[k - 1][0] <= radius * self.cell_size or radius >= last_radius:
+                    break
+            radius += 1
+
+        nearest = candidates[:k]
+        return [index for _, index in nearest], [distance for distance, _ in nearest]
+
+class WeightCache:
+    """
+    Blend weights by cell corner with LRU eviction. It is shared by the views of an environment for other directions
+    (see SpatialEnvironment.for_direction), which may be used from several threads.
+    """
+
+    def __init__(self, max_entries: int = WEIGHT_CACHE_SIZE):
+        self.entries = OrderedDict() # (cell east, cell north) -> (station indices, weights)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cell: tuple):
+        with self.lock:
+            cached = self.entries.get(cell)
+            if cached is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(cell)
+            return cached
+
+    def put(self, cell: tuple, weights: tuple):
+        with self.lock:
+            self.entries[cell] = weights
+            self.entries.move_to_end(cell)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+class SpatialEnvironment(Environment):
+    """
+    Atmosphere blended from many geolocated Meteo A. At every point the nearest stations are found in a uniform grid
+    and their conditions are blended by inverse distance weighting. The weights are cached at the corners of cells of
+    WEIGHT_RESOLUTION m and interpolated bilinearly in between, so the conditions change continuously along the
+    trajectory and a lookup costs a few profile evaluations independent of the number of stations.
+
+    The positions of the simulator are in the frame of the shot (x along the direction of fire, z to the right), the
+    direction of fire is needed to place them on the map. Batches with several directions pass them per point to
+    get_conditions_points, single shots in another direction use for_direction.
+    """
+
+    def __init__(self, temp0: float, pressure0: float, height0: float, stations: list, direction: float, k: int = 4,
+                 power: float = 2, resolution: float = WEIGHT_RESOLUTION):
+        """
+        Parameters:
+        temp0, pressure0, height0 (float): The ground data, see Environment
+        stations (list): The Station objects
+        direction (float): Direction of fire in Azimute, the same as the one of the projectile
+        k (int): Number of stations blended at every point, at least 1
+        power (float): Exponent of the inverse distance weights
+        resolution (float): Distance between the points at which the weights are calculated in m
+        """
+        if k < 1:
+            raise ValueError("At least one station must be blended, got k = " + str(k))
+        super().__init__(temp0, pressure0, height0, None)
+        self.stations = stations
+        self.direction = direction
+        self.k = k
+        self.power = power
+        self.resolution = resolution
+        self.profiles = [AtmosphereProfile(temp0, pressure0, height0, station.meteo_a) for station in stations]
+        self.grid = UniformGrid([(station.east, station.north) for station in stations])
+        angle = direction * (2 * pi / 6400)
+        self.sin_direction = sin(angle)
+        self.cos_direction = cos(angle)
+        self.weight_cache = WeightCache()
+
+    def for_direction(self, direction: float):
+        """
+        Returns:
+        SpatialEnvironment: The environment for shots in the given direction of fire, sharing the stations and the
+                            cached weights with this one
+        """
+        if direction == self.direction:
+            return self
+        environment = SpatialEnvironment.__new__(SpatialEnvironment)
+        # Methods patched on this instance (see Instrumentation.attach) are bound to it and are not taken over
+        environment.__dict__.update({name: value for name, value in vars(self).items() if not callable(value)})
+        environment.direction = direction
+        angle = direction * (2 * pi / 6400)
+        environment.sin_direction = sin(angle)
+        environment.cos_direction = cos(angle)
+        return environment
+
+    def to_map(self, x, z, directions=None):
+        """
+        Parameters:
+        x, z: Position in the frame of the shot, floats or arrays
+        directions (np.ndarray): Direction of fire per position in Azimute, None for the direction of the environment
+
+        Returns:
+        The east and north coordinates of the position, floats or arrays
+        """
+        if directions is None:
+            sin_direction, cos_direction = self.sin_direction, self.cos_direction
+        else:
+            angles = np.asarray(directions) * (2 * pi / 6400)
+            sin_direction, cos_direction = np.sin(angles), np.cos(angles)
+        return x * sin_direction + z * cos_direction, x * cos_direction - z * sin_direction
+
+    def weights(self, cell: tuple):
+        """
+        Returns:
+        tuple: The indices of the stations blended at the corner (east, north) * resolution of the cells and their
+               normalized weights
+        """
+        cached = self.weight_cache.get(cell)
+        if cached is not None:
+            return cached
+
+        indices, distances = self.grid.nearest(cell[0] * self.resolution, cell[1] * self.resolution, self.k)
+        if distances[0] < 1e-6:
+            cached = ((indices[0],), (1.0,))
+        else:
+            weights = [distance ** -self.power for distance in distances]
+            total = sum(weights)
+            cached = (tuple(indices), tuple(weight / total for weight in weights))
+
+        self.weight_cache.put(cell, cached)
+        return cached
+
+    def blend(self, east: float, north: float):
+        """
+        Returns:
+        dict: Index of the station -> weight at the point, interpolated bilinearly between the corners of its cell
+        """
+        column = floor(east / self.resolution)
+        row = floor(north / self.resolution)
+        fraction_east = east / self.resolution - column
+        fraction_north = north / self.resolution - row
+        blend = {}
+        for corner, share in (((column, row), (1 - fraction_east) * (1 - fraction_north)),
+                              ((column + 1, row), fraction_east * (1 - fraction_north)),
+                              ((column, row + 1), (1 - fraction_east) * fraction_north),
+                              ((column + 1, row + 1), fraction_east * fraction_north)):
+            if share == 0:
+                continue
+            indices, weights = self.weights(corner)
+            for index, weight in zip(indices, weights):
+                blend[index] = blend.get(index, 0.0) + share * weight
+        return blend
+
+    def get_conditions(self, point: Point):
+        blend = self.blend(*self.to_map(point.x, point.z))
+        if len(blend) == 1:
+            return self.profiles[next(iter(blend))].at(point.y)
+
+        density = pressure = temperature = speed_of_sound = wind_east = wind_north = 0.0
+        for index, weight in blend.items():
+            conditions = self.profiles[index].at(point.y)
+            density += weight * conditions.density
+            pressure += weight * conditions.pressure
+            temperature += weight * conditions.temperature
+            speed_of_sound += weight * conditions.speed_of_sound
+            # The wind is blended as a vector, averaging directions would turn wind from 6300 and 100 into 3200
+            angle = conditions.wind_direction * (2 * pi / 6400)
+            wind_east += weight * conditions.wind_velocity * sin(angle)
+            wind_north += weight * conditions.wind_velocity * cos(angle)
+
+        wind_direction = (atan2(wind_east, wind_north) * (6400 / (2 * pi))) % 6400
+        return AtmosphericConditions(density, pressure, temperature, speed_of_sound, wind_direction, hypot(wind_east, wind_north))
+
+    def get_conditions_points(self, points: np.ndarray, directions: np.ndarray = None):
+        east, north = self.to_map(points[:, 0], points[:, 2], directions)
+        columns = np.floor(east / self.resolution)
+        rows = np.floor(north / self.resolution)
+        fraction_east = east / self.resolution - columns
+        fraction_north = north / self.resolution - rows
+        corners = [
+            (0, 0, (1 - fraction_east) * (1 - fraction_north)),
+            (1, 0, fraction_east * (1 - fraction_north)),
+            (0, 1, (1 - fraction_east) * fraction_north),
+            (1, 1, fraction_east * fraction_north),
+        ]
+        cells = np.concatenate([np.stack((columns + column, rows + row), axis=1) for column, row, _ in corners]).astype(int)
+        unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.reshape(len(corners), len(points))
+
+        # Weight matrix of the points over the stations used by any of them
+        blends = [self.weights((int(column), int(row))) for column, row in unique_cells]
+        used = sorted({index for indices, _ in blends for index in indices})
+        position = {index: column for column, index in enumerate(used)}
+        cell_weights = np.zeros((len(blends), len(used)))
+        for row, (indices, weights) in enumerate(blends):
+            for index, weight in zip(indices, weights):
+                cell_weights[row, position[index]] = weight
+        if len(used) == 1:
+            point_weights = np.ones((len(points), 1))
+        else:
+            point_weights = sum(share[:, np.newaxis] * cell_weights[inverse[corner]] for corner, (_, _, share) in enumerate(corners))
+
+        heights = points[:, 1]
+        density = np.zeros(len(points))
+        pressure = np.zeros(len(points))
+        temperature = np.zeros(len(points))
+        speed_of_sound = np.zeros(len(points))
+        wind_east = np.zeros(len(points))
+        wind_north = np.zeros(len(points))
+        for column, index in enumerate(used):
+            weight = point_weights[:, column]
+            blended = weight > 0
+            weight = weight[blended]
+            conditions = self.profiles[index].at_batch(heights[blended])
+            density[blended] += weight * conditions.density
+            pressure[blended] += weight * conditions.pressure
+            temperature[blended] += weight * conditions.temperature
+            speed_of_sound[blended] += weight * conditions.speed_of_sound
+            angle = conditions.wind_direction * (2 * pi / 6400)
+            wind_east[blended] += weight * conditions.wind_velocity * np.sin(angle)
+            wind_north[blended] += weight * conditions.wind_velocity * np.cos(angle)
+
+        wind_direction = (np.arctan2(wind_east, wind_north) * (6400 / (2 * pi))) % 6400
+        return AtmosphericConditions(density, pressure, temperature, speed_of_sound, wind_direction, np.hypot(wind_east, wind_north))
+
+    def get_linear_interpolation_at(self, height: float):
+        raise TypeError("A spatial environment has no single Meteo A, its conditions depend on the position, use get_conditions")
+
+    def fingerprint(self):
+        stations = []
+        for station in self.stations:
+            meteo_hash = getattr(station.meteo_a, "content_hash", None)
+            if meteo_hash is None:
+                return None
+            stations.append((float(station.east) + 0.0, float(station.north) + 0.0, meteo_hash))
+        numbers = (self.temp0, self.pressure0, self.height0, self.direction, self.k, self.power, self.resolution)
+        return ("spatial",) + tuple(float(number) + 0.0 for number in numbers) + (tuple(stations),)
+
+    def stats(self):
+        cache = self.weight_cache
+        lookups = cache.hits + cache.misses
+        return {
+            "stations": len(self.stations),
+            "cached_cells": len(cache),
+            "weight_hits": cache.hits,
+            "weight_misses": cache.misses,
+            "hit_rate": cache.hits / lookups if lookups else 0,
+        }
@@ -0,0 +1,22 @@
+import pytest
+from environment import Environment
+from meteo_a import MeteoA
+
+ROWS = [
+    ["HOEHE", "THERMO", "WINDAZI", "WINDGES", "QUERSUM"],
+    ["500", "12.7", "//", "//", "15"],
+    ["1100", "8.9", "11", "15", "27"],
+    ["1100", "8.9", "11", "15", "27"],
+    ["1500", "5.0", "13", "21", "18"],
+]
+
+def test_duplicate_height_is_a_validation_error():
+    meteo_a = MeteoA(ROWS)
+    assert meteo_a.error == "Duplicate height: 1100.0"
+    with pytest.raises(ValueError):
+        Environment(21.5, 944, 691, meteo_a)
+
+def test_distinct_heights_compile():
+    meteo_a = MeteoA(ROWS[:3] + ROWS[4:])
+    assert not hasattr(meteo_a, "error")
+    assert Environment(21.5, 944, 691, meteo_a).profile.at(1300).temperature > 0
@@ -0,0 +1,20 @@
+import time
+from background import CalculationJob, CalculationWorker
+from environment import Environment
+from projectile import Projectile
+from result_cache import TrajectoryCache
+from simulator import Simulator
+
+def test_dense_trajectories_do_not_replace_integrated_ones():
+    cache = TrajectoryCache()
+    worker = CalculationWorker(cache)
+    simulator = Simulator(Environment(21.5, 944, 691, None), Projectile(0.077, 42, 0), "rk45")
+    job = CalculationJob(simulator, 816, 45, 0.1)
+    worker.submit(job)
+    deadline = time.monotonic() + 30
+    while not any(event[0] == "done" for event in worker.poll()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    trajectory = cache.calculate(simulator, 816, 45, 0.1)
+    assert len(trajectory) == len(simulator.calculate(816, 45, 0.1))
+    assert len(job.trajectory) > len(trajectory)
@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pytest
+from drag import DragTable
+from environment import Environment
+from meteo_a import load_meteo_a
+from projectile import Projectile
+from simulator import Simulator, BATCH_MIN_SHOTS
+
+METEO_A = load_meteo_a(os.path.join(os.path.dirname(__file__), "..", "docs", "meteo_a.csv"))
+SHOTS = 2 * BATCH_MIN_SHOTS
+V0S = np.linspace(300, 900, SHOTS)
+ELEVATIONS = np.linspace(5, 70, SHOTS)
+DIRECTIONS = np.linspace(0, 6000, SHOTS)
+LIGHT = Projectile(0.06, 20, 0, DragTable("light", [0, 0.9, 1.1, 3], [0.2, 0.25, 0.45, 0.2], "pchip"))
+
+def scalar(environment, projectile, v0, elevation, direction):
+    projectile = Projectile(projectile.radius, projectile.mass, direction, projectile.drag_table, projectile.axial_drag_coefficient,
+                            projectile.axial_cross_sectional_area)
+    return Simulator(environment, projectile).calculate(v0, elevation, 0.1)
+
+def assert_same(trajectory, expected):
+    assert len(trajectory) == len(expected)
+    np.testing.assert_allclose(trajectory.data, expected.data, rtol=1e-9, atol=1e-6)
+
+@pytest.mark.parametrize("meteo_a", [None, METEO_A])
+@pytest.mark.parametrize("shots", [SHOTS, BATCH_MIN_SHOTS - 1])
+def test_batch_matches_calculate(meteo_a, shots):
+    environment = Environment(21.5, 944, 691, meteo_a)
+    projectile = Projectile(0.077, 42, 0)
+    trajectories = Simulator(environment, projectile).calculate_batch(V0S[:shots], ELEVATIONS[:shots], DIRECTIONS[:shots], 0.1)
+    assert len(trajectories) == shots
+    for shot, trajectory in enumerate(trajectories):
+        assert_same(trajectory, scalar(environment, projectile, V0S[shot], ELEVATIONS[shot], DIRECTIONS[shot]))
+
+@pytest.mark.parametrize("meteo_a", [None, METEO_A])
+def test_mixed_batch_matches_calculate(meteo_a):
+    environment = Environment(21.5, 944, 691, meteo_a)
+    projectiles = [LIGHT if shot % 3 == 0 else "standard" for shot in range(SHOTS)]
+    trajectories = Simulator(environment, Projectile(0.077, 42, 0)).calculate_batch(V0S, ELEVATIONS, DIRECTIONS, 0.1, projectiles)
+    for shot, trajectory in enumerate(trajectories):
+        projectile = LIGHT if shot % 3 == 0 else Projectile.from_type("standard", 0)
+        assert_same(trajectory, scalar(environment, projectile, V0S[shot], ELEVATIONS[shot], DIRECTIONS[shot]))
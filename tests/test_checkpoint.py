@@ -0,0 +1,65 @@
+import csv
+import os
+from math import inf
+import numpy as np
+import pytest
+from checkpoint import CheckpointCache
+from environment import Environment
+from instrumentation import Instrumentation
+from meteo_a import MeteoA
+from projectile import Projectile
+from simulator import Simulator, INTEGRATORS
+
+with open(os.path.join(os.path.dirname(__file__), "..", "docs", "meteo_a.csv")) as file:
+    ROWS = [row for row in csv.reader(file)]
+
+def meteo_a(replacements: dict = None):
+    """
+    Returns:
+    MeteoA: The example Meteo A with the rows of the given heights replaced
+    """
+    replacements = replacements or {}
+    return MeteoA([replacements.get(row[0], row) for row in ROWS])
+
+def simulator(integrator, meteo, direction):
+    return Simulator(Environment(21.5, 944, 691, meteo), Projectile(0.077, 42, direction), integrator)
+
+def assert_resumed_exactly(cache, integrator, meteo, direction):
+    expected = simulator(integrator, meteo, direction).calculate(700, 45, 0.1)
+    trajectory = cache.calculate(simulator(integrator, meteo, direction), 700, 45, 0.1)
+    np.testing.assert_array_equal(trajectory.data, expected.data)
+
+@pytest.mark.parametrize("integrator", INTEGRATORS)
+@pytest.mark.parametrize("height, row", [
+    ("11800", ["11800", "-49.3", "18", "35", "43"]), # Above the apex, the whole trajectory is reused
+    ("6600", ["6600", "-25.6", "15", "34", "38"]), # Crossed by the trajectory
+])
+def test_resume_after_meteo_a_change(integrator, height, row):
+    cache = CheckpointCache(every=4)
+    cache.calculate(simulator(integrator, meteo_a(), 0), 700, 45, 0.1)
+    assert_resumed_exactly(cache, integrator, meteo_a({height: row}), 0)
+    assert cache.stats()["resumed"] == 1
+    assert cache.saved_steps > 0
+
+@pytest.mark.parametrize("integrator", INTEGRATORS)
+@pytest.mark.parametrize("meteo, resumes", [(None, True), (meteo_a(), False)])
+def test_resume_after_direction_change(integrator, meteo, resumes):
+    cache = CheckpointCache(every=4)
+    cache.calculate(simulator(integrator, meteo, 0), 700, 45, 0.1)
+    assert_resumed_exactly(cache, integrator, meteo, 1600)
+    assert cache.stats()["resumed"] == (1 if resumes else 0)
+
+def test_environment_is_not_modified():
+    environment = Environment(21.5, 944, 691, meteo_a())
+    CheckpointCache().calculate(Simulator(environment, Projectile(0.077, 42, 0), "rk4"), 700, 45, 0.1)
+    assert "get_conditions" not in vars(environment)
+
+def test_resume_with_instrumented_simulator():
+    cache = CheckpointCache(every=4)
+    instrumented = simulator("rk4", meteo_a(), 0)
+    with Instrumentation().attach(instrumented):
+        cache.calculate(instrumented, 700, 45, 0.1)
+    assert all(checkpoint.max_height > -inf for checkpoint in next(iter(cache.records.values())).checkpoints)
+    changed = meteo_a({"11800": ["11800", "-49.3", "18", "35", "43"]})
+    assert_resumed_exactly(cache, "rk4", changed, 0)
+    assert cache.stats()["resumed"] == 1
@@ -0,0 +1,27 @@
+import io
+from cli import read_missions, run_mission
+
+MISSION = '{"v0": 816, "elevation": 45, "temp0": 21.5, "pressure0": 944, "height0": 691}'
+
+def test_malformed_lines_become_error_rows():
+    file = io.StringIO("\n".join([MISSION, '{"v0": 816,', "", "[1, 2]", MISSION]) + "\n")
+    missions = list(read_missions(file, "jsonl", "."))
+    assert len(missions) == 4
+    assert "Line 2" in missions[1]["error"]
+    assert "Line 4" in missions[2]["error"]
+    results = [run_mission(mission, "euler", 0.1) for mission in missions]
+    assert [("error" in result) for result in results] == [False, True, True, False]
+
+def test_non_scalar_fields_are_reported():
+    for mission in ({"v0": [1], "elevation": 45, "temp0": 21.5, "pressure0": 944, "height0": 691},
+                    {"v0": 816, "elevation": 45, "temp0": 21.5, "pressure0": 944, "height0": 691, "meteo": 5}):
+        assert "error" in run_mission(mission, "euler", 0.1)
+
+def test_csv_rows_with_extra_cells_become_error_rows():
+    header = "v0,elevation,temp0,pressure0,height0"
+    file = io.StringIO("\n".join([header, "816,45,21.5,944,691", "816,45,21.5,944,691,7", "700,45,21.5,944,691"]) + "\n")
+    missions = list(read_missions(file, "csv", "."))
+    assert len(missions) == 3
+    assert missions[1]["error"] == "Line 3: 1 more cells than the header"
+    results = [run_mission(mission, "euler", 0.1) for mission in missions]
+    assert [("error" in result) for result in results] == [False, True, False]
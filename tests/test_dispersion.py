@@ -0,0 +1,23 @@
+import os
+from dispersion import Perturbations, run_ensemble
+from meteo_a import load_meteo_a
+
+METEO_A = load_meteo_a(os.path.join(os.path.dirname(__file__), "..", "docs", "meteo_a.csv"))
+PERTURBATIONS = Perturbations(v0=2, mass=0.2, temp0=1, pressure0=2, meteo_temperature=1, meteo_wind_direction=1,
+                              meteo_wind_velocity=1)
+
+def ensemble(workers):
+    return run_ensemble(700, 45, 21.5, 944, 691, 0, METEO_A, PERTURBATIONS, 40, seed=7, workers=workers, chunk_size=8,
+                        integrator="euler", delta_t=0.1)
+
+def test_result_does_not_depend_on_workers():
+    sequential = ensemble(1)
+    parallel = ensemble(2)
+    assert sequential.count == parallel.count == 40
+    assert sequential.to_dict() == parallel.to_dict()
+    assert sequential.to_dict()["probable_error_range"] > 0
+
+def test_result_depends_on_seed():
+    other = run_ensemble(700, 45, 21.5, 944, 691, 0, METEO_A, PERTURBATIONS, 40, seed=8, workers=1, chunk_size=8,
+                         integrator="euler", delta_t=0.1)
+    assert other.to_dict() != ensemble(1).to_dict()
@@ -0,0 +1,15 @@
+from environment import Environment
+from export import FiringTable, main, read_header
+from projectile import Projectile
+from simulator import Simulator
+
+def test_firing_table_records_and_uses_integrator(tmp_path):
+    path = str(tmp_path / "table.bin")
+    assert main(["firing-table", "-o", path, "--v0", "500", "816", "--elevations", "30", "60", "15", "--temp0", "21.5",
+                 "--pressure0", "944", "--height0", "691"]) == 0
+    attributes = read_header(path)["attributes"]
+    assert (attributes["integrator"], attributes["tolerance"], attributes["delta_t"]) == ("rk45", 1e-3, 0.1)
+
+    simulator = Simulator(Environment(21.5, 944, 691, None), Projectile(0.077, 42, 0), "rk45")
+    expected = simulator.calculate(816, 45, 0.1).impact.point.x
+    assert FiringTable(path).value("range", 816, 45) == expected
@@ -0,0 +1,55 @@
+import os
+import numpy as np
+import pytest
+from environment import Environment
+from instrumentation import Instrumentation
+from meteo_a import load_meteo_a
+from projectile import Projectile
+from simulator import Simulator
+from spatial import SpatialEnvironment, Station
+
+METEO_A = load_meteo_a(os.path.join(os.path.dirname(__file__), "..", "docs", "meteo_a.csv"))
+
+
+def test_counts_atmosphere_of_spatial_environment():
+    spatial = SpatialEnvironment(21.5, 944, 691, [Station(0, 0, None), Station(5000, 5000, None)], 0)
+    simulator = Simulator(spatial, Projectile(0.077, 42, 0))
+    instrumentation = Instrumentation()
+    with instrumentation.attach(simulator):
+        simulator.calculate(500, 45, 0.1)
+        simulator.calculate_batch(500, list(range(20, 40)), None, 0.1)
+    counters = instrumentation.to_dict()["counters"]
+    assert counters["environment_lookups"] > 0
+    assert counters["atmosphere_evaluations"] >= counters["environment_lookups"]
+    assert counters["batch_atmosphere_evaluations"] >= counters["batch_environment_lookups"] > 0
+    assert all("at" not in vars(profile) for profile in spatial.profiles)
+
+def test_counts_atmosphere_of_plain_environment():
+    simulator = Simulator(Environment(21.5, 944, 691, None), Projectile(0.077, 42, 0))
+    instrumentation = Instrumentation()
+    with instrumentation.attach(simulator):
+        simulator.calculate(500, 45, 0.1)
+    counters = instrumentation.to_dict()["counters"]
+    assert counters["atmosphere_evaluations"] == counters["environment_lookups"] > 0
+
+@pytest.mark.parametrize("spatial", [False, True])
+def test_small_batches_are_counted_and_unchanged(spatial):
+    if spatial:
+        environment = SpatialEnvironment(21.5, 944, 691, [Station(0, 0, METEO_A), Station(5000, 5000, None)], 0)
+    else:
+        environment = Environment(21.5, 944, 691, METEO_A)
+    simulator = Simulator(environment, Projectile(0.077, 42, 0))
+    directions = [0, 1600, 3200]
+    expected = simulator.calculate_batch(700, 45, directions, 0.1)
+
+    instrumentation = Instrumentation()
+    with instrumentation.attach(simulator):
+        trajectories = simulator.calculate_batch(700, 45, directions, 0.1)
+    for trajectory, reference in zip(trajectories, expected):
+        np.testing.assert_array_equal(trajectory.data, reference.data)
+
+    counters = instrumentation.to_dict()["counters"]
+    assert instrumentation.steps_per_trajectory == [len(trajectory) - 1 for trajectory in trajectories]
+    assert counters["euler_steps"] == counters["drag_evaluations"] > sum(len(trajectory) for trajectory in trajectories) - 10
+    assert counters["atmosphere_evaluations"] >= counters["environment_lookups"] == counters["euler_steps"]
+    assert "get_conditions" not in vars(environment)
@@ -0,0 +1,20 @@
+import csv
+import os
+from meteo_cache import MeteoCache
+
+with open(os.path.join(os.path.dirname(__file__), "..", "docs", "meteo_a.csv")) as file:
+    ROWS = [row for row in csv.reader(file)]
+
+def test_incremental_parsing_after_restart(tmp_path):
+    first = MeteoCache(directory=str(tmp_path)).get(ROWS, "station")
+
+    restarted = MeteoCache(directory=str(tmp_path))
+    restored = restarted.get(ROWS, "station")
+    assert restarted.stats()["disk_hits"] == 1
+    assert set(restored.rows) == set(first.rows)
+
+    changed = [row if row[0] != "6600" else ["6600", "-25.6", "15", "34", "38"] for row in ROWS]
+    meteo_a = restarted.get(changed, "station")
+    assert restarted.stats()["parsed_rows"] == 1
+    assert restarted.stats()["reused_rows"] == len(ROWS) - 2
+    assert [m.temperature for m in meteo_a.measurements if m.height == 6600] == [-25.6]
@@ -0,0 +1,34 @@
+import pytest
+from dispersion import Perturbations, run_ensemble
+from drag import DragTable, ProjectileType, register_projectile_type
+from environment import Environment
+from projectile import Projectile, ProjectileMix
+from sensitivity import impact_jacobian
+from simulator import Simulator
+
+LIGHT = ProjectileType("test-light", 0.06, 20, DragTable("test-light", [0, 0.9, 1.1, 3], [0.2, 0.25, 0.45, 0.2], "pchip"))
+register_projectile_type(LIGHT)
+
+def test_mix_fingerprint_distinguishes_types():
+    standard = Projectile.from_type("standard", 0)
+    light = Projectile.from_type("test-light", 0)
+    assert ProjectileMix([standard, light]).fingerprint() != ProjectileMix([standard, standard]).fingerprint()
+    assert ProjectileMix([standard, light]).fingerprint() == ProjectileMix([standard, light]).fingerprint()
+
+def test_sensitivity_uses_projectile_type():
+    sensitivity = impact_jacobian(500, 45, 21.5, 944, 691, 0, projectile="test-light", workers=1)
+    simulator = Simulator(Environment(21.5, 944, 691, None), Projectile.from_type("test-light", 0), "rk4", 1e-6)
+    assert sensitivity.nominal[0] == simulator.impact(500, 45, 0.05).point.x
+
+def test_dispersion_uses_projectile_type():
+    statistics = run_ensemble(500, 45, 21.5, 944, 691, 0, None, Perturbations(), 4, workers=1, projectile="test-light")
+    simulator = Simulator(Environment(21.5, 944, 691, None), Projectile.from_type("test-light", 0), "rk45")
+    assert statistics.range_percentiles()[50] == simulator.impact(500, 45, 0.1).point.x
+
+def test_mix_cannot_be_simulated_shot_by_shot():
+    mix = ProjectileMix([Projectile.from_type("standard", 0), Projectile.from_type("test-light", 0)])
+    simulator = Simulator(Environment(21.5, 944, 691, None), mix)
+    with pytest.raises(TypeError):
+        simulator.calculate(500, 45, 0.1)
+    with pytest.raises(TypeError):
+        simulator.impact(500, 45, 0.1)
@@ -0,0 +1,56 @@
+import csv
+import os
+import numpy as np
+from environment import Environment
+from meteo_a import MeteoA
+from projectile import Projectile
+from result_cache import TrajectoryCache
+from simulator import Simulator
+
+with open(os.path.join(os.path.dirname(__file__), "..", "docs", "meteo_a.csv")) as file:
+    ROWS = [row for row in csv.reader(file)]
+
+def simulator(integrator="euler", meteo_a=None):
+    return Simulator(Environment(21.5, 944, 691, meteo_a or MeteoA(ROWS)), Projectile(0.077, 42, 0), integrator)
+
+def test_evicts_least_recently_used_by_size():
+    shots = [(simulator(), v0, 45, 0.1) for v0 in (700, 701, 702)]
+    keys = [TrajectoryCache.key(*shot) for shot in shots]
+    sizes = [shot[0].calculate(*shot[1:]).data.nbytes for shot in shots]
+    cache = TrajectoryCache(max_bytes=sum(sizes) - 1)
+
+    cache.calculate(*shots[0])
+    cache.calculate(*shots[1])
+    cache.calculate(*shots[0])
+    cache.calculate(*shots[2])
+
+    assert list(cache.entries) == [keys[0], keys[2]]
+    assert cache.bytes == sizes[0] + sizes[2] <= cache.max_bytes
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+def test_stores_trajectories_on_disk(tmp_path):
+    shot = (simulator(), 700, 45, 0.1)
+    expected = TrajectoryCache(directory=str(tmp_path)).calculate(*shot)
+    assert [path.suffix for path in tmp_path.iterdir()] == [".npy"]
+
+    cache = TrajectoryCache(directory=str(tmp_path))
+    trajectory = cache.calculate(*shot)
+    np.testing.assert_array_equal(trajectory.data, expected.data)
+    assert not trajectory.data.flags.writeable
+    assert cache.stats()["disk_hits"] == 1 and cache.stats()["misses"] == 0
+
+def test_keys_separate_the_inputs():
+    key = TrajectoryCache.key(simulator(), 700, 45, 0.1)
+    changed_rows = {"6600": ["6600", "-25.6", "15", "34", "38"]}
+    changed = MeteoA([changed_rows.get(row[0], row) for row in ROWS])
+
+    assert TrajectoryCache.key(simulator(meteo_a=MeteoA(ROWS)), 700, 45, 0.1) == key
+    assert TrajectoryCache.key(simulator("rk4"), 700, 45, 0.1) != key
+    assert TrajectoryCache.key(simulator(), 700, 45, 0.05) != key
+    assert TrajectoryCache.key(simulator(meteo_a=changed), 700, 45, 0.1) != key
+
+def test_meteo_a_without_content_hash_is_not_cached():
+    meteo_a = MeteoA.from_measurements(MeteoA(ROWS).measurements)
+    cache = TrajectoryCache()
+    cache.calculate(simulator(meteo_a=meteo_a), 700, 45, 0.1)
+    assert len(cache.entries) == 0 and cache.stats()["uncacheable"] == 1
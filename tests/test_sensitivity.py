@@ -0,0 +1,28 @@
+import os
+import pytest
+from drag import DEFAULT_PROJECTILE, get_projectile_type
+from meteo_a import load_meteo_a
+from sensitivity import GROUND_INPUTS, METEO_FIELDS, OUTPUTS, impact_jacobian, meteo_parameter, simulate_impacts
+
+METEO_A = load_meteo_a(os.path.join(os.path.dirname(__file__), "..", "docs", "meteo_a.csv"))
+SHOT = (700, 45, 21.5, 944, 691, 0)
+
+@pytest.fixture(scope="module")
+def sensitivity():
+    return impact_jacobian(*SHOT, METEO_A, workers=1)
+
+def test_parameters_are_ordered(sensitivity):
+    meteo = [meteo_parameter(measurement.height, field) for measurement in METEO_A.measurements for field in METEO_FIELDS]
+    assert sensitivity.parameters == list(GROUND_INPUTS) + meteo
+    assert len(sensitivity.parameters) == len(GROUND_INPUTS) + 3 * len(METEO_A.measurements)
+    assert sensitivity.jacobian.shape == (len(OUTPUTS), len(sensitivity.parameters))
+
+@pytest.mark.parametrize("delta", [2, -2])
+def test_prediction_matches_simulation(sensitivity, delta):
+    predicted = sensitivity.predict({"v0": delta})
+    # Same integrator, step and tolerance as the defaults of impact_jacobian
+    simulated = simulate_impacts([(SHOT[0] + delta,) + SHOT[1:] + (METEO_A,)], get_projectile_type(DEFAULT_PROJECTILE), None, None, 0,
+                                 "rk4", 1e-6, 0.05)[0]
+    for output, value, nominal, tolerance in zip(OUTPUTS, simulated, sensitivity.nominal, (0.5, 0.05, 0.005)):
+        assert abs(value - nominal) > 10 * tolerance
+        assert predicted[output] == pytest.approx(value, abs=tolerance)
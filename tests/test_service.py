@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+from environment import Environment
+from projectile import Projectile
+from service import RequestCoalescer, TrajectoryService
+from simulator import Simulator
+
+def test_full_batch_cancels_the_window_timer():
+    async def run():
+        coalescer = RequestCoalescer(lambda key, items: [item * 2 for item in items], window=60, max_batch_size=2)
+        results = await asyncio.wait_for(asyncio.gather(coalescer.submit("key", 1), coalescer.submit("key", 2)), 5)
+        assert coalescer.timers == {}
+        return results
+
+    assert asyncio.run(run()) == [2, 4]
+
+@pytest.mark.parametrize("integrator", ["euler", "rk4", "rk45"])
+def test_compute_batch_reports_integrator(integrator):
+    service = TrajectoryService(integrator=integrator)
+    shots = [{"v0": 816, "elevation": 45, "direction": 0, "projectile": "standard"}] * 2
+    results = service.compute_batch((21.5, 944, 691, None), shots)
+    assert [result["integrator"] for result in results] == [integrator] * 2
+    assert results[0]["range"] == results[1]["range"]
+    simulator = Simulator(Environment(21.5, 944, 691, None), Projectile(0.077, 42, 0), integrator)
+    trajectory = simulator.calculate(816, 45, 0.1)
+    assert results[0]["range"] == trajectory.impact.point.x
+    assert results[0]["apex_height"] == trajectory.y.max()
+    assert results[0]["steps"] == len(trajectory) - 1
+
+def test_coalesced_requests_default_to_the_vectorized_integrator():
+    assert TrajectoryService().integrator == "euler"
+
+def test_unknown_integrator_is_rejected():
+    with pytest.raises(ValueError):
+        TrajectoryService(integrator="leapfrog")
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from environment import Environment
+from projectile import Projectile
+from simulator import Simulator
+
+ENVIRONMENT = Environment(21.5, 944, 691, None)
+
+def test_rk45_raises_on_non_finite_error():
+    simulator = Simulator(ENVIRONMENT, Projectile(0.077, float("nan"), 0), "rk45")
+    with pytest.raises(ValueError):
+        simulator.calculate(816, 45, 0.1)
+
+def test_rk45_raises_if_tolerance_cannot_be_reached():
+    simulator = Simulator(ENVIRONMENT, Projectile(0.077, 42, 0), "rk45", tolerance=0)
+    with pytest.raises(ValueError):
+        simulator.calculate(816, 45, 0.1)
+
+def test_dense_output_keeps_steps_and_fills_gaps():
+    simulator = Simulator(ENVIRONMENT, Projectile(0.077, 42, 0), "rk45")
+    steps = simulator.calculate(816, 45, 0.1)
+    dense = np.array([(t, point.x, point.y, point.z) for t, point, _ in simulator.iter_dense(816, 45, 0.1)])
+    assert len(dense) > 10 * len(steps)
+    assert np.diff(dense[:, 0]).max() <= 0.1 + 1e-9
+    times = list(dense[:, 0])
+    for state in steps.data.T:
+        np.testing.assert_array_equal(dense[times.index(state[0]), 1:], state[1:4])
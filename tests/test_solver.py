@@ -0,0 +1,44 @@
+import pytest
+from environment import Environment
+from projectile import Projectile
+from meteo_a import Measurement, MeteoA
+from solver import _table_cache, coarse_table, solve_elevation, solve_velocity
+
+ENVIRONMENT = Environment(21.5, 944, 691, None)
+PROJECTILE = Projectile(0.077, 42, 0)
+
+@pytest.mark.parametrize("target_range, target_height, high_angle", [
+    (10000, 691, False),
+    (10000, 691, True),
+    (10000, 700, False),
+    (20000, 1500, True),
+    (2000, 700, True),
+])
+def test_solve_elevation_hits_target(target_range, target_height, high_angle):
+    solution = solve_elevation(target_range, target_height, 816, ENVIRONMENT, PROJECTILE, high_angle=high_angle)
+    assert abs(solution.impact_range - target_range) <= 0.5
+
+def test_solve_elevation_raises_below_reachable_height():
+    # Low angles do not climb to the target height, the first elevation which does lands far beyond the target
+    with pytest.raises(ValueError):
+        solve_elevation(2000, 700, 816, ENVIRONMENT, PROJECTILE)
+
+def test_solve_velocity_hits_target():
+    solution = solve_velocity(5000, 691, 10, ENVIRONMENT, PROJECTILE, 100, 900)
+    assert abs(solution.impact_range - 5000) <= 0.5
+
+def test_atmospheres_without_fingerprint_are_not_cached():
+    ranges = []
+    for temperature in (-20, 30):
+        # A new object per atmosphere, possibly at the address of the previous one
+        meteo_a = MeteoA.from_measurements([Measurement(500, temperature, 0, 0), Measurement(5000, temperature - 30, 0, 0)])
+        environment = Environment(21.5, 944, 691, meteo_a)
+        assert environment.fingerprint() is None
+        entries = len(_table_cache)
+        table, cached = coarse_table(500, environment, PROJECTILE, 691)
+        assert not cached
+        assert len(_table_cache) == entries
+        assert not coarse_table(500, environment, PROJECTILE, 691)[1]
+        ranges.append(table[45])
+        del meteo_a, environment
+    assert ranges[0] != ranges[1]
@@ -0,0 +1,76 @@
+import os
+import threading
+import numpy as np
+import pytest
+from geometry import Point
+from meteo_a import load_meteo_a
+from projectile import Projectile
+from simulator import Simulator
+from spatial import SpatialEnvironment, Station
+
+METEO_A = load_meteo_a(os.path.join(os.path.dirname(__file__), "..", "docs", "meteo_a.csv"))
+STATIONS = [Station(0, 0, METEO_A), Station(8000, 3000, None), Station(-5000, 12000, METEO_A), Station(10000, 15000, None)]
+
+def environment(direction=0):
+    return SpatialEnvironment(21.5, 944, 691, STATIONS, direction, resolution=100)
+
+def test_conditions_are_continuous_between_cells():
+    spatial = environment()
+    for x in np.arange(1000, 3000, 50.0):
+        before = spatial.get_conditions(Point(x - 1e-3, 3000, 0))
+        after = spatial.get_conditions(Point(x + 1e-3, 3000, 0))
+        assert abs(before.temperature - after.temperature) < 1e-5
+        assert abs(before.wind_velocity - after.wind_velocity) < 1e-5
+
+def test_points_match_single_lookups_per_direction():
+    spatial = environment()
+    points = np.array([[1234.5, 2000, 10], [5678.9, 4000, -20], [9876.5, 1000, 5]])
+    directions = np.array([0, 1600, 4000])
+    conditions = spatial.get_conditions_points(points, directions)
+    for index, (x, y, z) in enumerate(points):
+        expected = spatial.for_direction(directions[index]).get_conditions(Point(x, y, z))
+        assert np.isclose(conditions.temperature[index], expected.temperature, rtol=1e-12)
+        assert np.isclose(conditions.density[index], expected.density, rtol=1e-12)
+        assert np.isclose(conditions.wind_velocity[index], expected.wind_velocity, rtol=1e-12)
+
+def test_batch_uses_direction_per_shot():
+    spatial = environment()
+    directions = np.linspace(0, 6000, 20)
+    trajectories = Simulator(spatial, Projectile(0.077, 42, 0)).calculate_batch(700, 45, directions, 0.1)
+    for direction, trajectory in zip(directions, trajectories):
+        expected = Simulator(spatial.for_direction(direction), Projectile(0.077, 42, direction)).calculate(700, 45, 0.1)
+        assert len(trajectory) == len(expected)
+        np.testing.assert_allclose(trajectory.data, expected.data, rtol=1e-9, atol=1e-6)
+
+def test_no_single_meteo_a():
+    with pytest.raises(TypeError):
+        environment().get_linear_interpolation_at(1000)
+
+def test_direction_views_share_weight_cache_and_statistics():
+    spatial = environment()
+    view = spatial.for_direction(1600)
+    view.get_conditions(Point(3000, 1000, 0))
+    spatial.get_conditions(Point(0, 1000, 3000)) # The same place on the map
+    assert spatial.stats() == view.stats()
+    assert spatial.stats()["weight_hits"] > 0
+
+def test_weight_cache_from_threads():
+    spatial = SpatialEnvironment(21.5, 944, 691, STATIONS, 0, resolution=10)
+    spatial.weight_cache.max_entries = 50
+
+    def lookups(direction):
+        view = spatial.for_direction(direction)
+        for x in range(0, 20000, 7):
+            view.get_conditions(Point(x, 1000, 0))
+
+    threads = [threading.Thread(target=lookups, args=(direction,)) for direction in (0, 800, 1600, 2400)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(spatial.weight_cache) <= 50
+    assert spatial.stats()["weight_hits"] + spatial.stats()["weight_misses"] > 0
+
+def test_at_least_one_station_is_blended():
+    with pytest.raises(ValueError):
+        SpatialEnvironment(21.5, 944, 691, STATIONS, 0, k=0)
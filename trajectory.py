@@ -0,0 +1,183 @@
+from geometry import Point, Velocity
+from math import atan2, sqrt, pi
+import numpy as np
+
+COLUMNS = ("t", "x", "y", "z", "vx", "vy", "vz")
+
+class Impact:
+    """
+    The final state of a trajectory.
+    """
+
+    def __init__(self, time_of_flight: float, point: Point, velocity: Velocity, reached: bool = True, apex_height: float = None,
+                 steps: int = None):
+        self.time_of_flight = time_of_flight
+        self.point = point
+        self.velocity = velocity
+        self.reached = reached # False if the trajectory ended before descending through the impact height
+        self.apex_height = apex_height # Highest height of the integrated states in m, if known
+        self.steps = steps # Number of integration steps, if known
+
+    @property
+    def terminal_velocity(self):
+        """
+        The speed at impact in m/s.
+        """
+        return sqrt(self.velocity.x ** 2 + self.velocity.y ** 2 + self.velocity.z ** 2)
+
+    @property
+    def angle_of_fall(self):
+        """
+        The angle between the velocity at impact and the horizontal plane in degrees.
+        """
+        return atan2(-self.velocity.y, sqrt(self.velocity.x ** 2 + self.velocity.z ** 2)) * 180 / pi
+
+    def __repr__(self):
+        return f"Impact(time_of_flight={self.time_of_flight}, point={self.point}, velocity={self.velocity})"
+
+class Trajectory:
+    """
+    Result of a simulation, stored column by column in a preallocated array which grows by doubling. The columns
+    t, x, y, z, vx, vy and vz are exposed as views without copying.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.data = np.empty((len(COLUMNS), max(capacity, 1)))
+        self.length = 0
+
+    @classmethod
+    def from_array(cls, data: np.ndarray):
+        """
+        Creates a trajectory from an existing array without copying.
+
+        Parameters:
+        data (np.ndarray): The states, shape (7, steps) with the rows ordered as in COLUMNS
+
+        Returns:
+        Trajectory: The trajectory
+        """
+        trajectory = cls.__new__(cls)
+        trajectory.data = data
+        trajectory.length = data.shape[1]
+        return trajectory
+
+    def append(self, t: float, point: Point, velocity: Velocity):
+        if self.length == self.data.shape[1]:
+            grown = np.empty((len(COLUMNS), 2 * self.length))
+            grown[:, :self.length] = self.data
+            self.data = grown
+
+        column = self.data[:, self.length]
+        column[0] = t
+        column[1] = point.x
+        column[2] = point.y
+        column[3] = point.z
+        column[4] = velocity.x
+        column[5] = velocity.y
+        column[6] = velocity.z
+        self.length += 1
+
+    def trim(self):
+        """
+        Releases the unused capacity.
+        """
+        self.data = self.data[:, :self.length].copy()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("Trajectory index out of range")
+        return Point(*self.data[1:4, index].tolist())
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self[index]
+
+    def column(self, name: str):
+        return self.data[COLUMNS.index(name), :self.length]
+
+    @property
+    def t(self):
+        return self.data[0, :self.length]
+
+    @property
+    def x(self):
+        return self.data[1, :self.length]
+
+    @property
+    def y(self):
+        return self.data[2, :self.length]
+
+    @property
+    def z(self):
+        return self.data[3, :self.length]
+
+    @property
+    def vx(self):
+        return self.data[4, :self.length]
+
+    @property
+    def vy(self):
+        return self.data[5, :self.length]
+
+    @property
+    def vz(self):
+        return self.data[6, :self.length]
+
+    @property
+    def points(self):
+        """
+        The positions as a view of shape (steps, 3).
+        """
+        return self.data[1:4, :self.length].T
+
+    @property
+    def velocities(self):
+        """
+        The velocities as a view of shape (steps, 3).
+        """
+        return self.data[4:7, :self.length].T
+
+    @property
+    def time_of_flight(self):
+        return float(self.data[0, self.length - 1])
+
+    @property
+    def apex(self):
+        """
+        The highest point of the trajectory.
+        """
+        return self[int(np.argmax(self.y))]
+
+    @property
+    def impact_point(self):
+        return self[-1]
+
+    @property
+    def impact_velocity(self):
+        return Velocity(*self.data[4:7, self.length - 1].tolist())
+
+    @property
+    def impact(self):
+        return Impact(self.time_of_flight, self.impact_point, self.impact_velocity)
+
+    @property
+    def terminal_velocity(self):
+        """
+        The speed at impact in m/s.
+        """
+        return self.impact.terminal_velocity
+
+    @property
+    def angle_of_fall(self):
+        """
+        The angle between the velocity at impact and the horizontal plane in degrees.
+        """
+        return self.impact.angle_of_fall
+
+    def __repr__(self):
+        return f"Trajectory(steps={self.length})"